@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Results of benchmark runs, saved to compare later runs with them."""
+import json
+
+# Results slower by more than this fraction are regressions
+TOLERANCE = 0.25
+# differences below this many seconds are noise of the timer and the
+# machine, even if they are above the tolerance
+FLOOR = 0.001
+
+
+def save(path, results):
+    """
+    Save the results of a run.
+
+    :param path: path of the JSON file
+    :param results: dict benchmark name -> seconds
+
+    """
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+
+
+def load(path):
+    """
+    Return the results of an earlier run.
+
+    :param path: path of the JSON file written by save()
+    :return: dict benchmark name -> seconds
+
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(old, new, tolerance=TOLERANCE, floor=FLOOR):
+    """
+    Return the benchmarks slower than before.
+
+    Benchmarks missing in one of the runs are ignored.
+
+    :param old: results of the earlier run
+    :param new: results of this run
+    :param tolerance: fraction a benchmark may be slower
+    :param floor: seconds a benchmark may be slower in any case
+    :return: list of tuples (name, old seconds, new seconds), sorted
+    by name
+
+    """
+    return [(name, old[name], new[name]) for name in sorted(new)
+            if name in old and new[name] > old[name] * (1 + tolerance)
+            and new[name] - old[name] >= floor]
+
+
+def report(old, new, tolerance=TOLERANCE, floor=FLOOR):
+    """
+    Print the regressions of a run.
+
+    :param old: results of the earlier run
+    :param new: results of this run
+    :param tolerance: fraction a benchmark may be slower
+    :param floor: seconds a benchmark may be slower in any case
+    :return: number of regressions
+
+    """
+    regressions = compare(old, new, tolerance, floor)
+    for name, before, after in regressions:
+        print("REGRESSION %-32s %10.3f ms -> %10.3f ms (%+.0f %%)" % (
+            name, before * 1000, after * 1000,
+            (after / before - 1) * 100 if before else float("inf")))
+    if not regressions:
+        print("No regressions above %d %% and %.3f ms" % (
+            tolerance * 100, floor * 1000))
+    return len(regressions)
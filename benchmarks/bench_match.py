@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark matching of spoken names.
+
+Indexes synthetic control names and matches spoken variants of them:
+umlauts spelled out, other word order, extra words and misheard words.
+
+Run from the repository root: python -m benchmarks.bench_match
+
+"""
+import random
+import time
+
+import loxmatch
+from benchmarks.synthetic import generate_names
+
+SIZES = [100, 1000, 10000]
+QUERIES = 200
+
+# Changes of the names as voice recognition produces them
+VARIANTS = [
+    lambda name: name,
+    lambda name: name.replace(u"\xfc", u"ue").replace(u"\xe4", u"ae"),
+    lambda name: u" ".join(reversed(name.split())),
+    lambda name: u"schalte das %s ein" % name,
+    lambda name: name.replace(u"zimmer", u"zimer"),
+]
+
+
+def spoken(names, seed=1):
+    """Return spoken variants of some of the names."""
+    rng = random.Random(seed)
+    return [rng.choice(VARIANTS)(rng.choice(names)) for _ in range(QUERIES)]
+
+
+def main():
+    """Print build time and time per match per number of names."""
+    print("%8s %10s %12s %12s %10s" % (
+        "names", "build ms", "match us", "max us", "found %"))
+    for size in SIZES:
+        names = generate_names(size)
+        start = time.time()
+        matcher = loxmatch.NameMatcher(enumerate(names))
+        build = time.time() - start
+
+        queries = spoken(names)
+        times = []
+        found = 0
+        for query in queries:
+            start = time.time()
+            keys = matcher.match(query)
+            times.append(time.time() - start)
+            found += bool(keys)
+        print("%8d %10.1f %12.1f %12.1f %10.1f" % (
+            size, build * 1000, sum(times) / len(times) * 1e6,
+            max(times) * 1e6, found * 100.0 / len(queries)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the neuron against a fake miniserver.
+
+Serves synthetic structure definitions of several sizes by the fake
+miniserver of the tests and measures loading, extracting and indexing
+the structure, loading it from a snapshot, the lookups and whole
+orders, cold and with a cached structure.
+
+Run from the repository root: python -m benchmarks.bench_neuron
+Save the results with --save results.json, and compare a later run
+with them by --compare results.json.
+
+"""
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import loxmodel
+import loxparser
+import loxsession
+import loxsnapshot
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from benchmarks import baseline
+from benchmarks.synthetic import SIZES, generate_structure
+
+# the fake miniserver of the tests serves the synthetic structures
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "tests"))
+from fakeminiserver import FakeMiniserver  # noqa: E402
+
+REPEAT = 3
+LOOKUPS = 200
+
+
+def best(function, repeat=REPEAT):
+    """Return the best time of calling function in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def per_call(function, items):
+    """Return the mean time of calling function per item in seconds."""
+    start = time.time()
+    for item in items:
+        function(item)
+    return (time.time() - start) / len(items)
+
+
+def bench_size(size, latency):
+    """
+    Run all benchmarks for one structure size.
+
+    :param size: number of controls
+    :param latency: latency of the fake miniserver in seconds
+    :return: dict benchmark name -> seconds
+
+    """
+    structure = generate_structure(size, names=True)
+    server = FakeMiniserver(structure, latency=latency)
+    parameters = {"lx_ip": server.host, "lx_user": server.user,
+                  "lx_password": server.password, "lx_cachedir": ""}
+    results = {}
+    try:
+        def clear():
+            LoxClient._structure_cache.clear()
+            loxsession.close_sessions()
+
+        # whole orders, without and with the cached structure
+        names = [control["name"] for control in
+                 structure["controls"].values()
+                 if control["type"] in ("Switch", "TimedSwitch")]
+        order = dict(parameters, action="change", newstate="on",
+                     control_name=names[0] if names else "Control 0")
+
+        def cold():
+            clear()
+            Loxscontrol(**order)
+        results["neuron_cold"] = best(cold)
+        results["neuron_warm"] = best(lambda: Loxscontrol(**order))
+
+        loxone = Loxscontrol(action="prewarm", **parameters).client
+
+        def load():
+            LoxClient._structure_cache.clear()
+            loxone.load_config()
+        results["load_config"] = best(load)
+
+        data = json.dumps(structure).encode('utf-8')
+        raw = loxparser.parse(io.BytesIO(data), LoxClient.TYPE_SUPPORTED)
+        results["parse"] = best(lambda: loxparser.parse(
+            io.BytesIO(data), LoxClient.TYPE_SUPPORTED))
+
+        results["extract_controls"] = best(
+            lambda: loxone.extract_controls(
+                raw['controls'], loxmodel.LoxModel.from_structure(raw)))
+        model = loxmodel.LoxModel.from_structure(raw)
+        loxone.extract_controls(raw['controls'], model)
+        results["build_indexes"] = best(model.build_indexes)
+
+        snapshot = os.path.join(tempfile.mkdtemp(), "structure.json")
+        try:
+            loxsnapshot.dump(snapshot, model, "benchmark")
+            results["load_snapshot"] = best(lambda: loxsnapshot.load(
+                snapshot))
+        finally:
+            shutil.rmtree(os.path.dirname(snapshot))
+
+        # lookups of the model loaded
+        rng = random.Random(1)
+        records = loxone._records
+        uuids = [rng.choice(records).uidaction for _ in range(LOOKUPS)]
+        spoken = [rng.choice(records).name.lower() for _ in range(LOOKUPS)]
+        rooms = [room['name'] for room in loxone._rooms.values()]
+        results["lookup_uuid"] = per_call(loxone.get_name_by_uuid, uuids)
+        results["lookup_name"] = per_call(loxone.get_controluuids_by_name,
+                                          spoken)
+        results["lookup_room_type"] = per_call(
+            lambda room: loxone.get_controluuids_by_room_and_type(
+                room, LoxClient.CAT_LIGTH),
+            [rng.choice(rooms) for _ in range(LOOKUPS)])
+        results["list_room_type"] = per_call(
+            lambda room: loxone.list_controls(room, LoxClient.CAT_LIGTH),
+            [rng.choice(rooms) for _ in range(LOOKUPS)])
+    finally:
+        LoxClient._structure_cache.clear()
+        loxsession.close_sessions()
+        server.stop()
+    return results
+
+
+def main(argv=None):
+    """Print the results per structure size, compare with a baseline."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the neuron against a fake miniserver")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES,
+                        help="numbers of controls")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latency of the fake miniserver in seconds")
+    parser.add_argument("--save", help="save the results to this file")
+    parser.add_argument("--compare",
+                        help="compare with the results saved in this file")
+    parser.add_argument("--tolerance", type=float,
+                        default=baseline.TOLERANCE,
+                        help="fraction a benchmark may be slower")
+    parser.add_argument("--floor", type=float, default=baseline.FLOOR,
+                        help="seconds a benchmark may be slower in any "
+                        "case")
+    args = parser.parse_args(argv)
+
+    results = {}
+    columns = None
+    for size in args.sizes:
+        timings = bench_size(size, args.latency)
+        if columns is None:
+            columns = sorted(timings)
+            print("%8s" % "controls" + "".join(
+                " %16s" % column for column in columns) + "   (ms)")
+        print("%8d" % size + "".join(
+            " %16.3f" % (timings[column] * 1000) for column in columns))
+        results.update(("%s/%d" % (name, size), seconds)
+                       for name, seconds in timings.items())
+
+    if args.save:
+        baseline.save(args.save, results)
+    if args.compare:
+        return 1 if baseline.report(baseline.load(args.compare), results,
+                                    args.tolerance, args.floor) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark parsing of large structure definitions.
+
+Compares decoding the full Loxapp3.json with json and pruning it
+afterwards against the single-pass streaming parser.
+
+Run from the repository root: python -m benchmarks.bench_parse
+
+"""
+import gc
+import io
+import json
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import loxparser
+from loxclient import LoxClient
+from benchmarks.synthetic import SIZES, generate_structure
+
+REPEAT = 3
+
+
+def measure(function, data):
+    """
+    Return the best time and the peak memory of parsing data.
+
+    :param function: parser called with a file-like object
+    :param data: encoded structure definition
+    :return: tuple (seconds, peak bytes or None)
+
+    """
+    best = None
+    for _ in range(REPEAT):
+        gc.collect()
+        start = time.time()
+        function(io.BytesIO(data))
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak = None
+    if tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        function(io.BytesIO(data))
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+
+def parse_json(fileobj):
+    """Decode the full document, then prune it."""
+    return loxparser.prune(json.loads(fileobj.read().decode('utf-8')),
+                           LoxClient.TYPE_SUPPORTED)
+
+
+def parse_stream(fileobj):
+    """Parse while reading."""
+    return loxparser.parse(fileobj, LoxClient.TYPE_SUPPORTED)
+
+
+def main():
+    """Print time and peak memory per structure size."""
+    print("%8s %10s %12s %12s %12s %12s" % (
+        "controls", "size kB", "json ms", "stream ms", "json kB",
+        "stream kB"))
+    for size in SIZES:
+        data = json.dumps(generate_structure(size)).encode('utf-8')
+        json_time, json_peak = measure(parse_json, data)
+        stream_time, stream_peak = measure(parse_stream, data)
+        print("%8d %10d %12.1f %12.1f %12s %12s" % (
+            size, len(data) // 1024, json_time * 1000, stream_time * 1000,
+            json_peak // 1024 if json_peak else "-",
+            stream_peak // 1024 if stream_peak else "-"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Generator for synthetic miniserver structure definitions.
+
+Write a structure definition to a file from the repository root:
+python -m benchmarks.synthetic 1000 Loxapp3.json
+
+"""
+import argparse
+import json
+import random
+
+# Control types of a typical installation and how often they occur
+CONTROL_TYPES = [("Switch", 20), ("TimedSwitch", 5), ("Jalousie", 15),
+                 ("LightController", 5), ("LightControllerV2", 5),
+                 ("Dimmer", 5), ("InfoOnlyAnalog", 20),
+                 ("IRoomController", 5), ("Pushbutton", 10),
+                 ("Meter", 10)]
+
+# Number of controls of the structures used by the benchmarks
+SIZES = [10, 100, 1000, 10000]
+
+
+def uuid(rng):
+    """Return a random Loxone uuid."""
+    return "%08x-%04x-%04x-%016x" % (rng.getrandbits(32),
+                                     rng.getrandbits(16),
+                                     rng.getrandbits(16),
+                                     rng.getrandbits(64))
+
+
+def generate_control(rng, ctype, room, cat, index, name=None):
+    """Return a control like the miniserver describes it."""
+    control = {"name": name or "Control %d" % index, "type": ctype,
+               "uuidAction": uuid(rng), "room": room, "cat": cat,
+               "defaultRating": 0, "isFavorite": False, "isSecured": False,
+               "details": {"format": "%.1f", "jLockable": True,
+                           "animation": rng.randint(0, 3),
+                           "text": {"on": "on", "off": "off"}},
+               "states": dict(("state%d" % i, uuid(rng))
+                              for i in range(6))}
+    if ctype in ("LightController", "LightControllerV2"):
+        control["subControls"] = {}
+        for i in range(4):
+            sub = uuid(rng)
+            control["subControls"][sub] = {
+                "name": "Circuit %d.%d" % (index, i),
+                "type": "Switch" if i % 2 else "Dimmer",
+                "uuidAction": sub, "defaultRating": 0,
+                "isFavorite": False, "isSecured": False,
+                "states": {"active": uuid(rng)}}
+    return control
+
+
+def generate_structure(controls, rooms=None, cats=None, seed=1,
+                       names=False):
+    """
+    Return a synthetic Loxapp3.json structure.
+
+    :param controls: number of controls
+    :param rooms: number of rooms, default one per 10 controls
+    :param cats: number of categories, default one per 50 controls
+    :param seed: seed of the random generator
+    :param names: use realistic names of generate_names instead of
+    "Control 1", "Control 2", ...
+    :return: dict like the decoded Loxapp3.json
+
+    """
+    rng = random.Random(seed)
+    rooms = rooms or max(1, controls // 10)
+    cats = cats or max(3, controls // 50)
+    types = [ctype for ctype, weight in CONTROL_TYPES for _ in range(weight)]
+    cattypes = ["lights", "shading", "undefined"]
+
+    structure = {"lastModified": "2017-03-12 10:11:12",
+                 "msInfo": {"serialNr": "504F94000000", "msName": "Home",
+                            "projectName": "Synthetic",
+                            "localUrl": "127.0.0.1",
+                            "languageCode": "ENG", "location": "Home",
+                            "roomTitle": "Room", "catTitle": "Category"},
+                 "weatherServer": {"states": dict(
+                     ("w%d" % i, uuid(rng)) for i in range(50))},
+                 "rooms": {}, "cats": {}, "controls": {}}
+    roomuuids = []
+    for i in range(rooms):
+        room = uuid(rng)
+        roomuuids.append(room)
+        structure["rooms"][room] = {"name": "Room %d" % i, "uuid": room,
+                                    "type": 0, "image": "00000000.svg",
+                                    "defaultRating": 0, "isFavorite": False}
+    catuuids = []
+    for i in range(cats):
+        cat = uuid(rng)
+        catuuids.append(cat)
+        structure["cats"][cat] = {"name": "Category %d" % i, "uuid": cat,
+                                  "type": cattypes[i % len(cattypes)],
+                                  "image": "00000000.svg", "color": "#FF0000",
+                                  "defaultRating": 0, "isFavorite": False}
+    controlnames = generate_names(controls, seed) if names else []
+    for i in range(controls):
+        control = generate_control(rng, rng.choice(types),
+                                   rng.choice(roomuuids),
+                                   rng.choice(catuuids), i,
+                                   controlnames[i] if names else None)
+        structure["controls"][control["uuidAction"]] = control
+    return structure
+
+
+# Words of control and room names of a typical German installation
+DEVICES = [u"Licht", u"Deckenlicht", u"Spot", u"Stehlampe", u"Steckdose",
+           u"Rollladen", u"Jalousie", u"Markise", u"L\xfcfter",
+           u"Heizung", u"Leselampe", u"Wandleuchte", u"Ventilator"]
+PLACES = [u"K\xfcche", u"Wohnzimmer", u"Schlafzimmer", u"Bad", u"Flur",
+          u"Arbeitszimmer", u"Kinderzimmer", u"Keller", u"Garage",
+          u"Terrasse", u"Esszimmer", u"G\xe4stezimmer", u"Dachboden"]
+DETAILS = [u"", u"links", u"rechts", u"oben", u"unten", u"Fenster",
+           u"T\xfcr", u"Arbeitsfl\xe4che", u"Eingang", u"Decke"]
+
+
+def generate_names(count, seed=1):
+    """
+    Return realistic names of control elements.
+
+    Names are combined from a device, a place, a detail and a number
+    if needed, so that all names are unique.
+
+    :param count: number of names
+    :param seed: seed of the random generator
+    :return: list of names
+
+    """
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < count:
+        words = [rng.choice(DEVICES), rng.choice(PLACES),
+                 rng.choice(DETAILS)]
+        name = u" ".join(word for word in words if word)
+        if name in seen:
+            name = u"%s %d" % (name, len(names))
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def main(argv=None):
+    """Write a synthetic structure definition to a file."""
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic Loxapp3.json")
+    parser.add_argument("controls", type=int, help="number of controls")
+    parser.add_argument("path", help="file written")
+    parser.add_argument("--rooms", type=int, help="number of rooms")
+    parser.add_argument("--cats", type=int, help="number of categories")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="seed of the random generator")
+    args = parser.parse_args(argv)
+    structure = generate_structure(args.controls, args.rooms, args.cats,
+                                   args.seed, names=True)
+    with open(args.path, 'w') as f:
+        json.dump(structure, f)
+
+
+if __name__ == '__main__':
+    main()
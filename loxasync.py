@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio API of the miniserver client.
+
+The calls of loxclient.LoxClient block on http requests. AsyncLoxClient
+runs them in a thread pool from coroutines, so that one event loop
+drives many miniserver operations at once:
+
+client = AsyncLoxClient(lx_ip="192.168.0.11", lx_user="admin",
+                        lx_password="secret")
+await client.connect()
+results = await asyncio.gather(
+    client.change_state(client.resolve("kitchen light")[0], "on"),
+    client.read_states(client.resolve(room="living room")))
+
+Needs Python 3.7 or later, the neuron doesn't use it.
+
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from loxclient import LoxClient
+
+
+class AsyncLoxClient(object):
+
+    """LoxClient with coroutine methods."""
+
+    def __init__(self, client=None, workers=None, **parameters):
+        """
+        Create a client, nothing is sent yet.
+
+        :param client: LoxClient used, created of the parameters if None
+        :param workers: max. number of calls running at once, default is
+        lx_poolsize per miniserver
+        :param parameters: lx_ parameters of LoxClient
+
+        """
+        if client is None:
+            client = LoxClient(**parameters)
+        self.client = client
+        if workers is None:
+            workers = client.concurrency
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    async def _run(self, function, *args):
+        """
+        Call a function of the client in the thread pool.
+
+        :param function: blocking function
+        :param args: arguments of the function
+        :return: result of the function
+
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, function, *args)
+
+    async def connect(self):
+        """
+        Open the connections and load the structure definitions.
+
+        :return: True if the structure definition is loaded, False if it
+        can't be loaded
+        .. raises:: ValueError if lx_ip, lx_user or lx_password is
+        missing or lx_servers is invalid
+
+        """
+        return await self._run(self.client.connect)
+
+    def resolve(self, name=None, room=None, cattype=None):
+        """
+        Return the controls given by name, or by room and/or type.
+
+        Names are resolved in memory after connect(), so this is no
+        coroutine.
+
+        :param name: spoken name of the control
+        :param room: name of the room, used if there is no name
+        :param cattype: category type, e.g. lights, used if there is no
+        name
+        :return: list of UUIDs, several if the name is ambiguous
+
+        """
+        return self.client.resolve(name, room, cattype)
+
+    async def change_state(self, controluuid, newstate):
+        """
+        Change the state of a control.
+
+        :param controluuid: uuid of the control element
+        :param newstate: new state of the control, e.g. on or 50
+        :return: True if successful, False if not
+
+        """
+        return await self._run(self.client.change_state_byuuid,
+                               controluuid, newstate)
+
+    async def change_batch(self, controluuids, newstate):
+        """
+        Change the state of several controls concurrently.
+
+        :param controluuids: list of uuids of the control elements
+        :param newstate: new state of the controls
+        :return: list of dicts with name, uuid, room and success per
+        control
+
+        """
+        return await self._run(self.client.change_state_batch,
+                               controluuids, newstate)
+
+    async def change_scene(self, steps):
+        """
+        Change the states of the steps of a scene.
+
+        The steps are grouped like by LoxClient.change_scene, the delays
+        are awaited instead of blocking a thread.
+
+        :param steps: list of dicts with control_name, or control_room
+        and/or control_type, newstate and an optional delay in seconds
+        :return: list of dicts with name, uuid, room and success per
+        control, the steps without controls last
+        .. raises:: ValueError if a step is invalid
+
+        """
+        groups, failed = self.client.plan_scene(steps)
+        summary = []
+        for delay, changes in groups:
+            if delay > 0:
+                await asyncio.sleep(delay)
+            summary.extend(await self._run(self.client.change_group,
+                                           changes))
+        return summary + failed
+
+    async def read_states(self, controluuids):
+        """
+        Read the current state of several controls.
+
+        :param controluuids: list of uuids of the control elements
+        :return: list of dicts with name, uuid, room, type and value per
+        control, value is None if unknown
+
+        """
+        return await self._run(self.client.read_states, controluuids)
+
+    def close(self):
+        """Wait for the running calls, no more calls are accepted."""
+        self._executor.shutdown(wait=True)
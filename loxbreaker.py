@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""Health of the miniservers, requests fail fast while one is down."""
+
+import logging
+import threading
+import time
+
+import requests
+
+import loxstats
+
+logger = logging.getLogger("kalliope")
+
+# Default number of failures in a row opening the circuit
+FAILURES = 3
+# Default seconds until an open circuit is probed again
+COOLDOWN = 30.0
+
+# One breaker per miniserver, shared by all neuron instances and users
+# of the process. Key is the host.
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+
+    """Request not sent, the miniserver is known to be unreachable."""
+
+
+def get_breaker(host, failures=FAILURES, cooldown=COOLDOWN):
+    """
+    Return the circuit breaker of a miniserver.
+
+    The breaker is created on first use. The failures and the cooldown
+    of the last call are used.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param failures: number of failures in a row opening the circuit
+    :param cooldown: seconds until an open circuit is probed again
+    :return: CircuitBreaker
+
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = CircuitBreaker(host, failures, cooldown)
+            _breakers[host] = breaker
+        else:
+            breaker.configure(failures, cooldown)
+        return breaker
+
+
+def is_reachable(host):
+    """
+    Return False if the last request to a miniserver failed.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :return: True if reachable or nothing is known yet
+
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+    return breaker is None or breaker.is_reachable()
+
+
+def clear_breakers():
+    """Forget the health of all miniservers."""
+    with _breakers_lock:
+        _breakers.clear()
+
+
+class CircuitBreaker(object):
+
+    """
+    Health of one miniserver.
+
+    The circuit is closed while requests reach the miniserver. After
+    failures in a row it opens, and requests fail at once instead of
+    waiting for timeouts. After the cooldown the circuit is half-open:
+    the next request probes the miniserver first, all others still
+    fail. A successful probe closes the circuit, a failed one opens it
+    for another cooldown.
+
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, host, failures=FAILURES, cooldown=COOLDOWN):
+        """
+        Create a closed circuit.
+
+        :param host: ip or hostname of the miniserver, optional with port
+        :param failures: number of failures in a row opening the circuit
+        :param cooldown: seconds until an open circuit is probed again
+
+        """
+        self.host = host
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failed = 0
+        self._opened = 0.0
+
+    def configure(self, failures, cooldown):
+        """
+        Change the failures and the cooldown.
+
+        :param failures: number of failures in a row opening the circuit
+        :param cooldown: seconds until an open circuit is probed again
+
+        """
+        with self._lock:
+            self.failures = failures
+            self.cooldown = cooldown
+
+    @property
+    def state(self):
+        """Return CLOSED, OPEN or HALF_OPEN."""
+        with self._lock:
+            return self._state
+
+    def is_reachable(self):
+        """Return False if the last request failed."""
+        with self._lock:
+            return self._failed == 0
+
+    def acquire(self):
+        """
+        Decide about sending a request.
+
+        :return: True if the request has to probe the miniserver first,
+        False if it is sent as it is
+        .. raises:: CircuitOpenError if the request must not be sent
+
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return False
+            wait = self._opened + self.cooldown - time.time()
+            if self._state == self.OPEN and wait <= 0:
+                self._state = self.HALF_OPEN
+                return True
+        loxstats.STATS.count("circuit_rejected")
+        if wait > 0:
+            raise CircuitOpenError("%s is unreachable, next try in %.1f s" %
+                                   (self.host, wait))
+        raise CircuitOpenError("%s is unreachable, probing" % self.host)
+
+    def record_success(self):
+        """Close the circuit, the miniserver was reached."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.debug("Loxscontrol: %s is reachable again",
+                             self.host)
+            self._state = self.CLOSED
+            self._failed = 0
+
+    def record_failure(self):
+        """Count a failed request, open the circuit if there are enough."""
+        with self._lock:
+            self._failed += 1
+            if self._state == self.HALF_OPEN or \
+                    self._failed >= self.failures:
+                if self._state != self.OPEN:
+                    logger.debug("Loxscontrol: %s is unreachable, requests "
+                                 "fail for %.1f s", self.host, self.cooldown)
+                    loxstats.STATS.count("circuit_opened")
+                self._state = self.OPEN
+                self._opened = time.time()
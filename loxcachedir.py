@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Directory of the structure cache and the tokens.
+
+The directory holds the tokens of the miniservers and the structures
+mapping spoken names to controls, so it is used only if no other user
+can write to it.
+
+"""
+
+import errno
+import os
+import stat
+
+# Default directory, per user instead of the shared temp dir
+DEFAULT = os.path.join(os.path.expanduser("~"), ".cache",
+                       "kalliope_loxscontrol")
+
+
+class UnsafeDirectoryError(OSError):
+
+    """Directory is owned by another user or writable by others."""
+
+
+def secure(path):
+    """
+    Create a directory readable by the owner only, check an existing one.
+
+    :param path: path of the directory
+    :return: path
+    .. raises:: UnsafeDirectoryError if it is owned by another user or
+    writable by group or others, OSError if it can't be created
+
+    """
+    try:
+        os.makedirs(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    info = os.stat(path)
+    if not stat.S_ISDIR(info.st_mode):
+        raise UnsafeDirectoryError("%s is no directory" % path)
+    if hasattr(os, "getuid") and info.st_uid != os.getuid():
+        raise UnsafeDirectoryError("%s is owned by another user" % path)
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise UnsafeDirectoryError("%s is writable by others" % path)
+    return path
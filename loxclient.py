@@ -0,0 +1,1626 @@
+# -*- coding: utf-8 -*-
+"""
+Client of one or several Loxone miniservers.
+
+The client loads and indexes the structure definition, resolves spoken
+names and changes and reads the states of the control elements. It
+doesn't need Kalliope: the neuron Loxscontrol is a thin adapter turning
+orders into calls of the client, loxasync runs its calls from an
+asyncio event loop.
+
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import loxbreaker
+import loxcachedir
+import loxmatch
+import loxmodel
+import loxsession
+import loxstats
+import loxtypes
+# Modules needed by some options or on a cold start only are imported
+# where they are used: loxwebsocket (and websocket-client) by the
+# websocket transport and status updates, loxrefresh by lx_refresh,
+# loxqueue by lx_coalesce and lx_maxrate, loxparser (and ijson) and
+# loxsnapshot by loading a structure, loxdescribe by the diagnostics.
+
+logger = logging.getLogger("kalliope")
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class LoxClient(object):
+
+    """Client of the miniservers of one Loxone installation."""
+
+    # Prefix of the log messages, the neuron logs with its name
+    neuron_name = "Loxscontrol"
+
+    # Path definition
+    STRUCTUREDEF = "/data/Loxapp3.json"
+    VERSION = "/dev/sps/LoxAPPversion"
+    SPSIO = "/dev/sps/io/"
+    WSIO = "jdev/sps/io/"
+
+    # Transports used to send commands
+    TRANSPORT_HTTP = "http"
+    TRANSPORT_WEBSOCKET = "websocket"
+
+    # Authorization of the http requests
+    AUTH_BASIC = "basic"
+    AUTH_TOKEN = "token"
+
+    # Default directory for the on-disk structure cache, per user
+    CACHEDIR = loxcachedir.DEFAULT
+
+    # Parsed structure definitions, shared by all instances of the process.
+    # Key is (host, user), value is the LoxModel incl. its version.
+    # Snapshots of lx_snapshot are kept by ("snapshot", path).
+    _structure_cache = {}
+    _structure_cache_lock = threading.Lock()
+
+    # Control elements used in Loxone: type -> loxtypes.ControlType
+    TYPES = loxtypes.TYPES
+    TYPE_SUPPORTED = sorted(TYPES)
+
+    # State reported by the status action: control type -> state name
+    STATUS_STATES = dict((name, controltype.status)
+                         for name, controltype in TYPES.items()
+                         if controltype.status is not None)
+
+    # States checked after a change: control type -> (state name,
+    # {command: expected value})
+    VERIFY_STATES = dict((name, controltype.verify)
+                         for name, controltype in TYPES.items()
+                         if controltype.verify is not None)
+
+    # Categories used in Loxone
+    CAT_LIGTH = "lights"
+    CAT_JALOUSIE = "shading"
+    CAT_UNDEF = "undefined"
+    CAT_ROOM = "room"
+    CAT_CATEGORY = "category"
+
+    # Word joining the last two names of a list: language code of the
+    # structure definition -> word. Other languages only use commas.
+    LIST_AND = {"DEU": "und", "ENG": "and"}
+
+    def __init__(self, **parameters):
+        """
+        Create a client, nothing is sent yet.
+
+        The parameters are the lx_ parameters of the neuron, e.g.
+        LoxClient(lx_ip="192.168.0.11", lx_user="admin",
+        lx_password="secret", lx_timeout=2.0). Other parameters are
+        ignored.
+
+        :param parameters: lx_ip, lx_user, lx_password and the optional
+        lx_ parameters
+
+        """
+        self._host = parameters.get('lx_ip', None)
+        self._user = parameters.get('lx_user', None)
+        self._password = parameters.get('lx_password', None)
+        self._more_servers = parameters.get('lx_servers', None)
+        self._controls = parameters.get('lx_structuredef', None)
+        self._cachedir = parameters.get('lx_cachedir', self.CACHEDIR)
+        self._snapshot = parameters.get('lx_snapshot', None)
+        self._timeout = parameters.get('lx_timeout', loxsession.TIMEOUT)
+        self._connecttimeout = parameters.get('lx_connecttimeout',
+                                              loxsession.CONNECT_TIMEOUT)
+        self._breakerfailures = parameters.get('lx_breakerfailures',
+                                               loxbreaker.FAILURES)
+        self._breakercooldown = parameters.get('lx_breakercooldown',
+                                               loxbreaker.COOLDOWN)
+        self._poolsize = parameters.get('lx_poolsize', loxsession.POOLSIZE)
+        self._retries = parameters.get('lx_retries', loxsession.RETRIES)
+        self._backoff = parameters.get('lx_backoff', loxsession.BACKOFF)
+        self._transport = parameters.get('lx_transport',
+                                         self.TRANSPORT_HTTP)
+        self._auth = parameters.get('lx_auth', self.AUTH_BASIC)
+        self._statusupdates = parameters.get('lx_statusupdates', False)
+        self._verifytimeout = parameters.get('lx_verifytimeout', 1.0)
+        self._refresh = parameters.get('lx_refresh', None)
+        self._coalesce = parameters.get('lx_coalesce', 0)
+        self._maxrate = parameters.get('lx_maxrate', None)
+        # changes sent later, None while changes are sent at once
+        self._deferred = None
+        self._statsfile = parameters.get('lx_statsfile', None)
+        self._stats = loxstats.Stats(parent=loxstats.STATS)
+        # host -> (user, password), the miniserver of lx_ip first
+        self._servers = OrderedDict()
+        # host -> shared session
+        self._sessions = {}
+        # host -> state table kept current by status updates
+        self._states = {}
+        self._model = None
+        self._indexes = None
+        self._records = []
+        self._rooms = {}
+        self._connect_lock = threading.Lock()
+
+    def connect(self):
+        """
+        Open the connections to the miniservers, load their structure.
+
+        Sessions, status updates and parsed structure definitions are
+        shared by all clients of the process, so only the first client
+        waits for them. Calling it again does nothing.
+
+        :return: True if the structure definition is loaded, False if it
+        can't be loaded
+        .. raises:: ValueError if lx_ip, lx_user or lx_password is
+        missing or lx_servers is invalid
+
+        """
+        with self._connect_lock:
+            if self._model is not None:
+                return True
+            return self._connect()
+
+    @property
+    def stats(self):
+        """Return the loxstats.Stats of this client."""
+        return self._stats
+
+    @property
+    def concurrency(self):
+        """
+        Return the max. number of parallel requests.
+
+        :return: lx_poolsize per miniserver
+
+        """
+        return self._poolsize * (1 + len(self._more_servers or []))
+
+    def is_reachable(self, host=None):
+        """
+        Return False while the circuit of a miniserver is open.
+
+        :param host: miniserver, None for all miniservers
+        :return: True if the miniservers can be reached
+
+        """
+        if host is not None:
+            return loxbreaker.is_reachable(host)
+        return all(loxbreaker.is_reachable(host) for host in self._servers)
+
+    def _connect(self):
+        """Open the connections and load the structure, see connect."""
+        if None in (self._host, self._user, self._password):
+            raise ValueError("needs lx_ip, lx_user and lx_password")
+        if self._auth not in (self.AUTH_BASIC, self.AUTH_TOKEN):
+            raise ValueError("lx_auth needs %s or %s" %
+                             (self.AUTH_BASIC, self.AUTH_TOKEN))
+
+        # further miniservers, e.g. of a client-gateway setup
+        self._servers[self._host] = (self._user, self._password)
+        if self._more_servers is not None:
+            if not isinstance(self._more_servers, list) or not all(
+                    isinstance(server, dict) and server.get('lx_ip')
+                    for server in self._more_servers):
+                raise ValueError("lx_servers needs a list of miniservers "
+                                 "with lx_ip")
+            for server in self._more_servers:
+                self._servers[server['lx_ip']] = (
+                    server.get('lx_user', self._user),
+                    server.get('lx_password', self._password))
+
+        # shared connection pool of each miniserver, the tokens are kept
+        # with the structure cache
+        for host, (user, password) in self._servers.items():
+            self._sessions[host] = loxsession.get_session(
+                host, user, password, self._poolsize, self._retries,
+                self._backoff, self._connecttimeout, self._breakerfailures,
+                self._breakercooldown, self._auth == self.AUTH_TOKEN,
+                self._cachedir or None, self._timeout)
+        self._session = self._sessions[self._host]
+
+        # state tables kept current by the miniservers
+        if self._statusupdates:
+            import loxwebsocket
+            for host, (user, password) in self._servers.items():
+                if not loxbreaker.is_reachable(host):
+                    continue
+                try:
+                    self._states[host] = loxwebsocket.get_connection(
+                        host, user, password, self._timeout,
+                        statusupdates=True).states
+                except loxwebsocket.LoxWebSocketError as e:
+                    logger.debug(self.neuron_name +
+                                 ": Status updates of %s not available: %s",
+                                 host, e)
+
+        # use the models kept current in the background. On a cold
+        # start the refreshers load them, this waits for their first
+        # check. Only what they didn't load is loaded here.
+        if self._controls is None and self._refresh:
+            import loxrefresh
+            refreshers = []
+            for host, (user, password) in self._servers.items():
+                loader = _ServerLoader(
+                    host, user, password, self._sessions[host],
+                    self._cachedir, self._timeout,
+                    self._snapshot if host == self._host else None)
+                refreshers.append((host, loxrefresh.get_refresher(
+                    host, user, password, loader, self._refresh)))
+            models = []
+            for host, refresher in refreshers:
+                refresher.wait_checked()
+                models.append((host, refresher.model))
+            if all(model is not None for _, model in models):
+                self._apply_model(self._merge_models(models))
+
+        # load loxone config from miniserver
+        if self._model is None and self._controls is None:
+            if not self.load_config():
+                return False
+
+        # structure definition was given, index it
+        if self._model is None:
+            self._apply_model(loxmodel.LoxModel.from_controls(
+                self._controls, self._rooms))
+        return True
+
+    def report_stats(self):
+        """
+        Log the timings and counters of this client, e.g. of an order.
+
+        The stats of the process are written to the stats file, if
+        lx_statsfile is set.
+
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(self.neuron_name + ": Stats %s",
+                         json.dumps(self._stats.summary(), sort_keys=True))
+        if not self._statsfile:
+            return
+        try:
+            loxstats.STATS.write(self._statsfile)
+        except (IOError, OSError) as e:
+            logger.debug(self.neuron_name +
+                         ": Stats file %s cannot be written: %s",
+                         self._statsfile, e)
+
+    @loxstats.timed("read_states")
+    def read_states(self, controluuids):
+        """
+        Return the current state of several controls.
+
+        States are taken from the state table if it is warm. All other
+        states are requested in parallel, once per control.
+
+        :param controluuids: list of uuids of the control elements
+        :return: list of dicts with name, uuid, room, type and value
+        per control, in the order of controluuids. value is None if the
+        state is unknown, 0 if it means off.
+
+        """
+        values = {}
+        missing = []
+        for uuid in controluuids:
+            value = self.get_state(
+                uuid, self.STATUS_STATES.get(self.get_type_by_uuid(uuid)))
+            if value is None:
+                missing.append(uuid)
+            else:
+                values[uuid] = value
+
+        missing = list(OrderedDict.fromkeys(missing))
+        values.update(zip(missing,
+                          self._run_parallel(self._read_state, missing)))
+        logger.debug(self.neuron_name + ": Read %d states, %d requested",
+                     len(controluuids), len(missing))
+
+        summary = []
+        for uuid in controluuids:
+            room = self._get_record(uuid).room
+            controltype = self.get_type_by_uuid(uuid)
+            # e.g. the mood off of a light controller is told as 0
+            value = self.TYPES[controltype].status_value(values[uuid]) \
+                if controltype in self.TYPES else values[uuid]
+            summary.append({"name": self.get_name_by_uuid(uuid),
+                            "uuid": uuid,
+                            "room": self._rooms.get(room, {}).get('name'),
+                            "type": controltype,
+                            "value": value})
+        return summary
+
+    def _read_state(self, controluuid):
+        """
+        Request the current value of a control from the miniserver.
+
+        :param controluuid: uuid of the control element
+        :return: value as float if possible, None if the request failed
+
+        """
+        host = self._get_host(controluuid)
+        try:
+            r = self._sessions[host].get("http://" + host + self.SPSIO +
+                                         controluuid, timeout=self._timeout)
+            r.raise_for_status()
+            value = r.json()['LL']['value']
+        except requests.exceptions.RequestException:
+            logger.debug(self.neuron_name + ": Reading state of %s failed.",
+                         controluuid)
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.debug(self.neuron_name +
+                         ": State of %s cannot be parsed.", controluuid)
+            return None
+
+        try:
+            return float(value)
+        except (ValueError, TypeError):
+            return value
+
+    def _run_parallel(self, function, items):
+        """
+        Call function for all items concurrently.
+
+        The number of parallel calls is bounded by the size of the
+        connection pools of the miniservers.
+
+        :param function: function called with one item
+        :param items: list of items
+        :return: list of results in the order of items
+
+        """
+        if not items:
+            return []
+        if len(items) == 1:
+            return [function(items[0])]
+        workers = max(1, min(self._poolsize * max(1, len(self._servers)),
+                             len(items)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(function, items))
+
+    @loxstats.timed("change_state")
+    def change_state_byuuid(self, controluuid,  newstate):
+        """
+        Change the state of a control identified by its uuid.
+
+        The state is checked against the type of the control before
+        anything is sent. If status updates are received, the new state
+        is verified. With lx_coalesce or lx_maxrate, the command is sent
+        by the command queue of the miniserver, see loxqueue. While
+        changes are deferred, see defer_changes, the command is only
+        checked and kept to be sent later.
+
+        :param controluuid: uuid of the control element
+        :param newstate: new state of the control
+        :return: True if successful, False if not
+
+        """
+
+        logger.debug(self.neuron_name +
+                     ": Called Change State with %s UID and %s newstate",
+                     controluuid,  newstate)
+
+        command = self.build_command(controluuid, newstate)
+        if command is None:
+            logger.debug(self.neuron_name +
+                         ": State %s is not valid for UID %s",
+                         newstate, controluuid)
+            return False
+        if self._deferred is not None:
+            self._deferred.append((controluuid, command))
+            return True
+        return self._submit_change(controluuid, command)
+
+    def _submit_change(self, controluuid, command):
+        """
+        Send a command, by the command queue if there is one.
+
+        :param controluuid: uuid of the control element
+        :param command: command built by build_command
+        :return: True if successful, False if not
+
+        """
+        if self._coalesce or self._maxrate:
+            import loxqueue
+            queue = loxqueue.get_queue(self._get_host(controluuid),
+                                       self._coalesce, self._maxrate)
+            return queue.submit(controluuid, command, lambda command:
+                                self._change_state(controluuid, command))
+        return self._change_state(controluuid, command)
+
+    def _change_state(self, controluuid, command):
+        """
+        Send a command and verify the new state.
+
+        :param controluuid: uuid of the control element
+        :param command: command built by build_command
+        :return: True if successful, False if not
+
+        """
+        if not self._send_state(controluuid, command):
+            return False
+        logger.debug(self.neuron_name +
+                     ': UID %s changed state to %s', controluuid, command)
+        return self.verify_state(controluuid, command)
+
+    def build_command(self, controluuid, newstate):
+        """
+        Return the command setting the state of a control.
+
+        :param controluuid: uuid of the control element
+        :param newstate: requested state, e.g. on, up or 50
+        :return: command or None if the control is unknown or the state
+        is not valid for its type
+
+        """
+        controltype = self.TYPES.get(self.get_type_by_uuid(controluuid))
+        if controltype is None:
+            return None
+        return controltype.command(newstate)
+
+    def _send_state(self, controluuid, command):
+        """
+        Send a command to the miniserver.
+
+        :param controluuid: uuid of the control element
+        :param command: command built by build_command
+        :return: True if the miniserver accepted the command, False if not
+
+        """
+        host = self._get_host(controluuid)
+
+        # send over the persistent websocket, fall back to http, which
+        # fails fast while the miniserver is unreachable
+        if self._transport == self.TRANSPORT_WEBSOCKET and \
+                loxbreaker.is_reachable(host):
+            import loxwebsocket
+            user, password = self._get_credentials(host)
+            try:
+                connection = loxwebsocket.get_connection(
+                    host, user, password, self._timeout)
+                response = connection.command(self.WSIO + controluuid +
+                                              "/" + command)
+            except loxwebsocket.LoxWebSocketError as e:
+                logger.debug(self.neuron_name +
+                             ": Websocket command failed, using http: %s", e)
+            else:
+                if str(response.get('Code')) != "200":
+                    logger.debug(self.neuron_name +
+                                 ": Change switch state failed with "
+                                 "response: %r", response)
+                    return False
+                return True
+
+        try:
+            r = self._sessions[host].get("http://" + host + self.SPSIO +
+                                         controluuid + "/" + command,
+                                         timeout=self._timeout)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            logger.debug(self.neuron_name +
+                         ": Change switch state failed with response: %r",
+                         r.text)
+            return False
+        except requests.exceptions.RequestException:
+            logger.debug(self.neuron_name+": Change switch state failed.")
+            return False
+
+        return self._is_accepted(controluuid, r)
+
+    def _is_accepted(self, controluuid, response):
+        """
+        Check the answer of the miniserver to a command.
+
+        The miniserver answers {"LL": {"control", "value", "Code"}},
+        Code 200 if it executed the command, value is the resulting
+        value. Answers without them are taken as accepted.
+
+        :param controluuid: uuid of the control element
+        :param response: requests.Response of the command
+        :return: False if the miniserver refused the command
+
+        """
+        try:
+            answer = response.json()['LL']
+        except (ValueError, KeyError, TypeError):
+            return True
+        if not isinstance(answer, dict):
+            return True
+        code = answer.get('Code', answer.get('code'))
+        if code is not None and str(code) != "200":
+            logger.debug(self.neuron_name +
+                         ": UID %s refused the command with code %s",
+                         controluuid, code)
+            return False
+        logger.debug(self.neuron_name + ": UID %s has the value %s",
+                     controluuid, answer.get('value'))
+        return True
+
+    def verify_state(self, controluuid, command):
+        """
+        Check that a control reached its new state.
+
+        The state table is used, no request is sent. States can only
+        be checked for the control types in VERIFY_STATES.
+
+        :param controluuid: uuid of the control element
+        :param command: command sent to the control
+        :return: False if the state was not reached in time, True
+        otherwise
+
+        """
+        control = self._get_record(controluuid)
+        if control is None or control.type not in self.VERIFY_STATES:
+            return True
+        states = self._states.get(control.host or self._host)
+        if states is None or not states.warm:
+            return True
+        statename, values = self.VERIFY_STATES[control.type]
+        stateuuid = control.get_state(statename)
+        if (stateuuid is None) or (command not in values):
+            return True
+
+        if states.wait_for(stateuuid, values[command],
+                           self._verifytimeout):
+            return True
+        logger.debug(self.neuron_name + ": UID %s did not reach state %s",
+                     controluuid, command)
+        return False
+
+    def get_state(self, controluuid, statename):
+        """
+        Return the current value of a state of a control.
+
+        The value is taken from the state table, no request is sent.
+
+        :param controluuid: uuid of the control element
+        :param statename: name of the state, e.g. active or position
+        :return: value or None if unknown
+
+        """
+        control = self._get_record(controluuid)
+        if control is None:
+            return None
+        states = self._states.get(control.host or self._host)
+        if states is None or not states.warm:
+            return None
+        stateuuid = control.get_state(statename)
+        if stateuuid is None:
+            return None
+        return states.get(stateuuid)
+
+    def change_state_batch(self, controluuids, newstate):
+        """
+        Change the state of several controls concurrently.
+
+        The requests are sent in parallel, bounded by the size of the
+        connection pool.
+
+        :param controluuids: list of uuids of the control elements
+        :param newstate: new state of the controls
+        :return: list of dicts with name, uuid, room and success
+        per control, in the order of controluuids
+
+        """
+        results = self._run_parallel(
+            lambda uuid: self.change_state_byuuid(uuid, newstate),
+            controluuids)
+        logger.debug(self.neuron_name + ": Changed %d of %d controls to %s",
+                     results.count(True), len(results), newstate)
+        return self._summarize_changes(controluuids, results)
+
+    def _summarize_changes(self, controluuids, results):
+        """
+        Return the result of changing controls, e.g. for the template.
+
+        :param controluuids: list of uuids of the control elements
+        :param results: list of True or False per control
+        :return: list of dicts with name, uuid, room and success
+
+        """
+        summary = []
+        for uuid, success in zip(controluuids, results):
+            room = self._get_record(uuid).room
+            summary.append({"name": self.get_name_by_uuid(uuid),
+                            "uuid": uuid,
+                            "room": self._rooms.get(room, {}).get('name'),
+                            "success": success})
+        return summary
+
+    def change_switch_state_byname(self, controlname,  newstate):
+        """
+        Change the state of a control identified by controlname.
+
+        :param controlname: name of the control
+        :param newstate: new state of the control
+        :return: True if successful, False if not
+
+        """
+        uuid = self.get_controluuid_by_name(controlname)
+        if uuid is not None:
+            return self.change_state_byuuid(uuid, newstate)
+        else:
+            logger.debug(self.neuron_name +
+                         ': Name %s not found in StructureDef', controlname)
+            return False
+
+    def resolve(self, name=None, room=None, cattype=None):
+        """
+        Return the controls given by name, or by room and/or type.
+
+        :param name: spoken name of the control
+        :param room: name of the room, used if there is no name
+        :param cattype: category type, e.g. lights, used if there is no
+        name
+        :return: list of UUIDs, several if the name is ambiguous
+
+        """
+        if name is not None:
+            return self.get_controluuids_by_name(name)
+        return self.get_controluuids_by_room_and_type(room, cattype)
+
+    def defer_changes(self):
+        """
+        Keep the changes checked by change_state_byuuid to be sent later.
+
+        The changes are sent by confirm_later, e.g. after the neuron's
+        answer with lx_optimistic.
+
+        """
+        self._deferred = []
+
+    def confirm_later(self):
+        """
+        Send the deferred changes in a background thread.
+
+        Changes are sent at once again afterwards. Failed changes are
+        logged and counted, see report_failures.
+
+        :return: the thread started, None if there are no changes
+
+        """
+        changes, self._deferred = self._deferred, None
+        if not changes:
+            return None
+        thread = threading.Thread(target=self.confirm_changes,
+                                  args=(changes,))
+        thread.start()
+        return thread
+
+    def confirm_changes(self, changes):
+        """
+        Send changes answered already, report failures.
+
+        :param changes: list of tuples (uuid, command)
+        :return: True if all changes succeeded
+
+        """
+        with self._stats.timer("confirm"):
+            results = self._run_parallel(
+                lambda change: self._submit_change(*change), changes)
+        for success in results:
+            self._stats.count("confirmations",
+                              result="confirmed" if success else "failed")
+        if all(results):
+            logger.debug(self.neuron_name + ": %d changes confirmed",
+                         len(results))
+            return True
+
+        logger.debug(self.neuron_name + ": %d of %d changes failed",
+                     results.count(False), len(results))
+        self.report_failures(self._summarize_changes(
+            [uuid for uuid, _ in changes], results))
+        return False
+
+    def report_failures(self, summary):
+        """
+        Log changes failed after the order was answered.
+
+        Kalliope doesn't expect a neuron to speak after it returned, so
+        the failures are logged and counted by late_failures, labelled
+        with the status_code StateChangeError, or Unreachable if a
+        miniserver can't be reached.
+
+        :param summary: list of dicts with name, uuid, room and success
+
+        """
+        status_code = "StateChangeError"
+        if not self.is_reachable():
+            status_code = "Unreachable"
+        failed = [change for change in summary if not change['success']]
+        for _ in failed:
+            self._stats.count("late_failures", result=status_code)
+        logger.error(self.neuron_name + ": %s after the answer: %s",
+                     status_code, ", ".join(
+                         change['name'] or change['uuid'] or "?"
+                         for change in failed))
+        self.report_stats()
+
+    def check_scene(self, steps):
+        """
+        Check the steps of a scene before anything is sent.
+
+        :param steps: list of dicts with control_name, or control_room
+        and/or control_type, newstate and an optional delay in seconds
+        .. raises:: ValueError if a step is invalid
+
+        """
+        if not isinstance(steps, list) or not all(
+                isinstance(step, dict) for step in steps):
+            raise ValueError("scene_steps needs a list of steps")
+        for step in steps:
+            if step.get('control_name') is None and \
+                    step.get('control_room') is None and \
+                    step.get('control_type') is None:
+                raise ValueError("steps of scene_steps need control_name, "
+                                 "control_room or control_type")
+            if step.get('newstate') is None:
+                raise ValueError("steps of scene_steps need newstate")
+            delay = step.get('delay')
+            if delay is None:
+                continue
+            try:
+                if isinstance(delay, bool):
+                    raise ValueError(delay)
+                delay = float(delay)
+            except (TypeError, ValueError):
+                delay = None
+            # NaN is not >= 0
+            if delay is None or not delay >= 0:
+                raise ValueError("delay of scene_steps needs seconds, "
+                                 "not %r" % step.get('delay'))
+
+    def resolve_step(self, step):
+        """
+        Return the controls changed by a step of a scene.
+
+        :param step: dict with control_name, or control_room and/or
+        control_type, and newstate
+        :return: list of UUIDs of the controls accepting the state, empty
+        if the name is unknown or ambiguous or no control accepts the state
+
+        """
+        newstate = step.get('newstate')
+        if step.get('control_name') is not None:
+            uuids = self.get_controluuids_by_name(step['control_name'])
+            if len(uuids) != 1:
+                logger.debug(self.neuron_name +
+                             ": Name %s of scene matches %d controls",
+                             step['control_name'], len(uuids))
+                return []
+        elif step.get('control_room') is not None or \
+                step.get('control_type') is not None:
+            uuids = self.get_controluuids_by_room_and_type(
+                step.get('control_room'), step.get('control_type'))
+        else:
+            return []
+        return [uuid for uuid in uuids
+                if self.build_command(uuid, newstate) is not None]
+
+    def plan_scene(self, steps):
+        """
+        Resolve the steps of a scene into groups sent one after the other.
+
+        All names are resolved before anything is sent. A step is sent
+        together with the steps before it, unless one of them changes
+        the same control. A step with a delay starts a new group, sent
+        after the groups before it are done and the delay passed.
+
+        :param steps: list of steps, see check_scene
+        :return: tuple (groups, failed), groups is a list of tuples
+        (delay, list of (uuid, state)), failed a list of dicts with
+        name, uuid None, room and success False of the steps without
+        controls
+        .. raises:: ValueError if a step is invalid
+
+        """
+        self.check_scene(steps)
+        groups = []
+        failed = []
+        for step in steps:
+            delay = step.get('delay')
+            if not groups or delay is not None:
+                groups.append((float(delay or 0), []))
+            uuids = self.resolve_step(step)
+            if not uuids:
+                failed.append({"name": step.get('control_name'),
+                               "uuid": None,
+                               "room": step.get('control_room'),
+                               "success": False})
+                continue
+            # changes of the same control are sent one after the other
+            if set(uuids) & set(uuid for uuid, _ in groups[-1][1]):
+                groups.append((0.0, []))
+            groups[-1][1].extend((uuid, step.get('newstate'))
+                                 for uuid in uuids)
+        return groups, failed
+
+    def change_group(self, changes):
+        """
+        Send the changes of a group of a scene in parallel.
+
+        :param changes: list of tuples (uuid, state)
+        :return: list of dicts with name, uuid, room and success
+
+        """
+        results = self._run_parallel(
+            lambda change: self.change_state_byuuid(*change), changes)
+        return self._summarize_changes([uuid for uuid, _ in changes],
+                                       results)
+
+    def change_groups(self, groups):
+        """
+        Send groups of a scene one after the other, waiting their delays.
+
+        :param groups: list of tuples (delay, list of (uuid, state))
+        :return: list of dicts with name, uuid, room and success
+
+        """
+        summary = []
+        for delay, changes in groups:
+            if delay > 0:
+                time.sleep(delay)
+            summary.extend(self.change_group(changes))
+        return summary
+
+    def change_later(self, groups):
+        """
+        Send groups of a scene in a background thread.
+
+        Failed changes are reported like the ones of confirm_later.
+
+        :param groups: list of tuples (delay, list of (uuid, state))
+        :return: the thread started
+
+        """
+        thread = threading.Thread(target=self._change_groups_later,
+                                  args=(list(groups),))
+        thread.start()
+        return thread
+
+    def _change_groups_later(self, groups):
+        """Send groups of a scene, report failures, see change_later."""
+        summary = self.change_groups(groups)
+        if all(change['success'] for change in summary):
+            logger.debug(self.neuron_name + ": %d delayed changes done",
+                         len(summary))
+            return
+        self.report_failures(summary)
+
+    def change_scene(self, steps):
+        """
+        Change the states of the steps of a scene, see plan_scene.
+
+        Blocks until the delays passed and the last group is sent.
+
+        :param steps: list of steps, see check_scene
+        :return: list of dicts with name, uuid, room and success per
+        control, the steps without controls last
+        .. raises:: ValueError if a step is invalid
+
+        """
+        groups, failed = self.plan_scene(steps)
+        return self.change_groups(groups) + failed
+
+    def describe(self):
+        """
+        Return diagnostics of the structure definition.
+
+        :return: dict, see loxmodel.LoxModel.describe
+
+        """
+        return self._model.describe()
+
+    def get_type_by_uuid(self,  uuid):
+        """
+        Return type identified by uuid.
+
+        :param uuid: uuid of the control element
+        :return: type of the control element
+        or None if not found
+
+        """
+        # check categories first
+        if uuid in self._controls:
+            return self._controls[uuid]['type']
+
+        # check controls
+        control = self._get_record(uuid)
+        if control is not None:
+            return control.type
+
+        # check rooms
+        if uuid in self._rooms:
+            return self.CAT_ROOM
+        return None
+
+    def get_name_by_uuid(self,  uuid):
+        """
+        Return name identified by uuid.
+
+        :param uuid: uuid of the control element
+        :return: name of the control element
+        or None if not found
+
+        """
+        # check categories first
+        if uuid in self._controls:
+            return self._controls[uuid]['name']
+
+        # check controls
+        control = self._get_record(uuid)
+        if control is not None:
+            return control.name
+
+        # check rooms
+        if uuid in self._rooms:
+            return self._rooms[uuid]['name']
+        return None
+
+    def get_controluuid_by_name(self, controlname):
+        """
+        Return UUID identified by controlname.
+
+        :param controlname: name of the switch
+        :return: UUID of control in the structure definition
+        or None if not found or if the name is ambiguous
+
+        """
+        uuids = self.get_controluuids_by_name(controlname)
+        if len(uuids) == 1:
+            return uuids[0]
+        if len(uuids) > 1:
+            logger.debug(self.neuron_name +
+                         ': Name %s matches %d controls',
+                         controlname, len(uuids))
+        return None
+
+    @loxstats.timed("lookup_name")
+    def get_controluuids_by_name(self, controlname):
+        """
+        Return all UUIDs best matching controlname.
+
+        Names are matched word by word in any order, ignoring case,
+        umlauts and punctuation. Words sounding alike match with a lower
+        score. Extra words are ignored, e.g. "Kitchen" matches "the
+        light Kitchen". Of several matching names the name with the
+        most words found wins.
+
+        :param controlname: name of the switch
+        :return: list of UUIDs of controls in the structure definition,
+        empty if not found
+
+        """
+        return [self._records[index].uidaction for index in
+                self._indexes['name'].match(controlname)]
+
+    @loxstats.timed("lookup_room")
+    def get_roomuuids_by_name(self, roomname):
+        """
+        Return all room UUIDs matching roomname.
+
+        Names are matched like in get_controluuids_by_name.
+
+        :param roomname: name of the room
+        :return: list of UUIDs of rooms, empty if not found
+
+        """
+        return self._indexes['roomname'].match(roomname)
+
+    @loxstats.timed("lookup_room_type")
+    def get_controluuids_by_room_and_type(self, roomname, cattype):
+        """
+        Return all control UUIDs in a room and/or of a category type.
+
+        :param roomname: name of the room, None for all rooms
+        :param cattype: category type, e.g. lights, None for all types
+        :return: list of UUIDs of controls, empty if not found
+
+        """
+        rooms = None
+        if roomname is not None:
+            rooms = self.get_roomuuids_by_name(roomname)
+        return [self._records[index].uidaction for index in
+                self._get_indexes_by_rooms_and_type(rooms, cattype)]
+
+    def _get_indexes_by_rooms_and_type(self, rooms, cattype):
+        """
+        Return the indexes of the controls in rooms and/or of a type.
+
+        :param rooms: uuids of the rooms, None for all rooms
+        :param cattype: category type, e.g. lights, None for all types
+        :return: list of indexes of controls
+
+        """
+        indexes = None
+        if rooms is not None:
+            indexes = []
+            for room in rooms:
+                indexes.extend(self._indexes['room'].get(room, []))
+
+        if (cattype is not None) and (cattype != self.CAT_ROOM):
+            typed = self._indexes['cattype'].get(cattype, [])
+            if indexes is None:
+                indexes = list(typed)
+            else:
+                typed = set(typed)
+                indexes = [index for index in indexes if index in typed]
+        return indexes or []
+
+    def _get_host(self, controluuid):
+        """
+        Return the miniserver owning a control.
+
+        :param controluuid: uuid of the control element
+        :return: host the commands of the control are sent to
+
+        """
+        control = self._get_record(controluuid)
+        if control is None or control.host is None:
+            return self._host
+        return control.host
+
+    def _get_credentials(self, host):
+        """
+        Return the user and password of a miniserver.
+
+        :param host: ip or hostname of the miniserver
+        :return: tuple (user, password)
+
+        """
+        return self._servers.get(host, (self._user, self._password))
+
+    def _get_record(self, uuid):
+        """
+        Return the record of a control.
+
+        :param uuid: control uuid or action uuid
+        :return: loxmodel.ControlRecord or None if not found
+
+        """
+        index = self._indexes['uuid'].get(uuid)
+        if index is None:
+            return None
+        return self._records[index]
+
+    normalize_name = staticmethod(loxmatch.normalize_name)
+
+    def list_rooms(self):
+        """
+        Return the names of all rooms as list to be spoken.
+
+        :return: str, e.g. "Kitchen, Living room and Office", None if
+        there are no rooms
+
+        """
+        return self._get_list(
+            ("rooms", None, None),
+            lambda: [room['name'] for room in self._rooms.values()])
+
+    def list_categories(self):
+        """
+        Return the names of all categories as list to be spoken.
+
+        :return: str or None if there are no categories
+
+        """
+        return self._get_list(
+            ("cats", None, None),
+            lambda: [cat['name'] for cat in self._controls.values()])
+
+    def list_controls(self, roomname, cattype):
+        """
+        Return the names of the controls in a room and/or of a type.
+
+        :param roomname: name of the room, None for all rooms
+        :param cattype: category type, e.g. lights, None for all types
+        :return: str or None if there are no such controls
+
+        """
+        rooms = None
+        if roomname is not None:
+            rooms = tuple(sorted(self.get_roomuuids_by_name(roomname)))
+        return self._get_list(
+            ("controls", rooms, cattype),
+            lambda: [self._records[index].name for index in
+                     self._get_indexes_by_rooms_and_type(rooms, cattype)])
+
+    def _get_list(self, key, get_names):
+        """
+        Return a list rendered for the model, render it on first use.
+
+        Rendered lists are kept by the model, so they are rendered once
+        per structure version and shared by all instances.
+
+        :param key: tuple (kind, rooms, cattype) of the list
+        :param get_names: function returning the names of the list
+        :return: str or None if there are no names
+
+        """
+        key = key + (self._model.language,)
+        lists = self._model.lists
+        if key in lists:
+            self._stats.count("list_cache", result="hit")
+            return lists[key]
+        self._stats.count("list_cache", result="miss")
+        rendered = self.render_list(get_names())
+        lists[key] = rendered
+        return rendered
+
+    def render_list(self, names):
+        """
+        Return names as list to be spoken.
+
+        Names are sorted as they are spoken, e.g. umlauts like their
+        transliteration, and each name is told once. The last two names
+        are joined by the word of LIST_AND for the language of the
+        structure definition.
+
+        :param names: iterable of names
+        :return: str or None if there are no names
+
+        """
+        names = sorted(set(names), key=lambda name: (
+            loxmatch.normalize_name(name), name))
+        if not names:
+            return None
+        word = self.LIST_AND.get(self._model.language)
+        if word is None or len(names) == 1:
+            return ", ".join(names)
+        return "%s %s %s" % (", ".join(names[:-1]), word, names[-1])
+
+    def prewarm(self):
+        """
+        Prepare the first order.
+
+        The structure definition is loaded and indexed, connections to
+        the miniservers and their websockets of lx_transport websocket
+        are opened, and the lists of rooms and categories are rendered.
+
+        :return: number of controls, None if the structure definition
+        can't be loaded
+        .. raises:: ValueError if lx_ip, lx_user or lx_password is
+        missing or lx_servers is invalid
+
+        """
+        if not self.connect():
+            return None
+        if self._transport == self.TRANSPORT_WEBSOCKET:
+            import loxwebsocket
+            for host, (user, password) in self._servers.items():
+                try:
+                    loxwebsocket.get_connection(host, user, password,
+                                                self._timeout)
+                except loxwebsocket.LoxWebSocketError as e:
+                    logger.debug(self.neuron_name +
+                                 ": Websocket of %s not available: %s",
+                                 host, e)
+        self.list_rooms()
+        self.list_categories()
+        logger.debug(self.neuron_name + ": Prewarmed %s with %d controls",
+                     ", ".join(self._servers), len(self._records))
+        return len(self._records)
+
+    def show_configinfo(self):
+        """
+        Print informations about the config to debug output.
+
+        Orders don't call it, the structure is walked on each call.
+
+        """
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        import loxdescribe
+        logger.debug(self.neuron_name + ": Loxone Structure Definition:")
+        for line in loxdescribe.format_description(self._model.describe()):
+            logger.debug(self.neuron_name + ": %s", line)
+
+    @loxstats.timed("structure_version")
+    def get_structure_version(self, host=None):
+        """
+        Request the version of the structure definition from the miniserver.
+
+        The version is the timestamp of the last modification of the
+        structure definition, e.g. "2017-03-12 10:11:12".
+
+        :param host: miniserver, default is lx_ip
+        :return: version str or None if the version can't be retrieved
+
+        """
+        host = host or self._host
+        try:
+            r = self._sessions[host].get("http://" + host + self.VERSION,
+                                         timeout=self._timeout)
+            r.raise_for_status()
+            version = r.json()['LL']['value']
+        except requests.exceptions.RequestException:
+            logger.debug(self.neuron_name +
+                         ': Structure Version Request failed.')
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.debug(self.neuron_name +
+                         ': Structure Version cannot be parsed.')
+            return None
+
+        if not isinstance(version, string_types):
+            return None
+        return version
+
+    @loxstats.timed("load_config")
+    def load_config(self):
+        """
+        Load the JSON Config File of the loxone miniserver.
+
+        The parsed structure is cached in memory and on disk. The cache
+        is revalidated with the structure version of the miniserver. The
+        full structure definition is only loaded if the version changed.
+
+        The structure definitions of several miniservers are loaded in
+        parallel and merged. Miniservers which can't be reached are left
+        out.
+
+        :return: true if config is loaded and parsed, false otherwise
+
+        """
+        hosts = list(self._servers)
+        models = self._run_parallel(
+            lambda host: self.load_model(self.get_structure_version(host),
+                                         host), hosts)
+        models = [(host, model) for host, model in zip(hosts, models)
+                  if model is not None]
+        if not models:
+            return False
+        if len(models) < len(hosts):
+            logger.debug(self.neuron_name + ": Structure Definition of %d "
+                         "of %d miniservers loaded", len(models), len(hosts))
+        self._apply_model(self._merge_models(models))
+        return True
+
+    def _merge_models(self, models):
+        """
+        Return one model of the models of several miniservers.
+
+        The merged model is cached in memory as long as the models are
+        the same.
+
+        :param models: list of tuples (host, loxmodel.LoxModel)
+        :return: loxmodel.LoxModel
+
+        """
+        if len(models) == 1 and models[0][0] == self._host:
+            return models[0][1]
+        key = ("merged",) + tuple(host for host, _ in models)
+        parts = [model for _, model in models]
+        with self._structure_cache_lock:
+            cached = self._structure_cache.get(key)
+        if cached is not None and all(
+                old is new for old, new in zip(cached['models'], parts)):
+            return cached['model']
+
+        model = loxmodel.LoxModel.merge(models)
+        with self._structure_cache_lock:
+            self._structure_cache[key] = {"models": parts, "model": model}
+        return model
+
+    @loxstats.timed("load_model")
+    def load_model(self, version, host=None):
+        """
+        Return the parsed structure definition of a version.
+
+        A cached structure of that version is used if there is one. The
+        instance itself is not changed.
+
+        :param version: current version of the structure definition or
+        None if unknown
+        :param host: miniserver, default is lx_ip
+        :return: loxmodel.LoxModel or None if it can't be loaded
+
+        """
+        host = host or self._host
+
+        # check if a cached structure is still valid
+        if version is not None:
+            model = self._get_cached_model(version, host)
+            if model is not None:
+                logger.debug(self.neuron_name +
+                             ': Structure Definition %s loaded from cache.',
+                             version)
+                return model
+        elif host == self._host and self._snapshot:
+            # the miniserver doesn't tell its version, e.g. over a slow
+            # link, the snapshot is the best guess
+            model = self._get_snapshot(None)
+            if model is not None:
+                logger.debug(self.neuron_name +
+                             ': Structure Definition loaded from snapshot '
+                             '%s.', self._snapshot)
+                return model
+
+        # load structure definition, parse it while it is received
+        import loxparser
+        try:
+            r = self._sessions[host].get("http://" + host +
+                                         self.STRUCTUREDEF,
+                                         timeout=self._timeout, stream=True)
+        except requests.exceptions.RequestException:
+            logger.debug(self.neuron_name +
+                         ': Structure Definition Request failed.')
+            return None
+
+        try:
+            r.raise_for_status()
+            r.raw.decode_content = True
+            raw = loxparser.parse(r.raw, self.TYPE_SUPPORTED)
+        except requests.exceptions.HTTPError:
+            logger.debug(self.neuron_name +
+                         ': Structure Definition Request failed with \
+                response: %r',
+                         r.text)
+            return None
+        except (requests.exceptions.RequestException,
+                requests.packages.urllib3.exceptions.HTTPError,
+                EnvironmentError):
+            logger.debug(self.neuron_name +
+                         ': Structure Definition Request failed.')
+            return None
+        except ValueError as e:
+            logger.debug(self.neuron_name +
+                         ': Structure Definition cannot be loaded,'
+                         'response: %s',
+                         e.args[0])
+            return None
+        except KeyError:
+            logger.debug(self.neuron_name +
+                         ': Structure Definition cannot be loaded. KeyError.')
+            return None
+        finally:
+            r.close()
+
+        # Parse structure
+        try:
+            model = loxmodel.LoxModel.from_structure(raw)
+            self.extract_controls(raw['controls'], model)
+            model.build_indexes()
+        except KeyError:
+            logger.debug(self.neuron_name +
+                         ': Structure Definition cannot be parsed. '
+                         'KeyError.')
+            return None
+# TODO: FIX Language check
+        # Check Language
+        # try:
+        #    language = self.profile['language']
+        # except KeyError:
+        #    language = 'en-US'
+        # if language.split('-')[1]==self._language:
+        #    raise ValueError("Home automation language is %s. But your
+        # profile language is set to %s",self._language,language)
+
+        # the structure itself knows its version, if the miniserver
+        # didn't tell us
+        if version is None:
+            version = raw.get('lastModified')
+        if isinstance(version, string_types):
+            self._set_cached_model(version, model, host)
+
+        return model
+
+    def _apply_model(self, model):
+        """
+        Use the given parsed structure definition in this instance.
+
+        :param model: loxmodel.LoxModel with indexes
+
+        """
+        self._model = model
+        self._language = model.language
+        self._location = model.location
+        self._roomtitle = model.roomtitle
+        self._rooms = model.rooms
+        self._controls = model.cats
+        self._records = model.records
+        self._indexes = model.indexes
+
+    def _get_cachefile(self, host=None):
+        """
+        Return the path of the on-disk structure cache of a miniserver.
+
+        :param host: miniserver, default is lx_ip
+        :return: path or None if the on-disk cache is disabled or its
+        directory is not safe, see loxcachedir
+
+        """
+        if not self._cachedir:
+            return None
+        try:
+            loxcachedir.secure(self._cachedir)
+        except OSError as e:
+            logger.debug(self.neuron_name +
+                         ': Structure cache not used: %s', e)
+            return None
+        host = host or self._host
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_',
+                      "%s_%s" % (host, self._get_credentials(host)[0]))
+        return os.path.join(self._cachedir, "structure_%s.json" % name)
+
+    def _get_cached_model(self, version, host=None):
+        """
+        Return the cached structure definition if its version matches.
+
+        The process-wide cache is checked first, the snapshot of lx_snapshot
+        second and the on-disk cache last.
+
+        :param version: current version of the structure definition
+        :param host: miniserver, default is lx_ip
+        :return: loxmodel.LoxModel or None if not cached or outdated
+
+        """
+        host = host or self._host
+        key = (host, self._get_credentials(host)[0])
+        with self._structure_cache_lock:
+            cached = self._structure_cache.get(key)
+        if cached is not None and cached['version'] == version:
+            self._stats.count("structure_cache", result="memory")
+            return cached['model']
+
+        model = None
+        if host == self._host and self._snapshot:
+            model = self._get_snapshot(version)
+            if model is not None:
+                self._stats.count("structure_cache", result="snapshot")
+
+        cachefile = self._get_cachefile(host)
+        if model is None and cachefile is not None and \
+                os.path.isfile(cachefile):
+            import loxsnapshot
+            try:
+                header, model = loxsnapshot.load(cachefile)
+            except (IOError, OSError, loxsnapshot.SnapshotError) as e:
+                logger.debug(self.neuron_name +
+                             ': Structure cache %s cannot be loaded: %s',
+                             cachefile, e)
+            else:
+                if header.get('version') == version:
+                    self._stats.count("structure_cache", result="disk")
+                else:
+                    model = None
+
+        if model is None:
+            self._stats.count("structure_cache", result="miss")
+            return None
+        with self._structure_cache_lock:
+            self._structure_cache[key] = {"version": version,
+                                          "model": model}
+        return model
+
+    def _get_snapshot(self, version):
+        """
+        Return the model of the snapshot of lx_snapshot.
+
+        The snapshot is read once and kept in memory until the file is
+        changed.
+
+        :param version: current version of the structure definition,
+        None if the miniserver doesn't tell it
+        :return: loxmodel.LoxModel or None if the snapshot can't be read
+        or is of another version
+
+        """
+        key = ("snapshot", self._snapshot)
+        try:
+            mtime = os.path.getmtime(self._snapshot)
+        except OSError as e:
+            logger.debug(self.neuron_name +
+                         ': Snapshot %s cannot be read: %s',
+                         self._snapshot, e)
+            return None
+        with self._structure_cache_lock:
+            cached = self._structure_cache.get(key)
+        if cached is None or cached['mtime'] != mtime:
+            import loxsnapshot
+            try:
+                header, model = loxsnapshot.load(self._snapshot)
+            except (IOError, OSError, loxsnapshot.SnapshotError) as e:
+                logger.debug(self.neuron_name +
+                             ': Snapshot %s cannot be loaded: %s',
+                             self._snapshot, e)
+                return None
+            cached = {"version": header.get('version'), "model": model,
+                      "mtime": mtime}
+            with self._structure_cache_lock:
+                self._structure_cache[key] = cached
+        if version is not None and cached['version'] != version:
+            logger.debug(self.neuron_name +
+                         ': Snapshot %s is of version %s, not %s',
+                         self._snapshot, cached['version'], version)
+            return None
+        return cached['model']
+
+    def _set_cached_model(self, version, model, host=None):
+        """
+        Store the parsed structure definition in memory and on disk.
+
+        :param version: version of the structure definition
+        :param model: loxmodel.LoxModel
+        :param host: miniserver, default is lx_ip
+
+        """
+        host = host or self._host
+        with self._structure_cache_lock:
+            self._structure_cache[(host, self._get_credentials(host)[0])] = {
+                "version": version, "model": model}
+
+        cachefile = self._get_cachefile(host)
+        if cachefile is None:
+            return
+        import loxsnapshot
+        try:
+            loxsnapshot.dump(cachefile, model, version, host)
+        except (IOError, OSError) as e:
+            logger.debug(self.neuron_name +
+                         ': Structure cache %s cannot be written: %s',
+                         cachefile, e)
+
+    @loxstats.timed("extract_controls")
+    def extract_controls(self, jsonconfig, model=None):
+        """
+        Parse the given JSON and extract the control information.
+
+        :param jsonconfig: controls block of the json file
+        :param model: loxmodel.LoxModel to add the controls to, default
+        is the model of this instance
+        .. raises:: KeyError if the category of a control is unknown
+
+        """
+        if model is None:
+            model = self._model
+        model.add_controls(jsonconfig, self.TYPES)
+
+
+class _ServerLoader(object):
+
+    """
+    Loader of the structure definition of one miniserver.
+
+    The refresher of the miniserver keeps it for the life of the
+    process, so it only keeps what loading needs, not the client
+    creating it.
+
+    """
+
+    def __init__(self, host, user, password, session, cachedir,
+                 timeout=loxsession.TIMEOUT, snapshot=None):
+        """
+        Load by a client of its own.
+
+        :param host: miniserver
+        :param user: miniserver user
+        :param password: miniserver user password
+        :param session: shared session of the miniserver
+        :param cachedir: directory of the on-disk structure cache
+        :param timeout: timeout of the requests in seconds
+        :param snapshot: snapshot used if its version is current
+
+        """
+        self._host = host
+        self._client = LoxClient(lx_ip=host, lx_user=user,
+                                 lx_password=password, lx_cachedir=cachedir,
+                                 lx_timeout=timeout, lx_snapshot=snapshot)
+        self._client._servers[host] = (user, password)
+        self._client._sessions[host] = session
+
+    def get_structure_version(self):
+        """Return the version of the structure definition."""
+        return self._client.get_structure_version(self._host)
+
+    def load_model(self, version):
+        """Return the parsed structure definition of a version."""
+        return self._client.load_model(version, self._host)
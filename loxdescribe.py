@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Describe the structure definition of a miniserver.
+
+Tells the numbers of rooms, categories and controls, the control types
+which are not supported, rooms without supported controls and names
+spoken the same way. Orders never do this work, only this command and
+the action describe of the neuron.
+
+Describe a miniserver, a saved structure definition or a snapshot:
+python loxdescribe.py --ip 192.168.0.11 --user admin --password secret
+python loxdescribe.py --structure Loxapp3.json
+python loxdescribe.py --snapshot structure.json
+
+"""
+import argparse
+import json
+import logging
+import sys
+
+import loxsnapshot
+
+logger = logging.getLogger("kalliope")
+
+
+def format_description(description):
+    """
+    Return a description as lines of text.
+
+    :param description: result of loxmodel.LoxModel.describe()
+    :return: list of str
+
+    """
+    lines = [
+        "Location: %s" % description['location'],
+        "Language: %s" % description['language'],
+        "Rooms: %d" % description['rooms'],
+        "Categories: %d" % description['cats'],
+        "Controls: %d" % description['controls'],
+    ]
+    for ctype, count in sorted(description['types'].items()):
+        lines.append("      %s: %d" % (ctype, count))
+    lines.append("Unsupported controls: %d" %
+                 sum(description['unsupported'].values()))
+    for ctype, count in sorted(description['unsupported'].items()):
+        lines.append("      %s: %d" % (ctype, count))
+    lines.append("Rooms without controls: %d" %
+                 len(description['orphaned_rooms']))
+    for name in description['orphaned_rooms']:
+        lines.append("      %s" % name)
+    lines.append("Names spoken the same: %d" %
+                 len(description['duplicates']))
+    for name in description['duplicates']:
+        lines.append("      %s" % name)
+    return lines
+
+
+def main(argv=None):
+    """
+    Print the description of a miniserver, structure or snapshot.
+
+    :param argv: command line arguments, default sys.argv[1:]
+    :return: exit code
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--snapshot",
+                        help="snapshot instead of a miniserver")
+    parser.add_argument("--structure",
+                        help="saved Loxapp3.json instead of a miniserver")
+    parser.add_argument("--variables",
+                        help="Kalliope variables file with lx_ip, lx_user "
+                        "and lx_password")
+    parser.add_argument("--ip", dest="lx_ip", help="miniserver ip")
+    parser.add_argument("--user", dest="lx_user", help="miniserver user")
+    parser.add_argument("--password", dest="lx_password",
+                        help="miniserver user password")
+    parser.add_argument("--json", action="store_true",
+                        help="print the description as JSON")
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.variables is not None:
+        from loxprewarm import load_variables
+        parameters.update(load_variables(args.variables))
+    # the command line overrides the variables file
+    for name in ("lx_ip", "lx_user", "lx_password"):
+        if getattr(args, name) is not None:
+            parameters[name] = getattr(args, name)
+
+    try:
+        if args.snapshot is not None:
+            _, model = loxsnapshot.load(args.snapshot)
+        elif args.structure is not None:
+            with open(args.structure, 'rb') as f:
+                _, model = loxsnapshot.from_structure(f)
+        else:
+            _, model = loxsnapshot.from_miniserver(**parameters)
+    except Exception as e:
+        logger.error("Loxscontrol: Description failed: %s", e)
+        return 1
+    description = model.describe()
+    if args.json:
+        print(json.dumps(description, indent=2, sort_keys=True))
+    else:
+        print("\n".join(format_description(description)))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    sys.exit(main())
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Matching of spoken names against the names of control elements."""
+
+import re
+import unicodedata
+
+# Letters spelled out by voice recognition
+TRANSLITERATION = {u"\xe4": u"ae", u"\xf6": u"oe", u"\xfc": u"ue",
+                   u"\xdf": u"ss"}
+
+# Number words replaced by digits, after transliteration. "ein" and
+# "eine" are missing on purpose, they are articles and "switch on".
+NUMBERS = {u"null": u"0", u"zero": u"0",
+           u"eins": u"1", u"one": u"1",
+           u"zwei": u"2", u"zwo": u"2", u"two": u"2",
+           u"drei": u"3", u"three": u"3",
+           u"vier": u"4", u"four": u"4",
+           u"fuenf": u"5", u"five": u"5",
+           u"sechs": u"6", u"six": u"6",
+           u"sieben": u"7", u"seven": u"7",
+           u"acht": u"8", u"eight": u"8",
+           u"neun": u"9", u"nine": u"9",
+           u"zehn": u"10", u"ten": u"10",
+           u"elf": u"11", u"eleven": u"11",
+           u"zwoelf": u"12", u"twelve": u"12"}
+
+_SEPARATORS = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def tokenize(name):
+    """
+    Return the normalized words of a name.
+
+    Names are lower case, umlauts are transliterated, other accents
+    and punctuation removed and number words replaced by digits.
+
+    :param name: name of a control element or spoken name
+    :return: list of words
+
+    """
+    if isinstance(name, bytes):
+        name = name.decode('utf-8')
+    name = name.lower()
+    for char, replacement in TRANSLITERATION.items():
+        name = name.replace(char, replacement)
+    name = u"".join(char for char in unicodedata.normalize('NFKD', name)
+                    if not unicodedata.combining(char))
+    return [NUMBERS.get(word, word)
+            for word in _SEPARATORS.sub(u" ", name).split()]
+
+
+def normalize_name(name):
+    """
+    Return the normalized form of a name used for lookups.
+
+    :param name: name of a control element
+    :return: normalized words separated by single spaces
+
+    """
+    return u" ".join(tokenize(name))
+
+
+def cologne_phonetic(word):
+    """
+    Return the code of a word after the Koelner Phonetik.
+
+    Words sounding alike in German get the same code, e.g. "Meier"
+    and "Mayr". Characters which are not letters are ignored.
+
+    :param word: normalized word
+    :return: code of digits, empty if the word has no letters
+
+    """
+    codes = []
+    for index, char in enumerate(word):
+        before = word[index - 1] if index > 0 else u""
+        after = word[index + 1] if index + 1 < len(word) else u""
+        if char in u"aeijouy":
+            code = u"0"
+        elif char == u"b":
+            code = u"1"
+        elif char == u"p":
+            code = u"3" if after == u"h" else u"1"
+        elif char in u"dt":
+            code = u"8" if after and after in u"csz" else u"2"
+        elif char in u"fvw":
+            code = u"3"
+        elif char in u"gkq":
+            code = u"4"
+        elif char == u"c":
+            if index == 0:
+                code = u"4" if after and after in u"ahkloqrux" else u"8"
+            elif before in u"sz" or not after or after not in u"ahkoqux":
+                code = u"8"
+            else:
+                code = u"4"
+        elif char == u"x":
+            code = u"8" if before and before in u"ckq" else u"48"
+        elif char == u"l":
+            code = u"5"
+        elif char in u"mn":
+            code = u"6"
+        elif char == u"r":
+            code = u"7"
+        elif char in u"sz":
+            code = u"8"
+        else:
+            # h, digits and everything else
+            continue
+        codes.append(code)
+
+    # collapse repeated codes, drop vowels except at the beginning
+    result = []
+    for code in u"".join(codes):
+        if result and result[-1] == code:
+            continue
+        result.append(code)
+    return u"".join(code for index, code in enumerate(result)
+                    if code != u"0" or index == 0)
+
+
+class NameMatcher(object):
+
+    """
+    Index of names for matching spoken names.
+
+    Each word of each name is indexed as it is and by its phonetic
+    code. A name matches if enough of its words are in the spoken
+    name, in any order. Candidates are ranked by their score.
+
+    """
+
+    # Score of a word found as it is and of a word sounding alike
+    EXACT = 1.0
+    PHONETIC = 0.75
+
+    # Min. share of the words of a name found in the spoken name. Must
+    # be above 0.5, so that names of several words need two words found.
+    MIN_SCORE = 0.75
+
+    def __init__(self, names):
+        """
+        Index names.
+
+        :param names: iterable of tuples (key, name), key is returned
+        by match()
+
+        """
+        self._keys = []
+        self._sizes = []
+        # word -> entries with that word
+        self._words = {}
+        # entries with a name of one word
+        self._single = set()
+        # phonetic code -> list of words with that code
+        self._phonetic = {}
+        for key, name in names:
+            words = set(tokenize(name))
+            entry = len(self._keys)
+            self._keys.append(key)
+            self._sizes.append(len(words))
+            if len(words) == 1:
+                self._single.add(entry)
+            for word in words:
+                entries = self._words.get(word)
+                if entries is None:
+                    entries = self._words[word] = []
+                    code = cologne_phonetic(word)
+                    if code:
+                        self._phonetic.setdefault(code, []).append(word)
+                entries.append(entry)
+        self._words = dict((word, frozenset(entries))
+                           for word, entries in self._words.items())
+        self._single = frozenset(self._single)
+
+    def __len__(self):
+        """Return the number of names."""
+        return len(self._keys)
+
+    def to_dict(self):
+        """
+        Return the index as dict of plain types, e.g. to store it as JSON.
+
+        :return: dict with keys, sizes, words, single and phonetic
+
+        """
+        return {"keys": self._keys, "sizes": self._sizes,
+                "words": dict((word, sorted(entries))
+                              for word, entries in self._words.items()),
+                "single": sorted(self._single),
+                "phonetic": self._phonetic}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create an index from the result of to_dict() without tokenizing.
+
+        :param data: dict with keys, sizes, words, single and phonetic
+        :return: NameMatcher
+        .. raises:: KeyError, TypeError or ValueError if data is invalid
+
+        """
+        matcher = cls(())
+        matcher._keys = list(data['keys'])
+        matcher._sizes = list(data['sizes'])
+        if len(matcher._sizes) != len(matcher._keys):
+            raise ValueError("sizes don't match keys")
+        matcher._words = dict((word, frozenset(entries))
+                              for word, entries in data['words'].items())
+        matcher._single = frozenset(data['single'])
+        matcher._phonetic = dict(data['phonetic'])
+        return matcher
+
+    def rank(self, name):
+        """
+        Return all candidates for a spoken name, best first.
+
+        The score of a candidate is the share of its words found in
+        name, words sounding alike count less. Candidates with the
+        same score are ranked by the number of words found.
+
+        :param name: spoken name
+        :return: list of tuples (score, words found, key)
+
+        """
+        # best score of each indexed word
+        weights = {}
+        for word in set(tokenize(name)):
+            if word in self._words:
+                weights[word] = self.EXACT
+            code = cologne_phonetic(word)
+            for similar in self._phonetic.get(code, ()) if code else ():
+                weights.setdefault(similar, self.PHONETIC)
+
+        # candidates are names of one word and names with at least
+        # two words found, intersecting sets avoids counting every name
+        # with a frequent word
+        found = [(self._words[word], weight)
+                 for word, weight in weights.items()]
+        candidates = set()
+        for index, (entries, _) in enumerate(found):
+            candidates.update(entries & self._single)
+            for other, _ in found[index + 1:]:
+                candidates.update(entries & other)
+
+        ranked = []
+        for entry in candidates:
+            score = 0.0
+            count = 0
+            for entries, weight in found:
+                if entry in entries:
+                    score += weight
+                    count += 1
+            score = score / self._sizes[entry]
+            if score >= self.MIN_SCORE:
+                ranked.append((-score, -count, entry))
+        ranked.sort()
+        return [(-score, -count, self._keys[entry])
+                for score, count, entry in ranked]
+
+    def match(self, name):
+        """
+        Return the best matching keys for a spoken name.
+
+        :param name: spoken name
+        :return: list of keys with the best score, several if the name
+        is ambiguous, empty if nothing matches
+
+        """
+        ranked = self.rank(name)
+        if not ranked:
+            return []
+        best = ranked[0][:2]
+        return [key for score, count, key in ranked
+                if (score, count) == best]
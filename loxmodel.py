@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""Parsed structure definition of a miniserver, kept compact in memory."""
+
+import logging
+
+import loxmatch
+
+logger = logging.getLogger("kalliope")
+
+
+class ControlRecord(object):
+
+    """
+    Supported control element of the structure definition.
+
+    Records have slots instead of a dict per control, so that large
+    structure definitions stay small in memory. States are kept as flat
+    tuple (name, uuid, name, uuid, ...).
+
+    """
+
+    __slots__ = ("uuid", "uidaction", "name", "room", "type", "cat",
+                 "_states", "host")
+
+    def __init__(self, uuid, uidaction, name, room, ctype, cat, states,
+                 host=None):
+        """
+        Create a record.
+
+        :param uuid: uuid of the control
+        :param uidaction: uuid used to send commands to the control
+        :param name: name of the control
+        :param room: uuid of the room
+        :param ctype: type of the control, e.g. Switch
+        :param cat: uuid of the category
+        :param states: tuple (state name, state uuid, ...)
+        :param host: miniserver owning the control if the model merges
+        several miniservers, None otherwise
+
+        """
+        self.uuid = uuid
+        self.uidaction = uidaction
+        self.name = name
+        self.room = room
+        self.type = ctype
+        self.cat = cat
+        self._states = states
+        self.host = host
+
+    @property
+    def states(self):
+        """Return a dict state name -> state uuid."""
+        return dict(zip(self._states[::2], self._states[1::2]))
+
+    def get_state(self, statename):
+        """
+        Return the uuid of a state.
+
+        :param statename: name of the state, e.g. active
+        :return: uuid of the state or None if the control has no such state
+
+        """
+        for index in range(0, len(self._states), 2):
+            if self._states[index] == statename:
+                return self._states[index + 1]
+        return None
+
+    def to_list(self):
+        """
+        Return the fields of the record as arguments of add_control.
+
+        The host is not included, it is set when models are merged.
+
+        """
+        return [self.uuid, self.uidaction, self.name, self.room, self.type,
+                self.cat, self.states]
+
+
+class LoxModel(object):
+
+    """
+    Rooms, categories and controls of a miniserver with lookup indexes.
+
+    Controls are stored as records in a list. Categories and indexes
+    refer to them by their position in that list. Room, type and
+    category strings are shared by all controls using them.
+
+    A model is not changed after its indexes are built, so it can be
+    shared by all neuron instances of the process.
+
+    """
+
+    def __init__(self, language=None, location=None, roomtitle=None):
+        """
+        Create an empty model.
+
+        :param language: language code of the structure definition
+        :param location: location of the miniserver
+        :param roomtitle: title used for rooms
+
+        """
+        self.language = language
+        self.location = location
+        self.roomtitle = roomtitle
+        self.rooms = {}
+        self.cats = {}
+        self.records = []
+        self.indexes = None
+        # lists rendered by the neuron: key -> str, filled on first use
+        self.lists = {}
+        # controls of the structure definition which are not supported:
+        # control type -> number of controls
+        self.unsupported = {}
+        self._strings = {}
+
+    def intern(self, value):
+        """
+        Return the shared instance of a string equal to value.
+
+        :param value: string
+        :return: equal string used by the whole model
+
+        """
+        return self._strings.setdefault(value, value)
+
+    def add_room(self, uuid, name):
+        """
+        Add a room.
+
+        :param uuid: uuid of the room
+        :param name: name of the room
+
+        """
+        uuid = self.intern(uuid)
+        self.rooms[uuid] = {"name": name, "uid": uuid}
+
+    def add_cat(self, uuid, name, cattype):
+        """
+        Add a category.
+
+        :param uuid: uuid of the category
+        :param name: name of the category
+        :param cattype: type of the category, e.g. lights
+
+        """
+        uuid = self.intern(uuid)
+        self.cats[uuid] = {"name": name, "uid": uuid,
+                           "type": self.intern(cattype), "controls": []}
+
+    def add_control(self, uuid, uidaction, name, room, ctype, cat,
+                    states=None, host=None):
+        """
+        Add a control to its category.
+
+        :param uuid: uuid of the control
+        :param uidaction: uuid used to send commands to the control
+        :param name: name of the control
+        :param room: uuid of the room
+        :param ctype: type of the control, e.g. Switch
+        :param cat: uuid of the category
+        :param states: dict state name -> state uuid
+        :param host: miniserver owning the control, None if the model
+        has only one miniserver
+        :return: index of the control
+        .. raises:: KeyError if the category is unknown
+
+        """
+        category = self.cats[cat]
+        flat = []
+        for statename, stateuuid in sorted((states or {}).items()):
+            flat.extend((self.intern(statename), stateuuid))
+        index = len(self.records)
+        self.records.append(ControlRecord(uuid, uidaction, name,
+                                          self.intern(room),
+                                          self.intern(ctype),
+                                          category['uid'], tuple(flat),
+                                          host))
+        category['controls'].append(index)
+        return index
+
+    def add_controls(self, controls, types):
+        """
+        Add the supported controls of a structure definition.
+
+        The registry of types tells which controls are used and which
+        subcontrols are added. Subcontrols are in the room and category
+        of their control.
+
+        :param controls: controls block of the structure definition
+        :param types: dict control type -> loxtypes.ControlType
+        .. raises:: KeyError if the category of a control is unknown
+
+        """
+        for control in controls:
+            config = controls[control]
+            controltype = types.get(config['type'])
+            if controltype is None:
+                continue
+            if controltype.standalone:
+                self.add_control(control, config['uuidAction'],
+                                 config['name'], config['room'],
+                                 config['type'], config['cat'],
+                                 config.get('states'))
+            if not controltype.subcontrols:
+                continue
+            subcontrols = config.get('subControls', {})
+            for subcontrol in subcontrols:
+                subconfig = subcontrols[subcontrol]
+                subtype = types.get(subconfig['type'])
+                if subtype is None or not subtype.standalone:
+                    continue
+                self.add_control(subcontrol, subconfig['uuidAction'],
+                                 subconfig['name'], config['room'],
+                                 subconfig['type'], config['cat'],
+                                 subconfig.get('states'))
+
+    def build_indexes(self, names=None, roomnames=None):
+        """
+        Build the lookup indexes of the controls.
+
+        Indexes are built once after all controls are added: uuid ->
+        control (control uuid and action uuid), room -> controls,
+        category type -> controls and control type -> controls. Controls
+        are given by their index. Names of controls and rooms are
+        indexed by a loxmatch.NameMatcher returning control indexes and
+        room uuids.
+
+        :param names: NameMatcher of the control names, e.g. of a
+        snapshot, built if not given
+        :param roomnames: NameMatcher of the room names, built if not
+        given
+
+        """
+        indexes = {"uuid": {}, "room": {}, "cattype": {}, "type": {}}
+
+        if names is None:
+            names = loxmatch.NameMatcher(
+                (index, record.name)
+                for index, record in enumerate(self.records))
+        if roomnames is None:
+            roomnames = loxmatch.NameMatcher(
+                (uuid, room['name']) for uuid, room in self.rooms.items())
+        indexes['name'] = names
+        indexes['roomname'] = roomnames
+
+        for index, record in enumerate(self.records):
+            indexes['uuid'][record.uuid] = index
+            indexes['uuid'][record.uidaction] = index
+            indexes['room'].setdefault(record.room, []).append(index)
+            cattype = self.cats[record.cat]['type']
+            indexes['cattype'].setdefault(cattype, []).append(index)
+            indexes['type'].setdefault(record.type, []).append(index)
+
+        self.indexes = indexes
+        # the model is complete, nothing is interned anymore
+        self._strings = {}
+
+    def get_record(self, uuid):
+        """
+        Return the control with a control or action uuid.
+
+        :param uuid: uuid of the control
+        :return: ControlRecord or None if not found
+
+        """
+        index = self.indexes['uuid'].get(uuid)
+        if index is None:
+            return None
+        return self.records[index]
+
+    def describe(self):
+        """
+        Return diagnostics of the model, e.g. to check a structure.
+
+        Nothing is kept, each call walks all rooms and controls again.
+
+        :return: dict with location, language, the numbers of rooms,
+        cats and controls, types (control type -> number of controls),
+        unsupported (control type -> number of controls left out),
+        orphaned_rooms (names of rooms without supported controls) and
+        duplicates (names shared by several controls or rooms, sorted)
+
+        """
+        types = {}
+        used = set()
+        for record in self.records:
+            types[record.type] = types.get(record.type, 0) + 1
+            used.add(record.room)
+
+        # names spoken the same way, controls and rooms apart
+        duplicates = set()
+        for names in ([record.name for record in self.records],
+                      [room['name'] for room in self.rooms.values()]):
+            spoken = {}
+            for name in names:
+                spoken.setdefault(loxmatch.normalize_name(name),
+                                  []).append(name)
+            for same in spoken.values():
+                if len(same) > 1:
+                    duplicates.update(same)
+
+        return {"location": self.location,
+                "language": self.language,
+                "rooms": len(self.rooms),
+                "cats": len(self.cats),
+                "controls": len(self.records),
+                "types": types,
+                "unsupported": dict(self.unsupported),
+                "orphaned_rooms": sorted(room['name'] for uuid, room in
+                                         self.rooms.items()
+                                         if uuid not in used),
+                "duplicates": sorted(duplicates)}
+
+    def to_dict(self):
+        """
+        Return the model as dict of plain types, e.g. to store it as JSON.
+
+        Indexes are not included, from_dict() builds them again.
+
+        :return: dict with info, rooms, cats, controls and unsupported
+
+        """
+        return {"info": {"languageCode": self.language,
+                         "location": self.location,
+                         "roomTitle": self.roomtitle},
+                "rooms": dict((uuid, room['name'])
+                              for uuid, room in self.rooms.items()),
+                "cats": dict((uuid, [cat['name'], cat['type']])
+                             for uuid, cat in self.cats.items()),
+                "controls": [record.to_list() for record in self.records],
+                "unsupported": dict(self.unsupported)}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a model from the result of to_dict().
+
+        :param data: dict with info, rooms, cats and controls
+        :return: LoxModel with indexes
+        .. raises:: KeyError, TypeError or ValueError if data is invalid
+
+        """
+        info = data['info']
+        model = cls(info['languageCode'], info['location'],
+                    info['roomTitle'])
+        for uuid, name in data['rooms'].items():
+            model.add_room(uuid, name)
+        for uuid, (name, cattype) in data['cats'].items():
+            model.add_cat(uuid, name, cattype)
+        model.unsupported = dict(data.get('unsupported', {}))
+        for fields in data['controls']:
+            model.add_control(*fields)
+        model.build_indexes()
+        return model
+
+    def to_snapshot(self):
+        """
+        Return the model incl. its name indexes as dict of plain types.
+
+        Unlike to_dict(), rooms, types, categories and state names of
+        the controls refer to a table of strings and the name indexes
+        are included, so that from_snapshot() neither interns nor
+        tokenizes. The other indexes are quick to build again.
+
+        :return: dict with info, rooms, cats, strings, controls, names
+        and roomnames
+
+        """
+        strings = {}
+
+        def ref(value):
+            return strings.setdefault(value, len(strings))
+
+        data = self.to_dict()
+        data['controls'] = [
+            [record.uuid, record.uidaction, record.name, ref(record.room),
+             ref(record.type), ref(record.cat),
+             [ref(value) if index % 2 == 0 else value
+              for index, value in enumerate(record._states)]]
+            for record in self.records]
+        data['strings'] = sorted(strings, key=strings.get)
+        data['names'] = self.indexes['name'].to_dict()
+        data['roomnames'] = self.indexes['roomname'].to_dict()
+        return data
+
+    @classmethod
+    def from_snapshot(cls, data):
+        """
+        Create a model from the result of to_snapshot().
+
+        :param data: dict with info, rooms, cats, strings, controls,
+        names and roomnames
+        :return: LoxModel with indexes
+        .. raises:: KeyError, TypeError, ValueError or IndexError if data
+        is invalid
+
+        """
+        info = data['info']
+        model = cls(info['languageCode'], info['location'],
+                    info['roomTitle'])
+        for uuid, name in data['rooms'].items():
+            model.add_room(uuid, name)
+        for uuid, (name, cattype) in data['cats'].items():
+            model.add_cat(uuid, name, cattype)
+        model.unsupported = dict(data.get('unsupported', {}))
+        strings = [model.intern(value) for value in data['strings']]
+        cats = model.cats
+        records = model.records
+        for uuid, uidaction, name, room, ctype, cat, states in \
+                data['controls']:
+            category = cats[strings[cat]]
+            category['controls'].append(len(records))
+            states[::2] = [strings[value] for value in states[::2]]
+            records.append(ControlRecord(uuid, uidaction, name,
+                                         strings[room], strings[ctype],
+                                         category['uid'], tuple(states)))
+        names = loxmatch.NameMatcher.from_dict(data['names'])
+        if len(names) != len(records):
+            raise ValueError("name index doesn't match the controls")
+        model.build_indexes(names,
+                            loxmatch.NameMatcher.from_dict(data['roomnames']))
+        return model
+
+    @classmethod
+    def from_structure(cls, raw):
+        """
+        Create a model of the info, rooms and categories of a structure.
+
+        Controls are added by add_controls(), then the indexes are built.
+
+        :param raw: result of loxparser.parse()
+        :return: LoxModel without controls
+        .. raises:: KeyError if a section or field is missing
+
+        """
+        info = raw['msInfo']
+        model = cls(info['languageCode'], info['location'],
+                    info['roomTitle'])
+        for room in raw['rooms']:
+            model.add_room(room, raw['rooms'][room]['name'])
+        for cat in raw['cats']:
+            model.add_cat(cat, raw['cats'][cat]['name'],
+                          raw['cats'][cat]['type'])
+        model.unsupported = dict(raw.get('unsupported', {}))
+        return model
+
+    @classmethod
+    def from_controls(cls, controls, rooms=None):
+        """
+        Create a model from categories with nested controls.
+
+        This is the format of the lx_structuredef parameter:
+        {cat uuid: {"name", "type", "controls": {control uuid: {"name",
+        "uidAction", "room", "type", "states"}}}}. controls is not
+        changed.
+
+        :param controls: dict of categories
+        :param rooms: dict room uuid -> {"name"}
+        :return: LoxModel with indexes
+        .. raises:: KeyError if a field is missing
+
+        """
+        model = cls()
+        for uuid, room in (rooms or {}).items():
+            model.add_room(uuid, room['name'])
+        for cat, category in controls.items():
+            model.add_cat(cat, category['name'], category['type'])
+            for uuid, control in category['controls'].items():
+                model.add_control(uuid, control['uidAction'],
+                                  control['name'], control['room'],
+                                  control['type'], cat,
+                                  control.get('states'))
+        model.build_indexes()
+        return model
+
+    @classmethod
+    def merge(cls, models):
+        """
+        Create one model of several miniservers.
+
+        The miniservers of a client-gateway setup share their rooms and
+        categories, each control is owned by one miniserver. Its record
+        tells the host, so that commands are sent to it. A control
+        reported by several miniservers, e.g. the same miniserver given
+        twice, is owned by the first one. The models are not changed.
+
+        :param models: list of tuples (host, LoxModel), the info of the
+        first model is used
+        :return: LoxModel with indexes
+
+        """
+        first = models[0][1]
+        merged = cls(first.language, first.location, first.roomtitle)
+        owners = {}
+        for host, model in models:
+            for uuid, room in model.rooms.items():
+                if uuid not in merged.rooms:
+                    merged.add_room(uuid, room['name'])
+            for uuid, cat in model.cats.items():
+                if uuid not in merged.cats:
+                    merged.add_cat(uuid, cat['name'], cat['type'])
+            # hosts already owning controls of this miniserver
+            conflicts = set()
+            for record in model.records:
+                if record.uuid in owners:
+                    conflicts.add(owners[record.uuid])
+                    continue
+                owners[record.uuid] = host
+                merged.add_control(*record.to_list(),
+                                   host=merged.intern(host))
+            if conflicts:
+                logger.debug("Loxscontrol: Controls of %s are already "
+                             "owned by %s, they are sent there", host,
+                             ", ".join(sorted(conflicts)))
+            for ctype, count in model.unsupported.items():
+                merged.unsupported[ctype] = \
+                    merged.unsupported.get(ctype, 0) + count
+        merged.build_indexes()
+        return merged
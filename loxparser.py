@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Single-pass parser for the structure definition of a miniserver."""
+
+import json
+
+try:
+    from ijson.common import JSONError, ObjectBuilder
+    try:
+        import ijson.backends.yajl2_c as ijson
+    except ImportError:
+        import ijson
+except ImportError:
+    ijson = None
+
+# Fields kept per section, everything else is dropped while parsing
+INFO_FIELDS = ("languageCode", "location", "roomTitle")
+ROOM_FIELDS = ("name", "uuid")
+CAT_FIELDS = ("name", "uuid", "type")
+CONTROL_FIELDS = ("name", "type", "uuidAction", "room", "cat", "states")
+
+# Sections of the structure definition holding items by uuid
+SECTIONS = ("rooms", "cats", "controls")
+
+
+def is_streaming():
+    """Return True if the structure is parsed while it is read."""
+    return ijson is not None
+
+
+def parse(fileobj, types):
+    """
+    Parse a structure definition, keep only the fields used.
+
+    Controls of types not in types are dropped, as are their
+    subcontrols, and counted by type. If ijson is installed, the
+    structure is parsed while it is read and the full document is never
+    in memory.
+
+    :param fileobj: file-like object with Loxapp3.json
+    :param types: control types to keep
+    :return: dict with lastModified, msInfo, rooms, cats, controls and
+    unsupported (control type -> number of controls dropped)
+    .. raises:: ValueError if the structure can't be parsed
+
+    """
+    if ijson is None:
+        return prune(json.load(fileobj), types)
+
+    try:
+        return _parse_stream(fileobj, types)
+    except JSONError as e:
+        raise ValueError("Invalid structure definition: %s" % e)
+
+
+def prune(raw, types):
+    """
+    Return the fields used of a decoded structure definition.
+
+    :param raw: decoded Loxapp3.json
+    :param types: control types to keep
+    :return: dict with lastModified, msInfo, rooms, cats, controls and
+    unsupported
+    .. raises:: ValueError if a section is missing
+
+    """
+    try:
+        structure = {"lastModified": raw.get('lastModified'),
+                     "msInfo": _pick(raw['msInfo'], INFO_FIELDS),
+                     "rooms": {}, "cats": {}, "controls": {},
+                     "unsupported": {}}
+        for uuid, room in raw['rooms'].items():
+            structure['rooms'][uuid] = _pick(room, ROOM_FIELDS)
+        for uuid, cat in raw['cats'].items():
+            structure['cats'][uuid] = _pick(cat, CAT_FIELDS)
+        for uuid, control in raw['controls'].items():
+            pruned = prune_control(control, types)
+            if pruned is not None:
+                structure['controls'][uuid] = pruned
+            else:
+                _count_unsupported(structure, control.get('type'))
+    except (KeyError, AttributeError, TypeError) as e:
+        raise ValueError("Invalid structure definition: %r" % e)
+    return structure
+
+
+def prune_control(control, types):
+    """
+    Return the fields used of a control and its subcontrols.
+
+    :param control: decoded control
+    :param types: control types to keep
+    :return: pruned control or None if its type is not kept
+
+    """
+    if control.get('type') not in types:
+        return None
+    pruned = _pick(control, CONTROL_FIELDS)
+    subcontrols = {}
+    for uuid, subcontrol in control.get('subControls', {}).items():
+        subcontrol = prune_control(subcontrol, types)
+        if subcontrol is not None:
+            subcontrols[uuid] = subcontrol
+    if 'subControls' in control:
+        pruned['subControls'] = subcontrols
+    return pruned
+
+
+def _count_unsupported(structure, ctype):
+    """Count a control of a type which is not kept."""
+    unsupported = structure['unsupported']
+    unsupported[ctype] = unsupported.get(ctype, 0) + 1
+
+
+def _pick(item, fields):
+    """Return a dict with the given fields of item."""
+    return dict((field, item[field]) for field in fields if field in item)
+
+
+def _parse_stream(fileobj, types):
+    """
+    Parse a structure definition from the ijson event stream.
+
+    Each room, category and control is built on its own, pruned and
+    stored. Building a control stops as soon as its type turns out
+    to be not supported.
+
+    :param fileobj: file-like object with Loxapp3.json
+    :param types: control types to keep
+    :return: dict with lastModified, msInfo, rooms, cats, controls and
+    unsupported
+
+    """
+    structure = {"lastModified": None, "msInfo": None,
+                 "rooms": {}, "cats": {}, "controls": {},
+                 "unsupported": {}}
+    sections = set()
+    builder = None
+    item = None
+    typeprefix = None
+    skip = None
+
+    for prefix, event, value in ijson.parse(fileobj):
+        # unsupported control, ignore everything until its end
+        if skip is not None:
+            if prefix == skip and event == 'end_map':
+                skip = None
+            continue
+
+        # item is being built
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == item and event == 'end_map':
+                _store(structure, item, builder.value, types)
+                builder = None
+            elif prefix == typeprefix and value not in types:
+                _count_unsupported(structure, value)
+                builder = None
+                skip = item
+            continue
+
+        if event == 'start_map':
+            section, _, key = prefix.partition(".")
+            if prefix in SECTIONS:
+                sections.add(prefix)
+            elif prefix == "msInfo" or \
+                    (section in SECTIONS and key and "." not in key):
+                item = prefix
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                # only the type of controls is checked while building
+                typeprefix = prefix + ".type" if section == "controls" \
+                    else None
+        elif prefix == "lastModified" and event == 'string':
+            structure['lastModified'] = value
+
+    if structure['msInfo'] is None or len(sections) != len(SECTIONS):
+        raise ValueError("Invalid structure definition: section missing")
+    return structure
+
+
+def _store(structure, item, value, types):
+    """Prune a completely built item and store it in structure."""
+    if item == "msInfo":
+        structure['msInfo'] = _pick(value, INFO_FIELDS)
+        return
+    section, _, key = item.partition(".")
+    if section == "rooms":
+        structure['rooms'][key] = _pick(value, ROOM_FIELDS)
+    elif section == "cats":
+        structure['cats'][key] = _pick(value, CAT_FIELDS)
+    else:
+        control = prune_control(value, types)
+        if control is not None:
+            structure['controls'][key] = control
+        else:
+            _count_unsupported(structure, value.get('type'))
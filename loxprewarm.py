@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Prewarm the neuron before the first order.
+
+Loads the structure definition of a miniserver and opens its connection
+pool, so that the first order doesn't wait for them. The parsed
+structure is also written to the on-disk cache, which Kalliope reads if
+it is started later.
+
+Run with the settings of Kalliope:
+python loxprewarm.py samples/settings_samples/variables.yml
+
+"""
+import argparse
+import logging
+import sys
+
+logger = logging.getLogger("kalliope")
+
+
+def load_variables(path):
+    """
+    Return the neuron parameters set in a Kalliope variables file.
+
+    :param path: path of the yaml file, e.g. variables.yml
+    :return: dict of all lx_ parameters
+
+    """
+    import yaml
+    with open(path, 'r') as f:
+        variables = yaml.safe_load(f) or {}
+    return dict((name, value) for name, value in variables.items()
+                if name.startswith("lx_"))
+
+
+def prewarm(**parameters):
+    """
+    Load the structure definition and open the connections of a miniserver.
+
+    Only the client is used, so Kalliope's settings aren't needed.
+
+    :param parameters: neuron parameters, at least lx_ip, lx_user and
+    lx_password
+    :return: number of controls loaded
+    .. raises:: ValueError if lx_ip, lx_user or lx_password is missing,
+    IOError if the structure definition can't be loaded
+
+    """
+    from loxclient import LoxClient
+    controls = LoxClient(**parameters).prewarm()
+    if controls is None:
+        raise IOError("%s doesn't send its structure definition" %
+                      parameters.get("lx_ip"))
+    return controls
+
+
+def main(argv=None):
+    """
+    Prewarm a miniserver given by a variables file or the command line.
+
+    :param argv: command line arguments, default sys.argv[1:]
+    :return: exit code
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("variables", nargs="?",
+                        help="Kalliope variables file with lx_ip, lx_user "
+                        "and lx_password")
+    parser.add_argument("--ip", dest="lx_ip", help="miniserver ip")
+    parser.add_argument("--user", dest="lx_user", help="miniserver user")
+    parser.add_argument("--password", dest="lx_password",
+                        help="miniserver user password")
+    parser.add_argument("--cachedir", dest="lx_cachedir",
+                        help="directory of the structure cache")
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.variables is not None:
+        parameters.update(load_variables(args.variables))
+    # the command line overrides the variables file
+    for name in ("lx_ip", "lx_user", "lx_password", "lx_cachedir"):
+        if getattr(args, name) is not None:
+            parameters[name] = getattr(args, name)
+
+    try:
+        controls = prewarm(**parameters)
+    except Exception as e:
+        logger.error("Loxscontrol: Prewarming failed: %s", e)
+        return 1
+    print("%s: %d controls loaded" % (parameters.get("lx_ip"), controls))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    sys.exit(main())
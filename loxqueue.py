@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""Coalescing and rate limiting of the commands sent to a miniserver."""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("kalliope")
+
+# One queue per miniserver, shared by all neuron instances of the
+# process. Key is the host.
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(host, window=0, rate=None):
+    """
+    Return the command queue of a miniserver.
+
+    The queue is created on first use. The window and the rate of the
+    last call are used.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param window: seconds a command repeated is not sent again
+    :param rate: max. commands per second, None for no limit
+    :return: CommandQueue
+
+    """
+    with _queues_lock:
+        queue = _queues.get(host)
+        if queue is None:
+            queue = CommandQueue(window, rate)
+            _queues[host] = queue
+        else:
+            queue.configure(window, rate)
+        return queue
+
+
+def clear_queues():
+    """Forget all queues."""
+    with _queues_lock:
+        _queues.clear()
+
+
+class _Command(object):
+
+    """Command waiting to be sent, shared by all orders it answers."""
+
+    def __init__(self, command, send):
+        """
+        Create a waiting command.
+
+        :param command: command of the control, e.g. on
+        :param send: function sending a command, returns True or False
+
+        """
+        self.command = command
+        self.send = send
+        self.result = None
+        self.done = threading.Event()
+
+
+class CommandQueue(object):
+
+    """
+    Commands of the controls of a miniserver.
+
+    A control has at most one command on its way and one command
+    waiting. A new command replaces the waiting one, so that of
+    contradicting commands only the latest is sent. A command equal to
+    the one sent last is not sent again within the window. All orders
+    of a replaced or repeated command get the result of the command
+    sent. The total rate is limited by a token bucket, commands wait
+    for a token while they can still be replaced.
+
+    """
+
+    def __init__(self, window=0, rate=None):
+        """
+        Create an empty queue.
+
+        :param window: seconds a command repeated is not sent again
+        :param rate: max. commands per second, None for no limit
+
+        """
+        self._lock = threading.Lock()
+        # uuid -> waiting _Command
+        self._waiting = {}
+        # uuid -> _Command on its way
+        self._sending = {}
+        # uuid -> (command, time, result) of the command sent last
+        self._sent = {}
+        self._tokens = 0.0
+        self._updated = time.time()
+        self.window = self.rate = None
+        self.configure(window, rate)
+
+    def configure(self, window, rate):
+        """
+        Change the window and the rate.
+
+        :param window: seconds a command repeated is not sent again
+        :param rate: max. commands per second, None for no limit
+
+        """
+        with self._lock:
+            if rate != self.rate:
+                # allow a burst of one second
+                self._tokens = float(rate or 0)
+                self._updated = time.time()
+            self.window = window or 0
+            self.rate = rate
+
+    def submit(self, uuid, command, send):
+        """
+        Send a command to a control, unless it is coalesced.
+
+        Blocks until the command, or the command replacing it, is sent.
+
+        :param uuid: uuid of the control
+        :param command: command of the control, e.g. on
+        :param send: function called with the command, returns True if
+        the miniserver accepted it
+        :return: result of the command sent
+
+        """
+        owner = False
+        with self._lock:
+            if self._is_recent(uuid, command):
+                logger.debug("Loxscontrol: Command %s of %s not repeated",
+                             command, uuid)
+                return True
+            waiting = self._waiting.get(uuid)
+            if waiting is not None:
+                logger.debug("Loxscontrol: Command %s of %s replaced by %s",
+                             waiting.command, uuid, command)
+                waiting.command = command
+                waiting.send = send
+            else:
+                waiting = _Command(command, send)
+                self._waiting[uuid] = waiting
+                owner = True
+        if owner:
+            self._process(uuid, waiting)
+        else:
+            waiting.done.wait()
+        return waiting.result
+
+    def _process(self, uuid, waiting):
+        """
+        Send a waiting command once it's its turn.
+
+        :param uuid: uuid of the control
+        :param waiting: _Command submitted
+
+        """
+        # one command per control on its way
+        while True:
+            with self._lock:
+                sending = self._sending.get(uuid)
+            if sending is None:
+                break
+            sending.done.wait()
+        self._take_token()
+
+        with self._lock:
+            del self._waiting[uuid]
+            repeated = self._is_recent(uuid, waiting.command)
+            if not repeated:
+                self._sending[uuid] = waiting
+        if repeated:
+            waiting.result = True
+            waiting.done.set()
+            return
+
+        try:
+            waiting.result = bool(waiting.send(waiting.command))
+        finally:
+            with self._lock:
+                self._sent[uuid] = (waiting.command, time.time(),
+                                    waiting.result)
+                del self._sending[uuid]
+            waiting.done.set()
+
+    def _is_recent(self, uuid, command):
+        """
+        Return True if the same command was sent within the window.
+
+        Failed commands are sent again. Call with the lock held.
+
+        """
+        sent = self._sent.get(uuid)
+        return sent is not None and sent[0] == command and \
+            bool(sent[2]) and time.time() - sent[1] <= self.window
+
+    def _take_token(self):
+        """Wait until the rate allows another command."""
+        with self._lock:
+            if not self.rate:
+                return
+            now = time.time()
+            self._tokens = min(float(self.rate), self._tokens +
+                               (now - self._updated) * self.rate)
+            self._updated = now
+            # tokens are reserved, they may become negative
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
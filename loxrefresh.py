@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""Background refresh of the structure definitions of miniservers."""
+
+import logging
+import threading
+
+logger = logging.getLogger("kalliope")
+
+# Default seconds between two checks of the structure version
+INTERVAL = 300.0
+
+# One refresher per miniserver and user, shared by all neuron instances
+# of the process. Key is (host, user).
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+def get_refresher(host, user, password, loader, interval=INTERVAL):
+    """
+    Return the running refresher of a miniserver.
+
+    The refresher is started on first use, or again if the password or
+    the interval changed.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param user: miniserver user
+    :param password: miniserver user password
+    :param loader: object with get_structure_version() and
+    load_model(version), kept as long as the refresher runs
+    :param interval: seconds between two checks of the version
+    :return: StructureRefresher
+
+    """
+    key = (host, user)
+    with _refreshers_lock:
+        refresher = _refreshers.get(key)
+        if refresher is None or refresher.password != password or \
+                refresher.interval != interval:
+            if refresher is not None:
+                refresher.stop()
+            refresher = StructureRefresher(host, user, password, loader,
+                                           interval)
+            _refreshers[key] = refresher
+            refresher.start()
+    return refresher
+
+
+def stop_refreshers():
+    """Stop all refreshers."""
+    with _refreshers_lock:
+        for refresher in _refreshers.values():
+            refresher.stop()
+        _refreshers.clear()
+
+
+class StructureRefresher(object):
+
+    """
+    Keep the structure definition of a miniserver current.
+
+    A background thread checks the version of the structure definition
+    periodically. A new version is loaded and parsed by the thread and
+    replaces the current model in one step. Neuron instances take the
+    model once, so a command always sees one consistent model.
+
+    """
+
+    def __init__(self, host, user, password, loader, interval=INTERVAL):
+        """
+        Set up the refresher, start() starts it.
+
+        :param host: ip or hostname of the miniserver, optional with port
+        :param user: miniserver user
+        :param password: miniserver user password
+        :param loader: object with get_structure_version() and
+        load_model(version)
+        :param interval: seconds between two checks of the version
+
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.interval = interval
+        self._loader = loader
+        # (version, model) replaced as a whole
+        self._current = (None, None)
+        self._stopped = threading.Event()
+        # set after the first check, loaded or not
+        self._checked = threading.Event()
+        self._thread = None
+
+    @property
+    def model(self):
+        """Return the current model or None if none is loaded yet."""
+        return self._current[1]
+
+    @property
+    def version(self):
+        """Return the version of the current model."""
+        return self._current[0]
+
+    @property
+    def warm(self):
+        """Return True if a model is loaded."""
+        return self._current[1] is not None
+
+    def start(self):
+        """Start the background thread."""
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after its current check."""
+        self._stopped.set()
+        self._checked.set()
+
+    def wait_checked(self, timeout=None):
+        """
+        Wait for the first check of the version, e.g. on a cold start.
+
+        :param timeout: max. seconds to wait, None to wait for the
+        check, which is bounded by the timeouts of its requests
+        :return: True if the first check is done
+
+        """
+        return self._checked.wait(timeout)
+
+    def refresh(self):
+        """
+        Load the structure definition if its version changed.
+
+        The current model is kept if the miniserver can't be reached or
+        the structure definition can't be loaded.
+
+        :return: True if a new model was loaded, False otherwise
+
+        """
+        version = self._loader.get_structure_version()
+        if version is None:
+            return False
+        if self.warm and version == self.version:
+            return False
+        model = self._loader.load_model(version)
+        if model is None:
+            return False
+        self._current = (version, model)
+        logger.debug("Loxscontrol: Structure definition %s of %s "
+                     "refreshed", version, self.host)
+        return True
+
+    def _run(self):
+        """Check the version until stopped."""
+        while not self._stopped.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep refreshing, the next check might work
+                logger.debug("Loxscontrol: Refreshing structure definition "
+                             "of %s failed: %r", self.host, e)
+            self._checked.set()
+            self._stopped.wait(self.interval)
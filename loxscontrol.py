@@ -2,12 +2,8 @@
 """NeuronModule Class for controlling a Loxone Homeautomation."""
 
 import logging
-import requests
-from xml.etree import ElementTree
-import pprint
-import json
-import tempfile
-import re
+import time
+from loxclient import LoxClient
 from kalliope.core.NeuronModule import NeuronModule
 from kalliope.core.NeuronModule import MissingParameterException, \
     InvalidParameterException
@@ -19,27 +15,21 @@ logger = logging.getLogger("kalliope")
 
 class Loxscontrol(NeuronModule):
 
-    """NeuronModule Class for controlling a Loxone Homeautomation."""
+    """
+    NeuronModule Class for controlling a Loxone Homeautomation.
 
-    # Path definition
-    STRUCTUREDEF = "/data/Loxapp3.json"
-    VERSION = "/dev/sps/LoxAPPversion"
-    SPSIO = "/dev/sps/io/"
+    The miniservers are driven by a LoxClient held in client, the neuron
+    turns the order into calls of the client and says the result.
 
-    # Control elements used in Loxone
-    TYPE_SWITCH = ["TimedSwitch", "Switch"]
-    TYPE_LIGHTCONTROL = ["LightController"]
-    TYPE_JALOUSIE = ["Jalousie"]
-
-    # Categories used in Loxone
-    CAT_LIGTH = "lights"
-    CAT_JALOUSIE = "shading"
-    CAT_UNDEF = "undefined"
-    CAT_ROOM = "room"
+    """
 
     # Actions used
     ACT_CHANGE = "change"         #changes a state of an element
     ACT_LIST = "list"                   #names all given elements element
+    ACT_STATUS = "status"           #tells the state of all given elements
+    ACT_PREWARM = "prewarm"     #loads the structure, opens connections
+    ACT_SCENE = "scene"             #changes the states of several elements
+    ACT_DESCRIBE = "describe"    #tells diagnostics of the structure
 
     # Status Code Definitions
     # IncompleteRequest - Parameter is missing or not complete / consistent
@@ -47,11 +37,26 @@ class Loxscontrol(NeuronModule):
     # StateChangeError  -  State of Control Element was not changed.
     #                                   Name not found, or changing failed
     # List                          - List what is given in summary.
+    # AmbiguousName          - Name matches several control elements,
+    #                                   their names are given in summary.
+    # Status                      - States of the elements are given in
+    #                                   summary.
+    # InvalidState             - State is not valid for the element, the
+    #                                   valid states are given in summary.
+    # Unreachable              - Miniserver can't be reached, the
+    #                                   request failed fast.
+    # Describe                   - Diagnostics of the structure definition
+    #                                   are given in summary.
     STATUS_CODE_DEF = {
                        "IncompleteRequest",
                        "Complete",
                        "StateChangeError", 
                        "List", 
+                       "AmbiguousName",
+                       "Status",
+                       "InvalidState",
+                       "Unreachable",
+                       "Describe",
                        "Error"
                        }
 
@@ -61,36 +66,60 @@ class Loxscontrol(NeuronModule):
         # call super init
         super(Loxscontrol, self).__init__(*args, **kwargs)
 
-        # get parameters from the neuron
+        # get parameters from the neuron, the lx_ ones are the client's
+        self.client = LoxClient(**kwargs)
         self._host = kwargs.get('lx_ip', None)
         self._user = kwargs.get('lx_user', None)
         self._password = kwargs.get('lx_password', None)
-        self._controls = kwargs.get('lx_structuredef', None)
+        self._optimistic = kwargs.get('lx_optimistic', False)
 
         self.action= kwargs.get('action', None)
         self.change_room = kwargs.get('control_room', None)
         self.change_cattype = kwargs.get('control_type', None)
         self.change_name = kwargs.get('control_name', None)
         self.change_newstate = kwargs.get('newstate', None)
-
-        # define request headers
-        self._headers = {'accept': 'application/json'}
+        self.scene_steps = kwargs.get('scene_steps', None)
 
         # define output
         self.status_code = None
         self.summary = None
 
+        start = time.time()
+
         # check if parameters have been provided
         if self._is_parameters_ok():
 
-            # action change
+            # action prewarm, e.g. by a synapse started with kalliope
+            if self.action == self.ACT_PREWARM:
+                self.action_prewarm()
+
+            # action change, answered before sending if optimistic
             if self.action == self.ACT_CHANGE:
+                if self._optimistic:
+                    self.client.defer_changes()
                 self.action_change()
 
             # action list
             if self.action == self.ACT_LIST:
                 self.action_list()
+
+            # action status
+            if self.action == self.ACT_STATUS:
+                self.action_status()
+
+            # action scene
+            if self.action == self.ACT_SCENE:
+                self.action_scene()
+
+            # action describe
+            if self.action == self.ACT_DESCRIBE:
+                self.action_describe()
                 
+            # changes failed because a miniserver can't be reached
+            if self.status_code == "StateChangeError" and \
+                    not self.client.is_reachable():
+                self.status_code = "Unreachable"
+
             # no valid combination found
             if self.status_code is None:
                 MissingParameterException(self.neuron_name +
@@ -98,7 +127,7 @@ class Loxscontrol(NeuronModule):
                                           "process request.")
                 self.status_code = "IncompleteRequest"
 
-        else:
+        elif self.status_code is None:
             self.status_code = "IncompleteRequest"
 
         # Finally say what I have done -> use a template
@@ -109,7 +138,16 @@ class Loxscontrol(NeuronModule):
             "control_room": self.change_room,
             "summary": self.summary, 
         }
-        self.say(self.message)
+        # send the changes while the answer is spoken
+        if self._optimistic:
+            self.client.confirm_later()
+
+        # prewarming runs at startup, nothing to tell
+        if self.action != self.ACT_PREWARM:
+            with self.client.stats.timer("say"):
+                self.say(self.message)
+        self.client.stats.observe("order", time.time() - start)
+        self.client.report_stats()
 
     def _is_parameters_ok(self):
         """
@@ -141,16 +179,34 @@ class Loxscontrol(NeuronModule):
             raise MissingParameterException(
                 self.neuron_name + ": needs an action ")
 
-        # load loxone config from miniserver
-        if self._controls is None:
-            if not self.load_config():
-                raise MissingParameterException(
-                    self.neuron_name + ": can't load miniserver structure "
-                    "definition"
-                    )
-            self.show_configinfo()
+        # open connections, load loxone config from miniserver
+        try:
+            loaded = self.client.connect()
+        except ValueError as e:
+            raise InvalidParameterException(self.neuron_name + ": " +
+                                            str(e))
+        if not loaded:
+            # say so at once, prewarming fails
+            if self.action != self.ACT_PREWARM and \
+                    not self.client.is_reachable(self._host):
+                self.status_code = "Unreachable"
+                self.summary = self._host
+                return False
+            raise MissingParameterException(
+                self.neuron_name + ": can't load miniserver structure "
+                "definition"
+                )
 
         # enough information that I can do something?
+        if self.action in (self.ACT_PREWARM, self.ACT_DESCRIBE):
+            return True
+        if self.action == self.ACT_SCENE:
+            try:
+                self.client.check_scene(self.scene_steps)
+            except ValueError as e:
+                raise InvalidParameterException(self.neuron_name + ": " +
+                                                str(e))
+            return True
         if (self.change_name is None) and (self.change_room is None) \
                 and (self.change_cattype is None):
             raise MissingParameterException(self.neuron_name +
@@ -168,8 +224,26 @@ class Loxscontrol(NeuronModule):
         # don't pay attention to categorie
         if (self.change_name is not None) and \
                     (self.change_newstate is not None):
-                if self.change_switch_state_byname(self.change_name,
-                                                   self.change_newstate):
+                uuids = self.client.get_controluuids_by_name(
+                    self.change_name)
+                if len(uuids) > 1:
+                    logger.debug(self.neuron_name +
+                                 ": Name %s is ambiguous",
+                                 self.change_name)
+                    self.status_code = "AmbiguousName"
+                    self.summary = ", ".join(
+                        sorted(self.client.get_name_by_uuid(uuid)
+                               for uuid in uuids))
+                elif uuids and self.client.build_command(
+                        uuids[0], self.change_newstate) is None:
+                    logger.debug(self.neuron_name +
+                                 ": State %s is not valid for %s",
+                                 self.change_newstate, self.change_name)
+                    self.status_code = "InvalidState"
+                    self.summary = ", ".join(LoxClient.TYPES[
+                        self.client.get_type_by_uuid(uuids[0])].describe())
+                elif self.client.change_switch_state_byname(
+                        self.change_name, self.change_newstate):
                     logger.debug(self.neuron_name +
                                  ": State of %s changed to %s",
                                  self.change_name,
@@ -181,362 +255,118 @@ class Loxscontrol(NeuronModule):
                                  self.change_name)
                     self.status_code = "StateChangeError"
 
-        # Type lights and room and state is given
-        if (self.change_cattype == self.CAT_LIGTH) and \
-                    (self.change_room is not None) and \
-                    (self.change_newstate is not None):
-#                if self.change_lights_byroom(self.change_room,
-#                                                   self.change_newstate):
-#                    logger.debug(self.neuron_name +
-#                                 ": State of %s in room %s changed to %s",
-#                                 self.change_name,
-#                                self.change_newstate)
-#                    self.status_code = "Complete"
-#                else:
+        # room and/or category and state is given
+        # change all matching controls
+        elif ((self.change_room is not None) or
+                (self.change_cattype is not None)) and \
+                (self.change_newstate is not None):
+                uuids = self.client.get_controluuids_by_room_and_type(
+                    self.change_room, self.change_cattype)
+                if not uuids:
                     logger.debug(self.neuron_name +
-                                 " State of %s not changed!",
-                                 self.change_name)
+                                 " No controls of type %s in room %s!",
+                                 self.change_cattype, self.change_room)
                     self.status_code = "StateChangeError"
+                    return
+
+                # only change the controls accepting the state, e.g. the
+                # lights of a room are switched on, not its jalousies
+                uuids = [uuid for uuid in uuids
+                         if self.client.build_command(
+                             uuid, self.change_newstate) is not None]
+                if not uuids:
+                    logger.debug(self.neuron_name +
+                                 " State %s is not valid for the controls!",
+                                 self.change_newstate)
+                    self.status_code = "InvalidState"
+                    return
 
-    def action_list(self):
-        """
-        List known elements 
-
-        """
-        # check that cattype is given
-        if (self.change_cattype is not None):
-            
-                #check cattyp - equals room:
-                if (self.change_cattype == self.CAT_ROOM):
-                        self.summary=self.list_rooms()
-                        if  self.summary is not None:
-                            self.status_code = "List"
-                        else:
-                            self.status_code = "Error"
-
-        # similar for switch, lights etc.
-
+                self.summary = self.client.change_state_batch(
+                    uuids, self.change_newstate)
+                if all(result['success'] for result in self.summary):
+                    self.status_code = "Complete"
+                else:
+                    self.status_code = "StateChangeError"
 
+    def action_prewarm(self):
+        """Prepare the first order, see LoxClient.prewarm."""
+        self.summary = self.client.prewarm()
+        self.status_code = "Complete"
 
-    def change_state_byuuid(self, controluuid,  newstate):
+    def action_describe(self):
         """
-        Change the state of a switch identified by controlname.
+        Tell diagnostics of the structure definition.
 
-        :param controluuid: uuid of the control element
-        :param newstate: new state of the switch
-        :return: True if successful, False if not
+        The numbers of rooms, categories and controls, unsupported
+        control types, rooms without controls and names spoken the same
+        way are given in summary and logged, see loxdescribe.
 
         """
-
-        logger.debug(self.neuron_name +
-                     ": Called Change State with %s UID and %s newstate",
-                     controluuid,  newstate)
-        print controluuid
-
-        try:
-            r = requests.get("http://"+self._host + self.SPSIO +
-                             controluuid+"/"+newstate,
-                             auth=(self._user, self._password))
-            r.raise_for_status()
-        except requests.exceptions.HTTPError:
-            logger.debug(self.neuron_name +
-                         ": Change switch state failed with response: %r",
-                         r.text)
-            return False
-        except requests.exceptions.RequestException:
-            logger.debug(self.neuron_name+": Change switch state failed.")
-            return False
-
-        logger.debug(self.neuron_name +
-                     ': UID %s changed state to %s', controluuid, newstate)
-# TODO: [Feature] check if state is correct -> analyse JSON answer
-        return True
-
-    def change_switch_state_byname(self, controlname,  newstate):
+        import loxdescribe
+        description = self.client.describe()
+        for line in loxdescribe.format_description(description):
+            logger.info(self.neuron_name + ": %s", line)
+        self.status_code = "Describe"
+        self.summary = description
+
+    def action_scene(self):
         """
-        Change the state of a switch identified by controlname.
+        Change the states of the steps of a scene.
 
-        :param controlname: name of the switch
-        :param newstate: new state of the switch
-        :return: True if successful, False if not
+        The steps are grouped by LoxClient.plan_scene. The groups until
+        the first delay of more than 0 seconds are answered, the others
+        are sent in a background thread, see LoxClient.change_later.
 
         """
-        uuid = self.get_controluuid_by_name(controlname)
-        if uuid is not None:
-            if self.get_type_by_uuid(uuid) in self.TYPE_SWITCH:
-                return self.change_state_byuuid(uuid, newstate)
-            else:
-                logger.debug(self.neuron_name +
-                         ': Name %s is not a Switch', controlname)
-                return False
+        groups, failed = self.client.plan_scene(self.scene_steps)
+        later = [index for index, (delay, _) in enumerate(groups)
+                 if delay > 0]
+        if later:
+            groups, later = groups[:later[0]], groups[later[0]:]
+
+        self.summary = self.client.change_groups(groups) + failed
+        if later:
+            self.client.change_later(later)
+
+        logger.debug(self.neuron_name + ": Scene with %d steps, %d of %d "
+                     "changes failed, %d groups delayed",
+                     len(self.scene_steps),
+                     len([c for c in self.summary if not c['success']]),
+                     len(self.summary), len(later))
+        if (self.summary or later) and \
+                all(c['success'] for c in self.summary):
+            self.status_code = "Complete"
         else:
-            logger.debug(self.neuron_name +
-                         ': Name %s not found in StructureDef', controlname)
-            return False
+            self.status_code = "StateChangeError"
 
-    def get_type_by_uuid(self,  uuid):
-        """
-        Return type identified by uuid.
-
-        :param uuid: uuid of the control element
-        :return: type of the control element
-        or None if not found
-
-        """
-        # check categories first
-        if uuid in self._controls:
-            return self._controls[uuid]['type']
-        
-        # check controls
-        for controlgroup in self._controls:
-            subcontrol = self._controls[controlgroup]["controls"]
-            if uuid in subcontrol:
-                return subcontrol[uuid]["type"]
-
-        # check rooms
-        if uuid in self._rooms:
-            return self.CAT_ROOM
-        return None 
-  
-    def get_name_by_uuid(self,  uuid):
-        """
-        Return name identified by uuid.
-
-        :param uuid: uuid of the control element
-        :return: name of the control element
-        or None if not found
-
-        """
-        # check categories first
-        if uuid in self._controls:
-            return self._controls[uuid]['name']
-        
-        # check controls
-        for controlgroup in self._controls:
-            subcontrol = self._controls[controlgroup]["controls"]
-            if uuid in subcontrol:
-                return subcontrol[uuid]["name"]
-
-        # check rooms
-        if uuid in self._rooms:
-            return self._rooms[uuid]['name']
-        return None   
-
-    def get_controluuid_by_name(self, controlname):
-        """
-        Return UUID identified by controlname.
-
-        :param controlname: name of the switch
-        :return: UUID of control in the structure definition
-        or None if not found
-
-        """
-        for controlgroup in self._controls:
-            subcontrol = self._controls[controlgroup]["controls"]
-            for element in subcontrol:
-                if subcontrol[element]["name"] in controlname:
-                    return subcontrol[element]["uidAction"]
-        return None
-        
-    def list_rooms(self):
+    def action_list(self):
         """
-        Returns a str of all rooms separated by comma
-
-        """     
-        
-        roomlist = None
-
-        for room in self._rooms:
-            logger.debug(self.neuron_name + ":       %s",self._rooms[room]['name'])
-            if roomlist is None:
-                roomlist = "%s"%self._rooms[room]['name']
-            else:
-                roomlist = roomlist + ", %s"%self._rooms[room]['name']
-        
-        return roomlist    
-        
+        List known elements.
 
-    def show_configinfo(self):
-        """
-        Print informations about the config to debug output
+        Rooms or categories are listed for control_type room or
+        category, otherwise the controls in control_room and/or of
+        control_type.
 
         """
-        
-        # General infos
-        logger.debug(self.neuron_name + ": Loxone Structure Definition:")
-        logger.debug(self.neuron_name + ": Location: %s", self._location)
-        logger.debug(self.neuron_name + ": Language: %s", self._language)
-        
-        # Rooms
-        # logger.debug(self.neuron_name + ": Room title: %s", self._roomtitle)        
-        logger.debug(self.neuron_name + ": No. of Rooms: %d", 
-                len(self._rooms))
-        for room in self._rooms:
-            logger.debug(self.neuron_name + ":       %s",self._rooms[room]['name'])
-           
-        # Categories   
-        logger.debug(self.neuron_name + ": No. of Categories: %d", 
-                len(self._controls)) 
-        sum = 0
-        for cat in self._controls:
-            logger.debug(self.neuron_name + ":       %s",self._controls[cat]['name']) 
-            sum = sum + len(self._controls[cat]['controls'])
-        
-        # Controls 
-        logger.debug(self.neuron_name + ": Supported Types: %d", 
-                len(self.TYPE_SWITCH) + len(self.TYPE_LIGHTCONTROL) +
-                len(self.TYPE_JALOUSIE))
-        for cat in self.TYPE_SWITCH:
-                 logger.debug(self.neuron_name + ":       %s",  cat)
-        for cat in self.TYPE_LIGHTCONTROL:
-                 logger.debug(self.neuron_name + ":       %s",  cat)
-        for cat in self.TYPE_JALOUSIE:
-                 logger.debug(self.neuron_name + ":       %s",  cat)                 
-     
-        logger.debug(self.neuron_name + ": Defined Elements: %d", 
-                sum)               
-        logger.debug(self.neuron_name + ": (This is a list of supported "+
-                "elements. There might be more elements defined in your " +
-                "strcuture definition.)")
-                
-        for cat in self._controls:
-            subcontrol = self._controls[cat]['controls']
-            for controls in subcontrol:               
-                logger.debug(self.neuron_name + ":       %s [%s, %s] in %s %s",
-                    subcontrol[controls]['name'],  
-                    subcontrol[controls]['type'],
-                    self._controls[cat]['name'],   
-                    self._roomtitle, 
-                    self._rooms[subcontrol[controls]['room']]['name']) 
-                
-    def load_config(self):
-        """
-        Load the JSON Config File of the loxone miniserver.
-
-        :return: true if config is loaded and parsed, false otherwise
+        if self.change_cattype == LoxClient.CAT_ROOM:
+            self.summary = self.client.list_rooms()
+        elif self.change_cattype == LoxClient.CAT_CATEGORY:
+            self.summary = self.client.list_categories()
+        elif (self.change_room is not None) or \
+                (self.change_cattype is not None):
+            self.summary = self.client.list_controls(self.change_room,
+                                              self.change_cattype)
+        else:
+            return
+        self.status_code = "List"
 
+    def action_status(self):
         """
-        # load structure definition
-# TODO: [Feature] config should be cached and only loaded when needed
-        try:
-            r = requests.get("http://"+self._host +
-                             self.STRUCTUREDEF, auth=(self._user,
-                                                      self._password))
-        except requests.ConnectionError:
-            logger.debug(self.neuron_name +
-                         ': Structure Definition Request failed.')
-            return False
+        Tell the state of the elements given by name, or by room and/or
+        category.
 
-        try:
-            r.raise_for_status()
-            raw_info = r.json()['msInfo']
-            raw_rooms = r.json()['rooms']
-            raw_controls = r.json()['controls']
-            raw_cats = r.json()['cats']
-        except requests.exceptions.HTTPError:
-            logger.debug(self.neuron_name +
-                         ': Structure Definition Request failed with \
-                response: %r',
-                         r.text)
-            return False
-        except requests.exceptions.RequestException:
-            logger.debug(self.neuron_name +
-                         ': Structure Definition Request failed.')
-            return False
-        except ValueError as e:
-            logger.debug(self.neuron_name +
-                         ': Structure Definition cannot be loaded,'
-                         'response: %s',
-                         e.args[0])
-            return False
-        except KeyError:
-            logger.debug(self.neuron_name +
-                         ': Structure Definition cannot be loaded. KeyError.')
-            return False
-
-        # Parse structure
-        try:
-            # Get Info
-            self._language = raw_info['languageCode']
-            self._location = raw_info['location']
-            self._roomtitle = raw_info['roomTitle']
-            
-            # Get rooms
-            self._rooms = {}
-            for room in raw_rooms:
-                self._rooms[room] = {"name": raw_rooms[room]['name'],
-                                     "uid": raw_rooms[room]['uuid']}
-
-            # Get categories
-            self._controls = {}
-            for cat in raw_cats:
-                self._controls[cat] = {"name": raw_cats[cat]['name'],
-                                       "uid": raw_cats[cat]['uuid'],
-                                       "type": raw_cats[cat]['type'],
-                                       "controls": {}}
-
-            # fill controls
-            self.extract_controls(raw_controls)
-
-        except KeyError:
-            logger.debug(self.neuron_name +
-                                ': Structure Definition cannot be parsed. '+
-                                'KeyError.'
-                                  )
-            return False
-# TODO: FIX Language check
-        # Check Language
-        # try:
-        #    language = self.profile['language']
-        # except KeyError:
-        #    language = 'en-US'
-        # if language.split('-')[1]==self._language:
-        #    raise ValueError("Home automation language is %s. But your
-        # profile language is set to %s",self._language,language)
-
-        # debug print
-        #pprint.pprint(self._controls)
-
-        #pprint.pprint(self._rooms)
-
-        return True
-
-    def extract_controls(self, jsonconfig):
         """
-        Parse the given JSON and extract the control information.
-
-        :param jsonconfig: controls block of the json file
-
-        """       
-        
-        # Step though each entry
-        for control in jsonconfig:
-                if jsonconfig[control]['type'] in self.TYPE_SWITCH:
-                    self._controls[jsonconfig[control]['cat']][
-                        'controls'][control] = {
-                        "name": jsonconfig[control]['name'],
-                        "uidAction": jsonconfig[control]['uuidAction'],
-                        "room": jsonconfig[control]['room'],
-                        "type": jsonconfig[control]['type']}
-                elif jsonconfig[control]['type'] in self.TYPE_LIGHTCONTROL:
-                        subcontrols = jsonconfig[control]['subControls']
-                        for subcontrol in subcontrols:
-                            if subcontrols[subcontrol]['type'] == "Switch":
-                                self._controls[jsonconfig[control]['cat']][
-                                    'controls'][subcontrol] = {
-                                    "name": subcontrols[subcontrol]['name'],
-                                    "uidAction": subcontrols[subcontrol][\
-                                        'uuidAction'],
-                                    "room": jsonconfig[control]['room'],
-                                    "type": subcontrols[subcontrol]['type']}
-                elif jsonconfig[control]['type'] in self.TYPE_JALOUSIE:
-                    self._controls[jsonconfig[control]['cat']][
-                        'controls'][control] = {
-                        "name": jsonconfig[control]['name'],
-                        "uidAction": jsonconfig[control]['uuidAction'],
-                        "room": jsonconfig[control]['room'],
-                        "type": jsonconfig[control]['type']}
-
-                # IRoomController
-                # InfoOnlyAnalog
-        return
+        uuids = self.client.resolve(self.change_name, self.change_room,
+                             self.change_cattype)
+        self.summary = self.client.read_states(uuids)
+        self.status_code = "Status"
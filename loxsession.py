@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Shared HTTP sessions for the communication with Loxone miniservers."""
+
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+try:
+    from urllib.parse import urlsplit, urlunsplit
+except ImportError:
+    from urlparse import urlsplit, urlunsplit
+import loxbreaker
+import loxstats
+import loxtoken
+
+logger = logging.getLogger("kalliope")
+
+# Default settings of the connection pool
+POOLSIZE = 8
+TIMEOUT = 5.0
+CONNECT_TIMEOUT = 1.0
+RETRIES = 2
+BACKOFF = 0.2
+
+# Cheap request probing a miniserver which was unreachable
+PROBE = "/dev/sps/LoxAPPversion"
+
+# One session per miniserver and user, shared by all neuron instances
+# of the process. Key is (host, user).
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class CountingRetry(Retry):
+
+    """Retry counting each failed attempt in loxstats.STATS."""
+
+    def increment(self, *args, **kwargs):
+        """Count the failed attempt, then decide about retrying."""
+        loxstats.STATS.count("retries")
+        return super(CountingRetry, self).increment(*args, **kwargs)
+
+
+def _count_status(response, *args, **kwargs):
+    """Count the HTTP status code of a response in loxstats.STATS."""
+    loxstats.STATS.count("http_responses", code=response.status_code)
+
+
+class BreakerAdapter(HTTPAdapter):
+
+    """
+    HTTPAdapter failing fast while the miniserver is unreachable.
+
+    Requests which can't connect or time out are counted by the
+    loxbreaker.CircuitBreaker of the miniserver. While its circuit is
+    open, requests raise loxbreaker.CircuitOpenError without being
+    sent. A timeout given as one number is the read timeout, connecting
+    is limited to the connect timeout.
+
+    """
+
+    def __init__(self, breaker, connecttimeout=CONNECT_TIMEOUT, **kwargs):
+        """
+        Create the adapter.
+
+        :param breaker: loxbreaker.CircuitBreaker of the miniserver
+        :param connecttimeout: max. seconds to connect
+        :param kwargs: arguments of HTTPAdapter
+
+        """
+        self.breaker = breaker
+        self.connecttimeout = connecttimeout
+        super(BreakerAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        """Send a request unless the circuit is open."""
+        timeout = kwargs.get('timeout')
+        if isinstance(timeout, (int, float)):
+            kwargs['timeout'] = (min(self.connecttimeout, timeout), timeout)
+        if self.breaker.acquire():
+            self._probe(request, kwargs.get('timeout'))
+        try:
+            response = super(BreakerAdapter, self).send(request, **kwargs)
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout):
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _probe(self, request, timeout):
+        """
+        Check the miniserver is back before a request is sent.
+
+        The version of the structure definition is requested with the
+        authorization of the request.
+
+        :param request: requests.PreparedRequest waiting
+        :param timeout: timeout of the request
+        .. raises:: loxbreaker.CircuitOpenError if the probe failed
+
+        """
+        scheme, netloc, path = urlsplit(request.url)[:3]
+        if path == PROBE:
+            return
+        probe = request.copy()
+        probe.method = "GET"
+        probe.url = urlunsplit((scheme, netloc, PROBE, "", ""))
+        probe.body = None
+        try:
+            super(BreakerAdapter, self).send(probe, timeout=timeout).close()
+        except requests.exceptions.RequestException as e:
+            self.breaker.record_failure()
+            raise loxbreaker.CircuitOpenError(
+                "%s is still unreachable: %s" % (netloc, e))
+        self.breaker.record_success()
+
+
+def get_session(host, user, password, poolsize=POOLSIZE,
+                retries=RETRIES, backoff=BACKOFF,
+                connecttimeout=CONNECT_TIMEOUT,
+                failures=loxbreaker.FAILURES,
+                cooldown=loxbreaker.COOLDOWN,
+                tokens=False, tokendir=None, timeout=TIMEOUT):
+    """
+    Return the shared keep-alive session for a miniserver.
+
+    The session is created on first use. Later calls return the same
+    session, so that connections are reused across neuron instances.
+    Requests of the session fail fast while the miniserver is
+    unreachable, see BreakerAdapter. They authorize with user and
+    password, or with a token shared by all processes, see loxtoken.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param user: miniserver user
+    :param password: miniserver user password
+    :param poolsize: max. number of connections kept open
+    :param retries: number of retries if connecting fails
+    :param backoff: backoff factor in seconds between retries
+    :param connecttimeout: max. seconds to connect
+    :param failures: number of failed requests in a row until requests
+    fail fast
+    :param cooldown: seconds until an unreachable miniserver is probed
+    again
+    :param tokens: True to authorize by token instead of user and
+    password
+    :param tokendir: directory of the token file shared with other
+    processes, None to keep the token in memory only
+    :param timeout: timeout of the token requests in seconds
+    :return: requests.Session
+
+    """
+    breaker = loxbreaker.get_breaker(host, failures, cooldown)
+    key = (host, user)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            # Only retry if the request did not reach the miniserver.
+            # Commands like pulse are not idempotent.
+            retry = CountingRetry(total=retries, connect=retries, read=0,
+                                  backoff_factor=backoff,
+                                  status_forcelist=(502, 503, 504))
+            adapter = BreakerAdapter(breaker, connecttimeout,
+                                     pool_connections=1,
+                                     pool_maxsize=poolsize,
+                                     max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update({'accept': 'application/json'})
+            session.hooks['response'].append(_count_status)
+            _sessions[key] = session
+            logger.debug("Loxscontrol: New session for %s@%s", user, host)
+
+        # password might have been changed in the settings
+        if tokens:
+            session.auth = loxtoken.TokenAuth(loxtoken.get_manager(
+                host, user, password, session, tokendir, timeout))
+        else:
+            session.auth = (user, password)
+        return session
+
+
+def close_sessions():
+    """
+    Close all shared sessions.
+
+    The health of the miniservers and the tokens kept in memory are
+    forgotten, token files are kept.
+
+    """
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+    loxbreaker.clear_breakers()
+    loxtoken.clear_managers()
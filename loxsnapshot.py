@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshots of the parsed structure definition of a miniserver.
+
+A snapshot is a versioned JSON file with the parsed controls and their
+name indexes. It is loaded much faster than the structure definition is
+parsed and indexed, e.g. on kiosks with a slow link to the miniserver.
+The on-disk structure cache of the neuron has the same format.
+
+Create a snapshot of a miniserver or of a saved structure definition:
+python loxsnapshot.py structure.json --ip 192.168.0.11 --user admin
+python loxsnapshot.py structure.json --structure Loxapp3.json
+
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import loxmodel
+import loxparser
+import loxtypes
+
+logger = logging.getLogger("kalliope")
+
+# Format of snapshots, older formats are not loaded. Formats 1 and 2 were
+# on-disk caches without name indexes, format 3 didn't count the
+# unsupported controls.
+FORMAT = 4
+
+
+class SnapshotError(ValueError):
+
+    """Snapshot is invalid or of another format."""
+
+
+def dump(path, model, version, host=None):
+    """
+    Write a snapshot of a model.
+
+    The snapshot is written to a temporary file first, so that a
+    concurrent reader never sees a partially written snapshot.
+
+    :param path: path of the snapshot
+    :param model: loxmodel.LoxModel with indexes
+    :param version: version of the structure definition
+    :param host: miniserver of the structure definition, if known
+    .. raises:: IOError or OSError if it can't be written
+
+    """
+    snapshot = {"format": FORMAT, "version": version, "host": host,
+                "created": int(time.time()), "model": model.to_snapshot()}
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmpname = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.rename(tmpname, path)
+    except (IOError, OSError):
+        os.remove(tmpname)
+        raise
+
+
+def load(path):
+    """
+    Read a snapshot.
+
+    :param path: path of the snapshot
+    :return: tuple (header, loxmodel.LoxModel), header is a dict with
+    format, version, host and created
+    .. raises:: IOError or OSError if it can't be read, SnapshotError if
+    it is invalid
+
+    """
+    with open(path, 'r') as f:
+        try:
+            snapshot = json.load(f)
+        except ValueError as e:
+            raise SnapshotError("%s is no snapshot: %s" % (path, e))
+    if not isinstance(snapshot, dict) or \
+            snapshot.get('format') != FORMAT:
+        raise SnapshotError("%s is no snapshot of format %d" %
+                            (path, FORMAT))
+    try:
+        model = loxmodel.LoxModel.from_snapshot(snapshot.pop('model'))
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotError("%s is invalid: %r" % (path, e))
+    return snapshot, model
+
+
+def from_structure(fileobj, types=None):
+    """
+    Parse a structure definition.
+
+    :param fileobj: file-like object with Loxapp3.json
+    :param types: dict control type -> loxtypes.ControlType, default
+    are all types supported
+    :return: tuple (version, loxmodel.LoxModel), the version is None if
+    the structure definition doesn't tell it
+    .. raises:: ValueError or KeyError if it can't be parsed
+
+    """
+    if types is None:
+        types = loxtypes.TYPES
+    raw = loxparser.parse(fileobj, sorted(types))
+    model = loxmodel.LoxModel.from_structure(raw)
+    model.add_controls(raw['controls'], types)
+    model.build_indexes()
+    return raw.get('lastModified'), model
+
+
+def from_miniserver(**parameters):
+    """
+    Load the structure definition of a miniserver.
+
+    :param parameters: neuron parameters, at least lx_ip, lx_user and
+    lx_password
+    :return: tuple (version, loxmodel.LoxModel)
+    .. raises:: SnapshotError if the structure definition can't be
+    loaded or the miniserver doesn't tell its version, ValueError if
+    lx_ip, lx_user or lx_password is missing
+
+    """
+    from loxclient import LoxClient
+    parameters["lx_cachedir"] = ""
+    parameters.pop("lx_servers", None)
+    client = LoxClient(**parameters)
+    if not client.connect():
+        raise SnapshotError("%s doesn't send its structure definition" %
+                            parameters.get("lx_ip"))
+    version = client.get_structure_version()
+    if version is None:
+        raise SnapshotError("%s doesn't tell the version of its structure "
+                            "definition" % parameters.get("lx_ip"))
+    return version, client.load_model(version)
+
+
+def main(argv=None):
+    """
+    Write a snapshot of a miniserver or of a saved structure definition.
+
+    :param argv: command line arguments, default sys.argv[1:]
+    :return: exit code
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Write a snapshot of the structure definition of a "
+        "miniserver")
+    parser.add_argument("snapshot", help="path of the snapshot written")
+    parser.add_argument("--structure",
+                        help="saved Loxapp3.json instead of a miniserver")
+    parser.add_argument("--variables",
+                        help="Kalliope variables file with lx_ip, lx_user "
+                        "and lx_password")
+    parser.add_argument("--ip", dest="lx_ip", help="miniserver ip")
+    parser.add_argument("--user", dest="lx_user", help="miniserver user")
+    parser.add_argument("--password", dest="lx_password",
+                        help="miniserver user password")
+    args = parser.parse_args(argv)
+
+    parameters = {}
+    if args.variables is not None:
+        from loxprewarm import load_variables
+        parameters.update(load_variables(args.variables))
+    # the command line overrides the variables file
+    for name in ("lx_ip", "lx_user", "lx_password"):
+        if getattr(args, name) is not None:
+            parameters[name] = getattr(args, name)
+
+    try:
+        if args.structure is not None:
+            with open(args.structure, 'rb') as f:
+                version, model = from_structure(f)
+        else:
+            version, model = from_miniserver(**parameters)
+        dump(args.snapshot, model, version, parameters.get("lx_ip"))
+    except Exception as e:
+        logger.error("Loxscontrol: Snapshot failed: %s", e)
+        return 1
+    print("%s: %d controls of version %s written" %
+          (args.snapshot, len(model.records), version))
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    sys.exit(main())
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""State table of a Loxone miniserver, kept current by status updates."""
+
+import binascii
+import struct
+import threading
+import time
+
+# Binary layout of the event tables
+_UUID = struct.Struct("<IHH8s")
+_VALUE_EVENT = struct.Struct("<IHH8sd")
+_TEXT_EVENT_HEAD = struct.Struct("<IHH8sIHH8sI")
+
+
+def uuid_to_str(data1, data2, data3, data4):
+    """
+    Return the string form of a binary Loxone UUID.
+
+    :return: uuid like 0c10052e-0094-3a8f-ffff403fb0c34b9e
+
+    """
+    return "%08x-%04x-%04x-%s" % (data1, data2, data3,
+                                  binascii.hexlify(data4).decode('ascii'))
+
+
+def uuid_to_bytes(uuid):
+    """
+    Return the binary form of a Loxone UUID string.
+
+    :param uuid: uuid like 0c10052e-0094-3a8f-ffff403fb0c34b9e
+    :return: 16 bytes
+
+    """
+    data1, data2, data3, data4 = uuid.split("-")
+    return _UUID.pack(int(data1, 16), int(data2, 16), int(data3, 16),
+                      binascii.unhexlify(data4))
+
+
+def parse_value_events(data):
+    """
+    Parse a value event table.
+
+    Each event is the binary uuid of a state and its value as double.
+
+    :param data: binary event table
+    :return: list of tuples (state uuid, value)
+
+    """
+    events = []
+    size = _VALUE_EVENT.size
+    for offset in range(0, len(data) - size + 1, size):
+        data1, data2, data3, data4, value = _VALUE_EVENT.unpack_from(
+            data, offset)
+        events.append((uuid_to_str(data1, data2, data3, data4), value))
+    return events
+
+
+def parse_text_events(data):
+    """
+    Parse a text event table.
+
+    Each event is the binary uuid of a state, the uuid of its icon and
+    the text, padded to a multiple of 4 bytes.
+
+    :param data: binary event table
+    :return: list of tuples (state uuid, text)
+
+    """
+    events = []
+    offset = 0
+    while offset + _TEXT_EVENT_HEAD.size <= len(data):
+        event = _TEXT_EVENT_HEAD.unpack_from(data, offset)
+        length = event[8]
+        offset += _TEXT_EVENT_HEAD.size
+        text = data[offset:offset + length].decode('utf-8', 'replace')
+        offset += (length + 3) // 4 * 4
+        events.append((uuid_to_str(*event[:4]), text))
+    return events
+
+
+class LoxStateTable(object):
+
+    """
+    Current values of the states of a miniserver, indexed by state uuid.
+
+    Reading never blocks on the network. The table is live as long as
+    the miniserver sends status updates.
+
+    """
+
+    def __init__(self):
+        """Create an empty table."""
+        self._values = {}
+        self._condition = threading.Condition()
+        self.live = False
+        self.updated = None
+
+    @property
+    def warm(self):
+        """Return True if the table is live and holds values."""
+        return self.live and self.updated is not None
+
+    def get(self, uuid, default=None):
+        """
+        Return the current value of a state.
+
+        :param uuid: uuid of the state
+        :param default: returned if the state is unknown
+        :return: float or text value
+
+        """
+        return self._values.get(uuid, default)
+
+    def set_live(self, live):
+        """
+        Mark the table as (not) receiving status updates.
+
+        :param live: True if status updates are received
+
+        """
+        with self._condition:
+            self.live = live
+            if not live:
+                self.updated = None
+            self._condition.notify_all()
+
+    def update(self, events):
+        """
+        Store new values and wake up everyone waiting for them.
+
+        :param events: list of tuples (state uuid, value)
+
+        """
+        with self._condition:
+            for uuid, value in events:
+                self._values[uuid] = value
+            self.updated = time.time()
+            self._condition.notify_all()
+
+    def update_values(self, data):
+        """Store the values of a binary value event table."""
+        self.update(parse_value_events(data))
+
+    def update_texts(self, data):
+        """Store the texts of a binary text event table."""
+        self.update(parse_text_events(data))
+
+    def wait_for(self, uuid, expected, timeout):
+        """
+        Wait until a state has the expected value.
+
+        :param uuid: uuid of the state
+        :param expected: expected value
+        :param timeout: max. time to wait in seconds
+        :return: True if the state has the expected value, False if not
+        or if the table is not live
+
+        """
+        end = time.time() + timeout
+        with self._condition:
+            while self._values.get(uuid) != expected:
+                remaining = end - time.time()
+                if not self.live or remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Timing of the phases of an order and counters of events."""
+
+import functools
+import os
+import tempfile
+import threading
+import time
+
+# Prefix of the names in the Prometheus text format
+PREFIX = "loxscontrol"
+
+
+class Stats(object):
+
+    """
+    Time per phase and counters, safe to use from several threads.
+
+    Each order has its own Stats with the process-wide STATS as parent.
+    Everything recorded is also recorded by the parent. Recording takes
+    a lock and some additions, so it is always on.
+
+    """
+
+    def __init__(self, parent=None):
+        """
+        Create empty stats.
+
+        :param parent: Stats also recording everything, or None
+
+        """
+        self.parent = parent
+        self._lock = threading.Lock()
+        # phase -> [count, total seconds, max seconds]
+        self._timers = {}
+        # (name, ((label, value), ...)) -> count
+        self._counters = {}
+
+    def observe(self, phase, seconds):
+        """
+        Record the duration of a phase.
+
+        :param phase: name of the phase, e.g. load_config
+        :param seconds: duration
+
+        """
+        with self._lock:
+            timer = self._timers.get(phase)
+            if timer is None:
+                self._timers[phase] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+        if self.parent is not None:
+            self.parent.observe(phase, seconds)
+
+    def count(self, name, **labels):
+        """
+        Count an event.
+
+        :param name: name of the counter, e.g. structure_cache
+        :param labels: labels of the event, e.g. result="miss"
+
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+        if self.parent is not None:
+            self.parent.count(name, **labels)
+
+    def timer(self, phase):
+        """
+        Return a context manager recording the duration of a phase.
+
+        :param phase: name of the phase
+
+        """
+        return _Timer(self, phase)
+
+    def get_counter(self, name, **labels):
+        """Return the count of an event."""
+        with self._lock:
+            return self._counters.get(
+                (name, tuple(sorted(labels.items()))), 0)
+
+    def get_timer(self, phase):
+        """Return tuple (count, total seconds, max seconds) of a phase."""
+        with self._lock:
+            return tuple(self._timers.get(phase, (0, 0.0, 0.0)))
+
+    def clear(self):
+        """Forget everything recorded."""
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+
+    def summary(self):
+        """
+        Return everything recorded, e.g. to be logged as JSON.
+
+        :return: dict with phase -> total ms and counter -> count.
+        Counters with labels are named like name{label=value}.
+
+        """
+        with self._lock:
+            timers = dict((phase, round(timer[1] * 1000.0, 3))
+                          for phase, timer in self._timers.items())
+            counters = dict((_format_name(name, labels), count)
+                            for (name, labels), count
+                            in self._counters.items())
+        return {"ms": timers, "counts": counters}
+
+    def render(self):
+        """
+        Return everything recorded in the Prometheus text format.
+
+        :return: str
+
+        """
+        lines = []
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+
+        if timers:
+            name = PREFIX + "_phase_seconds"
+            lines.append("# TYPE %s summary" % name)
+            for phase, (count, total, _) in timers:
+                labels = (("phase", phase),)
+                lines.append("%s %d" % (
+                    _format_name(name + "_count", labels), count))
+                lines.append("%s %.6f" % (
+                    _format_name(name + "_sum", labels), total))
+            name = PREFIX + "_phase_seconds_max"
+            lines.append("# TYPE %s gauge" % name)
+            for phase, (_, _, maximum) in timers:
+                lines.append("%s %.6f" % (
+                    _format_name(name, (("phase", phase),)), maximum))
+
+        declared = set()
+        for (name, labels), count in counters:
+            name = "%s_%s_total" % (PREFIX, name)
+            if name not in declared:
+                lines.append("# TYPE %s counter" % name)
+                declared.add(name)
+            lines.append("%s %d" % (_format_name(name, labels), count))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write everything recorded in the Prometheus text format.
+
+        The file is replaced in one step, e.g. for the textfile collector
+        of the Prometheus node exporter.
+
+        :param path: path of the stats file
+        .. raises:: EnvironmentError if the file can't be written
+
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmpname = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.render())
+        os.rename(tmpname, path)
+
+
+class _Timer(object):
+
+    """Context manager recording the duration of a phase."""
+
+    def __init__(self, stats, phase):
+        """Prepare timing a phase, recorded by stats."""
+        self._stats = stats
+        self._phase = phase
+        self._start = None
+
+    def __enter__(self):
+        """Start timing."""
+        self._start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Record the duration, also if an exception is raised."""
+        self._stats.observe(self._phase, time.time() - self._start)
+        return False
+
+
+def _format_name(name, labels):
+    """Return name{label="value",...}."""
+    if not labels:
+        return name
+    return "%s{%s}" % (name, ",".join(
+        '%s="%s"' % (label, str(value).replace('"', '\\"'))
+        for label, value in labels))
+
+
+# Stats of the process, parent of the stats of all orders
+STATS = Stats()
+
+
+def timed(phase):
+    """
+    Decorate a method to record its duration as phase.
+
+    The duration is recorded by the _stats of the instance, if it has
+    one, otherwise by STATS.
+
+    :param phase: name of the phase
+
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = getattr(self, "_stats", None) or STATS
+            with stats.timer(phase):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,514 @@
+# -*- coding: utf-8 -*-
+"""
+Token-based authentication with the miniservers.
+
+Instead of sending user and password with every request, a token is
+acquired once with a salted hash of the password. It is kept on disk
+with its expiry, so that all processes on the host use the same token,
+and refreshed in the background before it expires. Requests send it as
+the query parameters autht and user.
+
+"""
+
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from requests.auth import AuthBase
+try:
+    from urllib.parse import quote, urlsplit, urlunsplit, parse_qsl, \
+        urlencode
+except ImportError:
+    from urllib import quote, urlencode
+    from urlparse import urlsplit, urlunsplit, parse_qsl
+
+import loxcachedir
+import loxstats
+
+logger = logging.getLogger("kalliope")
+
+# Requests of the token flow
+GETKEY2 = "/jdev/sys/getkey2/"
+GETKEY = "/jdev/sys/getkey"
+GETJWT = "/jdev/sys/getjwt/"
+REFRESHJWT = "/jdev/sys/refreshjwt/"
+
+# Permission of the tokens: 2 web (short-lived), 4 app (long-lived)
+PERMISSION = 4
+# Client name shown by the miniserver in its token list
+INFO = "kalliope"
+# Validity of tokens is told in seconds since 2009-01-01 00:00:00 UTC
+EPOCH = 1230768000
+# Default seconds before the expiry a token is refreshed, at most half
+# of its remaining validity
+REFRESH = 3600.0
+# Seconds until a failed refresh is tried again
+RETRY = 30.0
+# Default timeout of the token requests
+TIMEOUT = 5.0
+
+
+# One token per miniserver and user, shared by all neuron instances of
+# the process. Key is (host, user).
+_managers = {}
+_managers_lock = threading.Lock()
+
+
+class TokenError(requests.exceptions.RequestException):
+
+    """Token can't be acquired or refreshed."""
+
+
+def get_manager(host, user, password, session, cachedir=None,
+                timeout=TIMEOUT, refresh=REFRESH):
+    """
+    Return the token manager of a miniserver and user.
+
+    The manager is created on first use, or again if the password, the
+    session or the directory of the token changed.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param user: miniserver user
+    :param password: miniserver user password
+    :param session: requests.Session of the miniserver sending the
+    token requests
+    :param cachedir: directory of the token shared with other
+    processes, None to keep it in memory only
+    :param timeout: timeout of the token requests in seconds
+    :param refresh: seconds before the expiry the token is refreshed
+    :return: TokenManager
+
+    """
+    key = (host, user)
+    with _managers_lock:
+        manager = _managers.get(key)
+        if manager is None or manager.password != password or \
+                manager.session is not session or \
+                manager.cachedir != cachedir:
+            if manager is not None:
+                manager.stop()
+            manager = TokenManager(host, user, password, session, cachedir,
+                                   timeout, refresh)
+            _managers[key] = manager
+        return manager
+
+
+def clear_managers():
+    """Stop refreshing, forget all tokens kept in memory."""
+    with _managers_lock:
+        for manager in _managers.values():
+            manager.stop()
+        _managers.clear()
+
+
+def _hexdigest(algorithm, key, message):
+    """
+    Return the HMAC of a message as hex string.
+
+    :param algorithm: SHA1 or SHA256, as told by the miniserver
+    :param key: key as hex string, as sent by the miniserver
+    :param message: str
+    :return: lower case hex string
+
+    """
+    return hmac.new(binascii.unhexlify(key), message.encode('utf-8'),
+                    _hashfunction(algorithm)).hexdigest()
+
+
+def _hashfunction(algorithm):
+    """Return the hashlib function of SHA1 or SHA256."""
+    if str(algorithm).upper() == "SHA256":
+        return hashlib.sha256
+    return hashlib.sha1
+
+
+def _no_auth(request):
+    """Send a request of the token flow without authorization."""
+    return request
+
+
+class TokenManager(object):
+
+    """
+    Token of one user of a miniserver.
+
+    The token is taken from memory, then from the token file of the
+    cache directory, and acquired only if neither is valid. A background
+    thread refreshes it before it expires and writes it to the token
+    file. Before refreshing, a newer token written by another process is
+    taken instead.
+
+    """
+
+    def __init__(self, host, user, password, session, cachedir=None,
+                 timeout=TIMEOUT, refresh=REFRESH):
+        """
+        Set up the manager, the token is acquired on first use.
+
+        :param host: ip or hostname of the miniserver, optional with port
+        :param user: miniserver user
+        :param password: miniserver user password
+        :param session: requests.Session of the miniserver, token
+        requests fail fast while it is unreachable
+        :param cachedir: directory of the token file, None for none
+        :param timeout: timeout of the token requests in seconds
+        :param refresh: seconds before the expiry the token is refreshed
+
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.session = session
+        self.cachedir = cachedir
+        self.timeout = timeout
+        self.refresh_before = refresh
+        self._lock = threading.Lock()
+        # dict with token, key, algorithm, expires (unix time) and client
+        self._token = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def path(self):
+        """Return the path of the token file, None if none or unsafe."""
+        if not self.cachedir:
+            return None
+        try:
+            loxcachedir.secure(self.cachedir)
+        except OSError as e:
+            logger.debug("Loxscontrol: Token file not used: %s", e)
+            return None
+        name = re.sub(r'[^A-Za-z0-9_.-]', '_',
+                      "%s_%s" % (self.host, self.user))
+        return os.path.join(self.cachedir, "token_%s.json" % name)
+
+    @property
+    def expires(self):
+        """Return the expiry of the token as unix time, None if none."""
+        token = self._token
+        return token['expires'] if token is not None else None
+
+    def get_token(self):
+        """
+        Return a valid token, acquire one if needed.
+
+        :return: token str
+        .. raises:: TokenError if no token can be acquired
+
+        """
+        with self._lock:
+            if not self._is_valid(self._token):
+                stored = self._load()
+                if self._is_valid(stored):
+                    self._token = stored
+                    loxstats.STATS.count("tokens", result="file")
+                else:
+                    self._token = self._acquire(stored)
+                    self._save(self._token)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            return self._token['token']
+
+    def invalidate(self, token):
+        """
+        Forget a token the miniserver refused, e.g. after it was revoked.
+
+        :param token: token str refused
+
+        """
+        with self._lock:
+            if self._token is not None and self._token['token'] == token:
+                self._token = None
+            stored = self._load()
+            if stored is not None and stored['token'] == token:
+                self._remove()
+
+    def refresh(self):
+        """
+        Refresh the token, acquire a new one if it can't be refreshed.
+
+        A token written by another process which expires later is taken
+        instead.
+
+        :return: True if the token was refreshed or taken, False if a new
+        one was acquired
+        .. raises:: TokenError if no token can be acquired
+
+        """
+        with self._lock:
+            stored = self._load()
+            if self._is_valid(stored) and (
+                    self._token is None or
+                    stored['expires'] > self._token['expires']):
+                self._token = stored
+                loxstats.STATS.count("tokens", result="file")
+                return True
+            try:
+                self._token = self._refresh(self._token)
+                refreshed = True
+            except TokenError as e:
+                logger.debug("Loxscontrol: Token of %s@%s can't be "
+                             "refreshed: %s", self.user, self.host, e)
+                self._token = self._acquire(self._token)
+                refreshed = False
+            self._save(self._token)
+            return refreshed
+
+    def stop(self):
+        """Stop refreshing the token."""
+        self._stopped.set()
+
+    def _is_valid(self, token):
+        """Return True if a token doesn't expire within the timeout."""
+        return token is not None and \
+            token['expires'] > time.time() + self.timeout
+
+    def _request(self, path):
+        """
+        Send a request of the token flow, without authorization.
+
+        :param path: path incl. its arguments
+        :return: value of the answer
+        .. raises:: TokenError if the request fails or is refused
+
+        """
+        try:
+            r = self.session.get("http://" + self.host + path,
+                                 timeout=self.timeout, auth=_no_auth)
+            r.raise_for_status()
+            answer = r.json()['LL']
+        except requests.exceptions.RequestException as e:
+            raise TokenError("%s failed: %s" % (path.split("/")[3], e))
+        except (ValueError, KeyError, TypeError):
+            raise TokenError("%s can't be parsed" % path.split("/")[3])
+        code = answer.get('Code', answer.get('code'))
+        if code is not None and str(code) != "200":
+            raise TokenError("%s refused with code %s" %
+                             (path.split("/")[3], code))
+        return answer.get('value')
+
+    def _acquire(self, previous=None):
+        """
+        Acquire a new token with the salted hash of the password.
+
+        :param previous: token before, its client uuid is kept
+        :return: dict with token, key, algorithm, expires and client
+
+        """
+        value = self._request(GETKEY2 + quote(self.user, safe=""))
+        try:
+            algorithm = value.get('hashAlg', "SHA1")
+            pwhash = _hashfunction(algorithm)(
+                ("%s:%s" % (self.password, value['salt'])).encode('utf-8')
+                ).hexdigest().upper()
+            digest = _hexdigest(algorithm, value['key'],
+                                "%s:%s" % (self.user, pwhash))
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise TokenError("getkey2 can't be parsed: %r" % e)
+        client = previous['client'] if previous is not None \
+            else str(uuid.uuid4())
+        value = self._request("%s%s/%s/%d/%s/%s" % (
+            GETJWT, digest, quote(self.user, safe=""), PERMISSION, client,
+            INFO))
+        token = self._parse(value, client)
+        # refreshing hashes the token the same way
+        token['algorithm'] = algorithm
+        loxstats.STATS.count("tokens", result="acquired")
+        logger.debug("Loxscontrol: Token of %s@%s acquired, valid for %d s",
+                     self.user, self.host, token['expires'] - time.time())
+        return token
+
+    def _refresh(self, token):
+        """
+        Request a token with a later expiry for a token.
+
+        :param token: dict of the current token
+        :return: dict of the new token
+        .. raises:: TokenError if it can't be refreshed
+
+        """
+        if token is None:
+            raise TokenError("no token")
+        key = self._request(GETKEY)
+        try:
+            digest = _hexdigest(token.get('algorithm'), key, token['token'])
+        except (TypeError, ValueError) as e:
+            raise TokenError("getkey can't be parsed: %r" % e)
+        value = self._request("%s%s/%s" % (REFRESHJWT, digest,
+                                           quote(self.user, safe="")))
+        refreshed = self._parse(dict(token, **(value or {})),
+                                token['client'])
+        loxstats.STATS.count("tokens", result="refreshed")
+        logger.debug("Loxscontrol: Token of %s@%s refreshed",
+                     self.user, self.host)
+        return refreshed
+
+    def _parse(self, value, client):
+        """
+        Return the token of an answer of getjwt or refreshjwt.
+
+        :param value: value of the answer
+        :param client: client uuid the token was acquired with
+        :return: dict with token, key, expires and client
+        .. raises:: TokenError if the answer has no token
+
+        """
+        try:
+            return {"token": value['token'], "key": value.get('key'),
+                    "algorithm": value.get('algorithm'),
+                    "expires": EPOCH + float(value['validUntil']),
+                    "client": client}
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise TokenError("token can't be parsed: %r" % e)
+
+    def _load(self):
+        """Return the token of the token file, None if there is none."""
+        path = self.path
+        if path is None:
+            return None
+        try:
+            with open(path, 'r') as f:
+                token = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(token, dict) or not all(
+                name in token for name in ("token", "expires", "client")):
+            return None
+        return token
+
+    def _save(self, token):
+        """
+        Write the token file, readable by the owner only.
+
+        It is written to a temporary file first, so that another process
+        never reads a partially written token.
+
+        """
+        path = self.path
+        if path is None:
+            return
+        try:
+            fd, tmpname = tempfile.mkstemp(dir=self.cachedir,
+                                           suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(token, f)
+                os.rename(tmpname, path)
+            except (IOError, OSError):
+                os.remove(tmpname)
+                raise
+        except (IOError, OSError) as e:
+            logger.debug("Loxscontrol: Token file %s cannot be written: %s",
+                         path, e)
+
+    def _remove(self):
+        """Remove the token file."""
+        path = self.path
+        if path is None:
+            return
+        try:
+            os.remove(path)
+        except (IOError, OSError):
+            pass
+
+    def _run(self):
+        """Refresh the token before it expires until stopped."""
+        while not self._stopped.is_set():
+            expires = self.expires
+            if expires is None:
+                delay = RETRY
+            else:
+                remaining = expires - time.time()
+                delay = remaining - min(self.refresh_before, remaining / 2)
+            if self._stopped.wait(max(delay, 0)):
+                break
+            if self.expires is not None and self.expires != expires:
+                # taken from the token file or acquired again meanwhile
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                # keep the token, the next try might work
+                logger.debug("Loxscontrol: Token of %s@%s can't be "
+                             "acquired: %r", self.user, self.host, e)
+                self._stopped.wait(RETRY)
+
+
+class TokenAuth(AuthBase):
+
+    """
+    Authorization of requests by the token of a TokenManager.
+
+    A request refused with 401 is sent again once with a new token,
+    e.g. after the token was revoked on the miniserver.
+
+    """
+
+    PARAMS = ("autht", "user")
+
+    def __init__(self, manager):
+        """
+        Authorize by a token manager.
+
+        :param manager: TokenManager of the miniserver and user
+
+        """
+        self.manager = manager
+
+    def __eq__(self, other):
+        return self.manager is getattr(other, 'manager', None)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __call__(self, request):
+        """Add the token to a prepared request."""
+        self._authorize(request, self.manager.get_token())
+        request.register_hook('response', self.handle_401)
+        return request
+
+    def _authorize(self, request, token):
+        """Set the query parameters autht and user of a request."""
+        scheme, netloc, path, query, fragment = urlsplit(request.url)
+        params = [(name, value) for name, value in parse_qsl(query)
+                  if name not in self.PARAMS]
+        params.extend([("autht", token), ("user", self.manager.user)])
+        request.url = urlunsplit((scheme, netloc, path, urlencode(params),
+                                  fragment))
+
+    def handle_401(self, response, **kwargs):
+        """Send a request refused with 401 again with a new token."""
+        if response.status_code != 401 or \
+                getattr(response.request, '_loxtoken_retried', False):
+            return response
+        token = dict(parse_qsl(urlsplit(response.request.url)[3])).get(
+            "autht")
+        self.manager.invalidate(token)
+        try:
+            token = self.manager.get_token()
+        except TokenError as e:
+            logger.debug("Loxscontrol: No new token for %s: %s",
+                         self.manager.host, e)
+            return response
+
+        # the body of the refused response is not used
+        response.content
+        response.close()
+        request = response.request.copy()
+        self._authorize(request, token)
+        request._loxtoken_retried = True
+        retried = response.connection.send(request, **kwargs)
+        retried.history.append(response)
+        retried.request = request
+        return retried
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Registry of the control types supported and their commands."""
+
+
+def normalize_state(newstate):
+    """
+    Return the normalized form of a requested state.
+
+    :param newstate: state as given to the neuron, e.g. "On" or "50 %"
+    :return: lower case state without spaces
+
+    """
+    if isinstance(newstate, bytes):
+        newstate = newstate.decode('utf-8')
+    return (u"%s" % newstate).lower().replace(u" ", u"")
+
+
+class ControlType(object):
+
+    """
+    Description of a control type of the structure definition.
+
+    It tells whether controls of the type are used, which states they
+    accept and which command is sent for each state.
+
+    """
+
+    def __init__(self, name, states=None, value=None, status=None,
+                 verify=None, standalone=True, subcontrols=False,
+                 integer=False, off=None):
+        """
+        Describe a control type.
+
+        :param name: type as given in the structure definition
+        :param states: dict state -> command, states are lower case
+        :param value: tuple (command template, min, max) for numeric
+        states, the value is inserted at %s
+        :param status: name of the state reported by the status action
+        :param verify: tuple (state name, {command: expected value}),
+        checked after a command was sent
+        :param standalone: controls of the type are used themselves
+        :param subcontrols: supported subcontrols of controls of the
+        type are used
+        :param integer: numeric states must be integers, e.g. ids
+        :param off: values of the status state meaning off, as text
+        without brackets, e.g. of a list of ids
+
+        """
+        self.name = name
+        self.states = states or {}
+        self.value = value
+        self.status = status
+        self.verify = verify
+        self.standalone = standalone
+        self.subcontrols = subcontrols
+        self.integer = integer
+        self.off = off or ()
+
+    def command(self, newstate):
+        """
+        Return the command setting a state.
+
+        :param newstate: requested state, e.g. on, up or 50
+        :return: command or None if the state is not valid for the type
+
+        """
+        if newstate is None:
+            return None
+        state = normalize_state(newstate)
+        if state in self.states:
+            return self.states[state]
+        if self.value is None:
+            return None
+
+        template, low, high = self.value
+        try:
+            value = float(state.rstrip(u"%").replace(u",", u"."))
+        except ValueError:
+            return None
+        if not low <= value <= high:
+            return None
+        if self.integer:
+            if value != int(value):
+                return None
+            return template % (u"%d" % value)
+        return template % (u"%g" % value)
+
+    def status_value(self, value):
+        """
+        Return the value of the status state as told to the user.
+
+        Values meaning off are told as 0, other values as they are.
+
+        :param value: value of the status state, None if unknown
+        :return: value, 0 if it means off
+
+        """
+        if value is None or not self.off:
+            return value
+        if (u"%s" % value).strip(u"[] ") in self.off:
+            return 0
+        return value
+
+    def describe(self):
+        """
+        Return the valid states, e.g. to tell them the user.
+
+        :return: list of states and value ranges
+
+        """
+        states = sorted(self.states)
+        if self.value is not None:
+            states.append(u"%g-%g" % self.value[1:])
+        return states
+
+
+def _aliases(commands, aliases):
+    """
+    Return the states of a type.
+
+    :param commands: commands, each can be requested by its lower case
+    name
+    :param aliases: dict additional state -> command
+    :return: dict state -> command
+
+    """
+    states = dict((command.lower(), command) for command in commands)
+    states.update(aliases)
+    return states
+
+
+# States of types switched on and off
+_SWITCH = _aliases(["on", "off", "pulse"],
+                   {u"an": u"on", u"ein": u"on", u"aus": u"off"})
+
+TYPES = dict((controltype.name, controltype) for controltype in [
+    ControlType("Switch", _SWITCH, status="active",
+                verify=("active", {"on": 1, "off": 0})),
+    ControlType("TimedSwitch", _SWITCH, status="active",
+                verify=("active", {"on": 1, "off": 0})),
+    ControlType("Pushbutton", _SWITCH, status="active",
+                verify=("active", {"on": 1, "off": 0})),
+    # brightness in percent
+    ControlType("Dimmer", _aliases(["on", "off"], {
+        u"an": u"on", u"ein": u"on", u"aus": u"off"}),
+        value=("%s", 0, 100), status="position"),
+    # only the switches of the old light controller are used
+    ControlType("LightController", standalone=False, subcontrols=True),
+    # moods by id, 777 is bright light, 778 is off
+    ControlType("LightControllerV2", _aliases(["plus", "minus"], {
+        u"on": u"changeTo/777", u"an": u"changeTo/777",
+        u"ein": u"changeTo/777", u"off": u"changeTo/778",
+        u"aus": u"changeTo/778"}),
+        value=("changeTo/%s", 0, 778), status="activeMoods",
+        subcontrols=True, integer=True, off=(u"", u"778", u"778.0")),
+    # position in percent, 0 is up. up and down move completely, the
+    # commands up and down of the miniserver move until UpOff/DownOff.
+    ControlType("Jalousie", _aliases(
+        ["FullUp", "FullDown", "stop", "shade", "auto", "NoAuto"], {
+            u"up": u"FullUp", u"hoch": u"FullUp", u"auf": u"FullUp",
+            u"open": u"FullUp", u"down": u"FullDown",
+            u"runter": u"FullDown", u"zu": u"FullDown",
+            u"close": u"FullDown", u"beschatten": u"shade"}),
+        value=("manualPosition/%s", 0, 100), status="position"),
+    # operating modes, 0 is automatic, 5 manual heating, and the comfort
+    # temperature in degrees
+    ControlType("IRoomController", {
+        u"auto": u"mode/0", u"automatik": u"mode/0",
+        u"manual": u"mode/5", u"manuell": u"mode/5"},
+        value=("settemp/1/%s", 5, 40), status="tempActual"),
+])
@@ -0,0 +1,418 @@
+# -*- coding: utf-8 -*-
+"""Persistent WebSocket connection to a Loxone miniserver."""
+
+import binascii
+import collections
+import hashlib
+import hmac
+import json
+import logging
+import struct
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+import loxstate
+
+try:
+    import websocket
+except ImportError:
+    websocket = None
+
+logger = logging.getLogger("kalliope")
+
+# Path of the websocket interface and its protocol
+WSPATH = "/ws/rfc6455"
+PROTOCOL = "remotecontrol"
+
+# Send a keepalive if the connection is idle, the miniserver closes
+# idle connections after 5 minutes
+KEEPALIVE = 60.0
+
+# Don't try to connect again for some seconds after connecting failed
+RECONNECT_DELAY = 30.0
+
+# Message types announced by the binary header of each message
+MSG_TEXT = 0
+MSG_FILE = 1
+MSG_VALUE_EVENTS = 2
+MSG_TEXT_EVENTS = 3
+MSG_DAYTIMER_EVENTS = 4
+MSG_OUT_OF_SERVICE = 5
+MSG_KEEPALIVE = 6
+MSG_WEATHER_EVENTS = 7
+
+# One connection per miniserver and user, shared by all neuron instances
+# of the process. Key is (host, user).
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+class LoxWebSocketError(Exception):
+
+    """Connection to the miniserver failed or was lost."""
+
+    pass
+
+
+def is_available():
+    """Return True if the websocket-client package is installed."""
+    return websocket is not None
+
+
+def get_connection(host, user, password, timeout, statusupdates=False):
+    """
+    Return the shared websocket connection of a miniserver.
+
+    The connection is opened and authenticated on first use, or again
+    if it was lost.
+
+    :param host: ip or hostname of the miniserver, optional with port
+    :param user: miniserver user
+    :param password: miniserver user password
+    :param timeout: timeout for connecting and each command in seconds
+    :param statusupdates: keep the state table of the connection current
+    :return: connected LoxWebSocket
+    .. raises:: LoxWebSocketError
+
+    """
+    key = (host, user)
+    with _connections_lock:
+        connection = _connections.get(key)
+        if connection is None or connection.password != password:
+            if connection is not None:
+                connection.close()
+            connection = LoxWebSocket(host, user, password, timeout)
+            _connections[key] = connection
+    connection.connect()
+    if statusupdates:
+        connection.enable_status_updates()
+    return connection
+
+
+def close_connections():
+    """Close all shared websocket connections."""
+    with _connections_lock:
+        for connection in _connections.values():
+            connection.close()
+        _connections.clear()
+
+
+def normalize_command(command):
+    """
+    Return the key used to match a response to its command.
+
+    The miniserver answers jdev/... commands with dev/... in the
+    control field.
+
+    :param command: command or control field of the response
+    :return: normalized command
+
+    """
+    command = command.lstrip("/")
+    if command.startswith("jdev/"):
+        command = command[1:]
+    return command
+
+
+class LoxWebSocket(object):
+
+    """
+    Authenticated websocket connection to a miniserver.
+
+    Commands of several threads are multiplexed over the connection.
+    A background thread reads all messages and hands each response to
+    the command waiting for it. If status updates are enabled, it keeps
+    the state table of the connection current.
+
+    """
+
+    def __init__(self, host, user, password, timeout):
+        """
+        Set up the connection, connect() opens it.
+
+        :param host: ip or hostname of the miniserver, optional with port
+        :param user: miniserver user
+        :param password: miniserver user password
+        :param timeout: timeout for connecting and each command in seconds
+
+        """
+        self.host = host
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self._ws = None
+        self._reader = None
+        self._authenticated = False
+        self._failed_at = None
+        self._connect_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        # commands waiting for a response, in the order they were sent
+        self._pending = collections.OrderedDict()
+        self._statusupdates = False
+        self.states = loxstate.LoxStateTable()
+
+    @property
+    def connected(self):
+        """Return True if the connection is open and authenticated."""
+        return self._ws is not None and self._authenticated
+
+    def connect(self):
+        """
+        Open and authenticate the connection if it is not open.
+
+        .. raises:: LoxWebSocketError
+
+        """
+        with self._connect_lock:
+            if self.connected:
+                return
+            if websocket is None:
+                raise LoxWebSocketError("websocket-client is not installed")
+            if self._failed_at is not None and \
+                    time.time() - self._failed_at < RECONNECT_DELAY:
+                raise LoxWebSocketError("Connecting failed recently")
+
+            try:
+                ws = websocket.create_connection(
+                    "ws://" + self.host + WSPATH, timeout=self.timeout,
+                    subprotocols=[PROTOCOL])
+            except (websocket.WebSocketException, EnvironmentError) as e:
+                self._failed_at = time.time()
+                raise LoxWebSocketError("Connecting failed: %s" % e)
+            ws.settimeout(KEEPALIVE)
+            with self._lock:
+                self._ws = ws
+            self._reader = threading.Thread(target=self._read, args=(ws,))
+            self._reader.daemon = True
+            self._reader.start()
+
+            try:
+                self.authenticate()
+            except LoxWebSocketError:
+                self._failed_at = time.time()
+                self.close()
+                raise
+            self._authenticated = True
+            self._failed_at = None
+            if self._statusupdates:
+                self._request_status_updates()
+        logger.debug("Loxscontrol: Websocket to %s@%s connected",
+                     self.user, self.host)
+
+    def enable_status_updates(self):
+        """
+        Let the miniserver push all state changes to this connection.
+
+        The miniserver sends all current values first, then every change.
+        Status updates are requested again after a reconnect.
+
+        .. raises:: LoxWebSocketError
+
+        """
+        with self._connect_lock:
+            if self._statusupdates:
+                return
+            self._request_status_updates()
+            self._statusupdates = True
+
+    def _request_status_updates(self):
+        """
+        Send the command enabling status updates.
+
+        .. raises:: LoxWebSocketError
+
+        """
+        response = self.command("jdev/sps/enablebinstatusupdate")
+        if str(response.get('Code')) != "200":
+            raise LoxWebSocketError("Status updates failed with code %s" %
+                                    response.get('Code'))
+        self.states.set_live(True)
+
+    def authenticate(self):
+        """
+        Authenticate the user with a hash of user and password.
+
+        .. raises:: LoxWebSocketError
+
+        """
+        key = self.command("jdev/sys/getkey")['value']
+        try:
+            key = binascii.unhexlify(key)
+        except (TypeError, ValueError):
+            raise LoxWebSocketError("Invalid key %r" % key)
+        credentials = ("%s:%s" % (self.user, self.password)).encode('utf-8')
+        digest = hmac.new(key, credentials, hashlib.sha1).hexdigest()
+        response = self.command("authenticate/" + digest)
+        if str(response.get('Code')) != "200":
+            raise LoxWebSocketError("Authentication failed with code %s" %
+                                    response.get('Code'))
+
+    def command(self, command):
+        """
+        Send a command and wait for its response.
+
+        :param command: command, e.g. jdev/sps/io/<uuid>/on
+        :return: LL part of the response, with value and Code
+        .. raises:: LoxWebSocketError
+
+        """
+        future = Future()
+        key = normalize_command(command)
+        with self._send_lock:
+            ws = self._ws
+            if ws is None:
+                raise LoxWebSocketError("Not connected")
+            with self._lock:
+                self._pending.setdefault(key, collections.deque()).append(
+                    future)
+            try:
+                ws.send(command)
+            except (websocket.WebSocketException, EnvironmentError) as e:
+                self._disconnect(ws, e)
+
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            with self._lock:
+                waiting = self._pending.get(key)
+                if waiting is not None and future in waiting:
+                    waiting.remove(future)
+                    if not waiting:
+                        del self._pending[key]
+            raise LoxWebSocketError("No response to %s" % key)
+
+    def close(self):
+        """Close the connection, pending commands fail."""
+        with self._lock:
+            ws = self._ws
+        if ws is not None:
+            self._disconnect(ws, "closed")
+
+    def _disconnect(self, ws, reason):
+        """
+        Drop the connection ws and fail all pending commands.
+
+        :param ws: the websocket to drop
+        :param reason: reason for logging
+
+        """
+        with self._lock:
+            if self._ws is not ws:
+                return
+            self._ws = None
+            self._authenticated = False
+            pending = self._pending
+            self._pending = collections.OrderedDict()
+        self.states.set_live(False)
+        try:
+            ws.close()
+        except (websocket.WebSocketException, EnvironmentError):
+            pass
+        logger.debug("Loxscontrol: Websocket to %s disconnected: %s",
+                     self.host, reason)
+        for waiting in pending.values():
+            for future in waiting:
+                future.set_exception(
+                    LoxWebSocketError("Disconnected: %s" % reason))
+
+    def _read(self, ws):
+        """
+        Read all messages of the connection until it is closed.
+
+        Each message is announced by a binary header with its type.
+
+        :param ws: the websocket to read from
+
+        """
+        msgtype = None
+        while True:
+            try:
+                opcode, data = ws.recv_data()
+            except websocket.WebSocketTimeoutException:
+                # idle, keep the connection open
+                try:
+                    with self._send_lock:
+                        ws.send("keepalive")
+                except (websocket.WebSocketException, EnvironmentError) as e:
+                    self._disconnect(ws, e)
+                    return
+                continue
+            except (websocket.WebSocketException, EnvironmentError,
+                    ValueError) as e:
+                self._disconnect(ws, e)
+                return
+
+            if opcode == websocket.ABNF.OPCODE_CLOSE:
+                self._disconnect(ws, "closed by miniserver")
+                return
+
+            if msgtype is None:
+                header = self._parse_header(data)
+                if header is None:
+                    logger.debug("Loxscontrol: Websocket message without "
+                                 "header ignored")
+                    continue
+                msgtype, estimated = header
+                if msgtype == MSG_KEEPALIVE or msgtype == MSG_OUT_OF_SERVICE:
+                    msgtype = None
+                elif estimated:
+                    # the exact header follows
+                    msgtype = None
+                continue
+
+            if msgtype == MSG_TEXT:
+                self._dispatch(data)
+            elif msgtype == MSG_VALUE_EVENTS:
+                self.states.update_values(data)
+            elif msgtype == MSG_TEXT_EVENTS:
+                self.states.update_texts(data)
+            msgtype = None
+
+    @staticmethod
+    def _parse_header(data):
+        """
+        Parse the binary header announcing the next message.
+
+        :param data: received message
+        :return: tuple (message type, size is estimated) or None if data
+        is not a header
+
+        """
+        if len(data) != 8:
+            return None
+        start, msgtype, info, _, _ = struct.unpack("<BBBBI", data)
+        if start != 0x03:
+            return None
+        return msgtype, bool(info & 0x80)
+
+    def _dispatch(self, data):
+        """
+        Hand a text message to the command waiting for it.
+
+        :param data: received text message
+
+        """
+        if isinstance(data, bytes):
+            data = data.decode('utf-8')
+        try:
+            response = json.loads(data)['LL']
+            key = normalize_command(response['control'])
+        except (ValueError, KeyError, TypeError, AttributeError):
+            logger.debug("Loxscontrol: Websocket message ignored: %r", data)
+            return
+        if 'Code' not in response and 'code' in response:
+            response['Code'] = response['code']
+
+        with self._lock:
+            waiting = self._pending.get(key)
+            if not waiting:
+                # late answer of a command which timed out, or no
+                # command at all
+                logger.debug("Loxscontrol: Unexpected websocket response "
+                             "%r dropped", data)
+                return
+            future = waiting.popleft()
+            if not waiting:
+                del self._pending[key]
+        future.set_result(response)
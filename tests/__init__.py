@@ -1 +1,20 @@
 from test_loxscontrol import TestLoxSControl
+from test_loxsession import TestLoxSession
+from test_loxwebsocket import TestLoxWebSocket
+from test_loxstate import TestLoxState
+from test_loxparser import TestLoxParser
+from test_loxmodel import TestLoxModel
+from test_loxmatch import TestLoxMatch
+from test_loxtypes import TestLoxTypes
+from test_loxrefresh import TestLoxRefresh
+from test_loxprewarm import TestLoxPrewarm
+from test_loxstats import TestLoxStats
+from test_loxgateway import TestLoxGateway
+from test_loxqueue import TestLoxQueue
+from test_loxsnapshot import TestLoxSnapshot
+from test_loxbreaker import TestLoxBreaker
+from test_loxdescribe import TestLoxDescribe
+from test_loxclient import TestLoxClient
+from test_loxasync import TestLoxAsync
+from test_loxtoken import TestLoxToken
+from test_loxcachedir import TestLoxCacheDir
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for a Loxone miniserver used by the tests."""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import struct
+import sys
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qsl
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qsl
+
+# Magic string of the websocket handshake
+WSGUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# Key of the token flow as sent by the miniserver, hex encoded
+TOKENKEY = binascii.hexlify(b"fakeminiserverkey").decode('ascii')
+# Salt of the password hash of the user, hex encoded
+TOKENSALT = binascii.hexlify(b"fakesalt").decode('ascii')
+# Validity of tokens is told in seconds since 2009-01-01 00:00:00 UTC
+EPOCH = 1230768000
+
+# Format of the state uuids
+STATE = "0c1198%02x-0001-0001-ffff403fb0c34b9e"
+
+# Structure definition served by default
+STRUCTURE = {
+    "lastModified": "2017-03-12 10:11:12",
+    "msInfo": {"languageCode": "ENG", "location": "Home",
+               "roomTitle": "Room"},
+    "rooms": {"0ceefd17": {"name": "Kitchen", "uuid": "0ceefd17"},
+              "0ceefd1d": {"name": "Living room", "uuid": "0ceefd1d"}},
+    "cats": {"0c10052e": {"name": "Light", "uuid": "0c10052e",
+                          "type": "lights"},
+             "0c10053e": {"name": "Shading", "uuid": "0c10053e",
+                          "type": "shading"}},
+    "controls": {
+        "0c119829": {"name": "Kitchen light", "type": "Switch",
+                     "uuidAction": "0c119829", "room": "0ceefd17",
+                     "cat": "0c10052e",
+                     "states": {"active": STATE % 0x30}},
+        "0c11982a": {"name": "Living room light", "type": "Switch",
+                     "uuidAction": "0c11982a", "room": "0ceefd1d",
+                     "cat": "0c10052e",
+                     "states": {"active": STATE % 0x31}},
+        "0c11982f": {"name": "Living room window", "type": "Jalousie",
+                     "uuidAction": "0c11982f", "room": "0ceefd1d",
+                     "cat": "0c10053e",
+                     "states": {"up": STATE % 0x32, "down": STATE % 0x33,
+                                "position": STATE % 0x34}},
+        "0c11982d": {"name": "Living room door", "type": "Jalousie",
+                     "uuidAction": "0c11982d", "room": "0ceefd1d",
+                     "cat": "0c10053e",
+                     "states": {"up": STATE % 0x35, "down": STATE % 0x36,
+                                "position": STATE % 0x37}},
+    }
+}
+
+
+def encode_value_events(states):
+    """
+    Return a binary value event table.
+
+    :param states: list of tuples (state uuid, value)
+    :return: bytes
+
+    """
+    data = b""
+    for uuid, value in states:
+        data1, data2, data3, data4 = uuid.split("-")
+        data += struct.pack("<IHH8sd", int(data1, 16), int(data2, 16),
+                            int(data3, 16), binascii.unhexlify(data4),
+                            value)
+    return data
+
+
+def encode_text_events(states):
+    """
+    Return a binary text event table.
+
+    :param states: list of tuples (state uuid, text)
+    :return: bytes
+
+    """
+    data = b""
+    for uuid, text in states:
+        data1, data2, data3, data4 = uuid.split("-")
+        text = text.encode('utf-8')
+        data += struct.pack("<IHH8s16sI", int(data1, 16), int(data2, 16),
+                            int(data3, 16), binascii.unhexlify(data4),
+                            b"\0" * 16, len(text))
+        data += text + b"\0" * (-len(text) % 4)
+    return data
+
+
+class FakeMiniserverHandler(BaseHTTPRequestHandler):
+
+    """Answer miniserver requests, keep connections alive."""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, with Nagle's algorithm
+    # the body waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        """Count each new connection."""
+        BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        """Be quiet."""
+        pass
+
+    def do_GET(self):
+        """Serve structure definition, version and io commands."""
+        server = self.server
+        if self.path == "/ws/rfc6455" and server.websocket and \
+                self.headers.get('Upgrade', '').lower() == "websocket":
+            self.handle_websocket()
+            return
+
+        # tokens are sent as query, requests are recorded without it
+        self.path, _, query = self.path.partition("?")
+        start = time.time()
+        try:
+            self.handle_request(dict(parse_qsl(query)))
+        finally:
+            with server.lock:
+                server.intervals.append((self.path, start, time.time()))
+
+    def handle_request(self, params):
+        """
+        Answer a request, with the query parameters params.
+
+        :param params: dict of the query parameters
+
+        """
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            failure = server.failures.pop(0) if server.failures else None
+        if server.latency:
+            time.sleep(server.latency)
+
+        if failure is not None:
+            self.send_json(failure, {"LL": {"control": self.path[1:],
+                                            "value": "",
+                                            "Code": str(failure)}})
+            return
+
+        if self.path.startswith("/jdev/sys/"):
+            self.handle_token()
+            return
+
+        expected = "Basic " + base64.b64encode(
+            ("%s:%s" % (server.user, server.password)).encode('utf-8')
+            ).decode('ascii')
+        if server.basic_auth and \
+                self.headers.get('Authorization') == expected:
+            server.authorizations.append("basic")
+        elif params.get("user") == server.user and \
+                server.is_token_valid(params.get("autht")):
+            server.authorizations.append("token")
+        else:
+            self.send_json(401, {"LL": {"control": self.path[1:],
+                                        "value": "",
+                                        "Code": "401"}})
+            return
+
+        if self.path == "/data/Loxapp3.json":
+            self.send_json(200, server.structure)
+        elif self.path == "/dev/sps/LoxAPPversion":
+            self.send_json(200, {"LL": {"control": "dev/sps/LoxAPPversion",
+                                        "value": server.version,
+                                        "Code": "200"}})
+        elif self.path.startswith("/dev/sps/io/") and \
+                "/" not in self.path[len("/dev/sps/io/"):]:
+            control = self.path[1:]
+            self.send_json(200, {"LL": {"control": control,
+                                        "value": server.read_control(
+                                            control.rsplit("/", 1)[-1]),
+                                        "Code": "200"}})
+        elif self.path.startswith("/dev/sps/io/"):
+            control = self.path[1:]
+            value = control.rsplit("/", 1)[-1]
+            server.released.wait(5)
+            with server.lock:
+                server.commands.append(control)
+                code = server.rejects.pop(0) if server.rejects else None
+            if code is not None:
+                self.send_json(200, {"LL": {"control": control,
+                                            "value": "",
+                                            "Code": str(code)}})
+                return
+            self.send_json(200, {"LL": {"control": control,
+                                        "value": value,
+                                        "Code": "200"}})
+            server.apply_command(control)
+        else:
+            self.send_json(404, {"LL": {"control": self.path[1:],
+                                        "value": "",
+                                        "Code": "404"}})
+
+    def handle_token(self):
+        """Answer the requests of the token flow, no authorization."""
+        server = self.server
+        control = self.path[1:]
+        args = control.split("/")[2:]
+        value = None
+        if args[0] == "getkey2" and len(args) == 2:
+            value = {"key": TOKENKEY, "salt": TOKENSALT,
+                     "hashAlg": server.hash_alg}
+        elif args[0] == "getkey" and len(args) == 1:
+            value = TOKENKEY
+        elif args[0] == "getjwt" and len(args) == 6 and \
+                args[1] == server.user_hash() and args[2] == server.user:
+            value = server.issue_token()
+        elif args[0] == "refreshjwt" and len(args) == 3 and \
+                args[2] == server.user:
+            value = server.refresh_token(args[1])
+        if value is None:
+            self.send_json(200, {"LL": {"control": control, "value": "",
+                                        "Code": "401"}})
+            return
+        self.send_json(200, {"LL": {"control": control, "value": value,
+                                    "Code": "200"}})
+
+    def handle_websocket(self):
+        """Answer commands sent over a websocket until it is closed."""
+        server = self.server
+        accept = base64.b64encode(hashlib.sha1(
+            (self.headers.get('Sec-WebSocket-Key') + WSGUID).encode('ascii')
+            ).digest()).decode('ascii')
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.send_header("Sec-WebSocket-Protocol", "remotecontrol")
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        self.ws_lock = threading.RLock()
+        self.statusupdates = False
+        with server.lock:
+            server.ws_connections += 1
+            server.ws_clients.append(self)
+
+        key = binascii.hexlify(b"fakeminiserverkey").decode('ascii')
+        credentials = ("%s:%s" % (server.user, server.password))
+        expected = hmac.new(b"fakeminiserverkey",
+                            credentials.encode('utf-8'),
+                            hashlib.sha1).hexdigest()
+        authenticated = False
+        try:
+            while True:
+                opcode, payload = self.ws_recv()
+                if opcode is None or opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    self.ws_send(0xA, payload)
+                    continue
+                if opcode != 0x1:
+                    continue
+
+                command = payload.decode('utf-8')
+                with server.lock:
+                    server.ws_commands.append(command)
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if command == "keepalive":
+                    self.ws_send(0x2, struct.pack("<BBBBI", 3, 6, 0, 0, 0))
+                elif command == "jdev/sys/getkey":
+                    self.ws_send_json(command, key, 200)
+                elif command.startswith("authenticate/"):
+                    authenticated = command.split("/", 1)[1] == expected
+                    self.ws_send_json(command, "",
+                                      200 if authenticated else 401)
+                elif not authenticated:
+                    self.ws_send_json(command, "", 401)
+                elif command == "jdev/sps/enablebinstatusupdate":
+                    self.ws_send_json(command, "1", 200)
+                    with server.lock:
+                        states = list(server.states.items())
+                        self.statusupdates = True
+                    self.ws_send_message(2, encode_value_events(states))
+                elif command.startswith("jdev/sps/io/"):
+                    control = command[1:]
+                    with server.lock:
+                        server.commands.append(control)
+                    self.ws_send_json(control, control.rsplit("/", 1)[-1],
+                                      200)
+                    server.apply_command(control)
+                else:
+                    self.ws_send_json(command, "", 404)
+        except (EnvironmentError, ValueError):
+            pass
+        finally:
+            with server.lock:
+                server.ws_clients.remove(self)
+
+    def ws_recv(self):
+        """
+        Read a websocket frame.
+
+        :return: tuple (opcode, payload), (None, None) if closed
+
+        """
+        head = self.rfile.read(2)
+        if len(head) < 2:
+            return None, None
+        first, second = bytearray(head)
+        length = second & 0x7f
+        if length == 126:
+            length = struct.unpack(">H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self.rfile.read(8))[0]
+        mask = bytearray(self.rfile.read(4)) if second & 0x80 else None
+        payload = bytearray(self.rfile.read(length))
+        if mask:
+            for i in range(len(payload)):
+                payload[i] ^= mask[i % 4]
+        return first & 0x0f, bytes(payload)
+
+    def ws_send(self, opcode, payload):
+        """Send a websocket frame."""
+        header = bytearray([0x80 | opcode])
+        if len(payload) < 126:
+            header.append(len(payload))
+        elif len(payload) < 65536:
+            header.append(126)
+            header.extend(struct.pack(">H", len(payload)))
+        else:
+            header.append(127)
+            header.extend(struct.pack(">Q", len(payload)))
+        with self.ws_lock:
+            self.wfile.write(bytes(header) + payload)
+            self.wfile.flush()
+
+    def ws_send_json(self, control, value, code):
+        """Send a text message announced by its binary header."""
+        body = json.dumps({"LL": {"control": control, "value": value,
+                                  "Code": str(code)}}).encode('utf-8')
+        self.ws_send_message(0, body)
+
+    def ws_send_message(self, msgtype, body):
+        """Send a message announced by its binary header."""
+        with self.ws_lock:
+            self.ws_send(0x2, struct.pack("<BBBBI", 3, msgtype, 0, 0,
+                                          len(body)))
+            self.ws_send(0x1 if msgtype == 0 else 0x2, body)
+
+    def ws_close(self):
+        """Close the websocket connection, ignore it if already closed."""
+        try:
+            self.ws_send(0x8, b"")
+        except (EnvironmentError, ValueError):
+            # the handler thread closed wfile after the peer left
+            pass
+
+    def send_json(self, code, content):
+        """Send content as JSON response."""
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeMiniserver(ThreadingMixIn, HTTPServer):
+
+    """
+    Threaded HTTP server faking a miniserver on a free local port.
+
+    Counts connections and records all requests and io commands.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, structure=None, version="2017-03-12 10:11:12",
+                 user="loxoneuser", password="loxonepassword", latency=0,
+                 websocket=True):
+        """
+        Start the server in a background thread.
+
+        :param structure: content of /data/Loxapp3.json
+        :param version: value of /dev/sps/LoxAPPversion
+        :param user: accepted miniserver user
+        :param password: accepted miniserver password
+        :param latency: delay of each response in seconds
+        :param websocket: serve the websocket interface
+
+        """
+        HTTPServer.__init__(self, ("127.0.0.1", 0), FakeMiniserverHandler)
+        self.structure = structure or STRUCTURE
+        self.version = version
+        self.user = user
+        self.password = password
+        self.latency = latency
+        self.websocket = websocket
+        self.ws_connections = 0
+        self.ws_clients = []
+        self.ws_commands = []
+        self.auto_states = True
+        self.states = {}
+        for control in self.structure["controls"].values():
+            for state in control.get("states", {}).values():
+                self.states[state] = 0.0
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.commands = []
+        self.failures = []
+        self.rejects = []
+        # token flow: basic auth can be turned off like on new firmware
+        self.basic_auth = True
+        self.hash_alg = "SHA256"
+        self.token_lifetime = 3600
+        self.tokens = {}
+        self.authorizations = []
+        # (path, start, end) of each http request answered
+        self.intervals = []
+        # commands wait while it is cleared, see hold_commands
+        self.released = threading.Event()
+        self.released.set()
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        args=(0.05,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def host(self):
+        """Return host:port to be used as lx_ip."""
+        return "%s:%d" % self.server_address
+
+    def max_in_flight(self, prefix="/"):
+        """
+        Return the max. number of requests answered at the same time.
+
+        :param prefix: only count requests with paths starting with it
+        :return: int
+
+        """
+        with self.lock:
+            events = []
+            for path, start, end in self.intervals:
+                if path.startswith(prefix):
+                    events.extend([(start, 1), (end, -1)])
+        # requests ending when another starts don't overlap
+        events.sort()
+        count = highest = 0
+        for _, change in events:
+            count += change
+            highest = max(highest, count)
+        return highest
+
+    def hold_commands(self):
+        """Let io commands wait until release_commands is called."""
+        self.released.clear()
+
+    def release_commands(self):
+        """Execute the io commands waiting and all later ones."""
+        self.released.set()
+
+    def fail_next(self, code, count=1):
+        """Answer the next count requests with the HTTP status code."""
+        with self.lock:
+            self.failures.extend([code] * count)
+
+    def reject_next(self, code, count=1):
+        """Refuse the next count commands with the code in the answer."""
+        with self.lock:
+            self.rejects.extend([code] * count)
+
+    def _hmac(self, message):
+        """Return the HMAC of a message with the key of the token flow."""
+        digest = hashlib.sha256 if self.hash_alg == "SHA256" else \
+            hashlib.sha1
+        return hmac.new(binascii.unhexlify(TOKENKEY),
+                        message.encode('utf-8'), digest).hexdigest()
+
+    def user_hash(self):
+        """Return the hash of user and password expected by getjwt."""
+        digest = hashlib.sha256 if self.hash_alg == "SHA256" else \
+            hashlib.sha1
+        pwhash = digest(("%s:%s" % (self.password, TOKENSALT)).encode(
+            'utf-8')).hexdigest().upper()
+        return self._hmac("%s:%s" % (self.user, pwhash))
+
+    def issue_token(self):
+        """Issue a token valid for token_lifetime seconds."""
+        with self.lock:
+            token = "token%d" % (len(self.tokens) + 1)
+            expires = int(time.time() + self.token_lifetime)
+            self.tokens[token] = expires
+        return {"token": token, "key": TOKENKEY,
+                "validUntil": expires - EPOCH, "tokenRights": 4,
+                "unsecurePass": False}
+
+    def refresh_token(self, tokenhash):
+        """Issue a new token for the valid token with the hash."""
+        with self.lock:
+            tokens = [token for token in self.tokens
+                      if self._hmac(token) == tokenhash]
+        if not tokens or not self.is_token_valid(tokens[0]):
+            return None
+        return self.issue_token()
+
+    def is_token_valid(self, token):
+        """Return True if a token was issued and is not expired."""
+        with self.lock:
+            return self.tokens.get(token, 0) > time.time()
+
+    def revoke_tokens(self):
+        """Revoke all tokens issued."""
+        with self.lock:
+            for token in self.tokens:
+                self.tokens[token] = 0
+
+    def set_state(self, uuid, value):
+        """Change a state and push it to all clients with status updates."""
+        with self.lock:
+            self.states[uuid] = value
+            clients = [c for c in self.ws_clients if c.statusupdates]
+        for client in clients:
+            try:
+                client.ws_send_message(2, encode_value_events(
+                    [(uuid, value)]))
+            except (EnvironmentError, ValueError):
+                pass
+
+    def read_control(self, uuid):
+        """Return the main state of a control as text, like a miniserver."""
+        for control in self.structure["controls"].values():
+            if control["uuidAction"] == uuid:
+                states = control.get("states", {})
+                state = states.get("active", states.get("position"))
+                with self.lock:
+                    return "%g" % self.states.get(state, 0.0)
+        return ""
+
+    def apply_command(self, command):
+        """Change the active state of a switch like a miniserver does."""
+        uuid, value = command.split("/")[-2:]
+        if not self.auto_states or value not in ("on", "off"):
+            return
+        for control in self.structure["controls"].values():
+            if control["uuidAction"] == uuid and \
+                    "active" in control.get("states", {}):
+                self.set_state(control["states"]["active"],
+                               1.0 if value == "on" else 0.0)
+
+    def handle_error(self, request, client_address):
+        """Ignore clients dropping their connection."""
+        if not isinstance(sys.exc_info()[1], (EnvironmentError, ValueError)):
+            HTTPServer.handle_error(self, request, client_address)
+
+    def close_websockets(self):
+        """Close all websocket connections."""
+        with self.lock:
+            clients = list(self.ws_clients)
+        for client in clients:
+            client.ws_close()
+
+    def stop(self):
+        """Stop the server."""
+        self.shutdown()
+        self.server_close()
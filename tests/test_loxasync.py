@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the asyncio API of the miniserver client."""
+import unittest
+
+import mock
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+import loxsession
+from loxclient import LoxClient
+from fakeminiserver import FakeMiniserver
+
+
+@unittest.skipIf(asyncio is None, "asyncio needs Python 3")
+class TestLoxAsync(unittest.TestCase):
+
+    """Unittest TestCase for AsyncLoxClient."""
+
+    def setUp(self):
+        """Start a fake miniserver and an event loop."""
+        from loxasync import AsyncLoxClient
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.client = AsyncLoxClient(lx_ip=self.server.host,
+                                     lx_user=self.server.user,
+                                     lx_password=self.server.password,
+                                     lx_cachedir="", lx_retries=0)
+
+    def tearDown(self):
+        """Stop the fake miniserver and the event loop."""
+        self.client.close()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_concurrent(self):
+        """Test operations of one event loop run at once."""
+        client = self.client
+        self.assertTrue(self.loop.run_until_complete(client.connect()))
+        lights = client.resolve(cattype="lights")
+        self.assertEqual(sorted(lights), ["0c119829", "0c11982a"])
+
+        self.server.latency = 0.2
+        results = self.loop.run_until_complete(asyncio.gather(
+            client.change_state(lights[0], "on"),
+            client.change_state(lights[1], "on"),
+            client.change_batch(client.resolve(cattype="shading"), "up"),
+            client.read_states(lights)))
+        # 4 commands and 2 reads
+        self.assertTrue(self.server.max_in_flight("/dev/sps/io/") >= 4)
+        self.assertEqual(results[:2], [True, True])
+        self.assertTrue(all(result['success'] for result in results[2]))
+        self.assertEqual(len(results[3]), 2)
+        self.assertEqual(sorted(self.server.commands),
+                         sorted(["dev/sps/io/0c119829/on",
+                                 "dev/sps/io/0c11982a/on",
+                                 "dev/sps/io/0c11982d/FullUp",
+                                 "dev/sps/io/0c11982f/FullUp"]))
+
+    def test_scene(self):
+        """Test scenes await their delays instead of blocking a thread."""
+        client = self.client
+        self.assertTrue(self.loop.run_until_complete(client.connect()))
+        steps = [{"control_name": "Kitchen light", "newstate": "on"},
+                 {"control_name": "Kitchen light", "newstate": "off",
+                  "delay": 0.1},
+                 {"control_name": "Garage", "newstate": "on"}]
+
+        async def scene():
+            # the event loop runs other calls during the delay
+            started = asyncio.Event()
+            released = asyncio.Event()
+            delays = []
+
+            async def sleep(delay):
+                delays.append(delay)
+                started.set()
+                await released.wait()
+
+            with mock.patch("loxasync.asyncio.sleep", sleep):
+                task = asyncio.ensure_future(client.change_scene(steps))
+                await started.wait()
+                states = await client.read_states(["0c119829"])
+                self.assertFalse(task.done())
+                released.set()
+                summary = await task
+            self.assertEqual(delays, [0.1])
+            return states, summary
+
+        states, summary = self.loop.run_until_complete(scene())
+        self.assertEqual(states[0]['value'], 1.0)
+        self.assertEqual(self.server.commands,
+                         ["dev/sps/io/0c119829/on",
+                          "dev/sps/io/0c119829/off"])
+        self.assertEqual([c['success'] for c in summary],
+                         [True, True, False])
+
+        with self.assertRaises(ValueError):
+            self.loop.run_until_complete(client.change_scene(
+                [{"control_name": "Kitchen light"}]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""TestCase for failing fast while a miniserver is unreachable."""
+import time
+import unittest
+
+import loxbreaker
+import loxsession
+import loxstats
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxBreaker(unittest.TestCase):
+
+    """Unittest TestCase for the circuit breaker."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        loxstats.STATS.clear()
+        self.server = FakeMiniserver()
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": "",
+            "lx_timeout": 0.2,
+            "lx_backoff": 0,
+            "lx_breakerfailures": 2,
+            "lx_breakercooldown": 0.3,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop the fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_breaker(self):
+        """Test the circuit opens, is probed and closes again."""
+        breaker = loxbreaker.CircuitBreaker("10.0.0.1", 2, 0.1)
+        self.assertFalse(breaker.acquire())
+        breaker.record_failure()
+        self.assertFalse(breaker.is_reachable())
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertRaises(loxbreaker.CircuitOpenError, breaker.acquire)
+
+        # one request probes after the cooldown, the others fail
+        time.sleep(0.1)
+        self.assertTrue(breaker.acquire())
+        self.assertEqual(breaker.state, breaker.HALF_OPEN)
+        self.assertRaises(loxbreaker.CircuitOpenError, breaker.acquire)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertRaises(loxbreaker.CircuitOpenError, breaker.acquire)
+        time.sleep(0.1)
+        self.assertTrue(breaker.acquire())
+        breaker.record_success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertTrue(breaker.is_reachable())
+        self.assertFalse(breaker.acquire())
+
+    def test_fast_fail(self):
+        """Test orders fail fast while the miniserver doesn't answer."""
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+
+        # requests time out, the structure can't be checked
+        LoxClient._structure_cache.clear()
+        self.server.latency = 0.5
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Unreachable")
+        self.assertFalse(loxbreaker.is_reachable(self.server.host))
+        del self.server.requests[:]
+
+        # nothing is sent, so nothing waits for the miniserver
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Unreachable")
+        self.assertEqual(loxone_test.summary, self.server.host)
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(loxstats.STATS.get_counter("circuit_rejected") > 0)
+
+    def test_probe(self):
+        """Test a command probes the miniserver after the cooldown."""
+        loxone_test = Loxscontrol(**self.parameters).client
+        self.server.latency = 0.5
+        self.assertFalse(loxone_test.change_state_byuuid("0c119829", "off"))
+        self.assertFalse(loxone_test.change_state_byuuid("0c119829", "off"))
+        del self.server.requests[:]
+        self.assertFalse(loxone_test.change_state_byuuid("0c119829", "off"))
+        self.assertEqual(self.server.requests, [])
+
+        # the failed probe opens the circuit again
+        time.sleep(0.3)
+        del self.server.requests[:]
+        self.assertFalse(loxone_test.change_state_byuuid("0c119829", "off"))
+        self.assertEqual(self.server.requests, ["/dev/sps/LoxAPPversion"])
+        self.assertFalse(loxone_test.change_state_byuuid("0c119829", "off"))
+
+        # the miniserver is back
+        time.sleep(0.3)
+        self.server.latency = 0
+        del self.server.requests[:]
+        self.assertTrue(loxone_test.change_state_byuuid("0c119829", "off"))
+        self.assertEqual(self.server.requests,
+                         ["/dev/sps/LoxAPPversion",
+                          "/dev/sps/io/0c119829/off"])
+        self.assertTrue(loxbreaker.is_reachable(self.server.host))
+
+        # failed commands of a reachable miniserver open no circuit
+        self.server.fail_next(500, 3)
+        for _ in range(3):
+            self.assertFalse(loxone_test.change_state_byuuid("0c119829",
+                                                             "on"))
+        self.assertTrue(loxbreaker.is_reachable(self.server.host))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the directory of the structure cache and the tokens."""
+import os
+import shutil
+import stat
+import tempfile
+import unittest
+
+import loxcachedir
+from loxclient import LoxClient
+
+
+class TestLoxCacheDir(unittest.TestCase):
+
+    """Unittest TestCase for the cache directory."""
+
+    def setUp(self):
+        """Create a temporary parent directory."""
+        self.parent = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.parent)
+
+    def test_secure(self):
+        """Test the directory is created for the owner only."""
+        path = os.path.join(self.parent, "cache")
+        self.assertEqual(loxcachedir.secure(path), path)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0)
+        # existing directories are used again
+        self.assertEqual(loxcachedir.secure(path), path)
+
+    def test_unsafe(self):
+        """Test directories others can write to are not used."""
+        path = os.path.join(self.parent, "cache")
+        os.mkdir(path)
+        os.chmod(path, 0o777)
+        with self.assertRaises(loxcachedir.UnsafeDirectoryError):
+            loxcachedir.secure(path)
+
+        # the structure cache is disabled
+        client = LoxClient(lx_ip="127.0.0.1", lx_user="loxoneuser",
+                           lx_password="loxonepassword", lx_cachedir=path)
+        self.assertTrue(client._get_cachefile() is None)
+        os.chmod(path, 0o700)
+        self.assertEqual(os.path.dirname(client._get_cachefile()), path)
+
+    def test_default(self):
+        """Test the default is not in the shared temp dir."""
+        self.assertEqual(LoxClient.CACHEDIR, loxcachedir.DEFAULT)
+        self.assertFalse(LoxClient.CACHEDIR.startswith(
+            tempfile.gettempdir()))
+
+
+if __name__ == '__main__':
+    unittest.main()
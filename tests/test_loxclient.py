@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the miniserver client used without Kalliope."""
+import unittest
+
+import loxsession
+from loxclient import LoxClient
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxClient(unittest.TestCase):
+
+    """Unittest TestCase for the miniserver client."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.parameters = {"lx_ip": self.server.host,
+                           "lx_user": self.server.user,
+                           "lx_password": self.server.password,
+                           "lx_cachedir": ""}
+
+    def tearDown(self):
+        """Stop the fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_client(self):
+        """Test resolving, changing and reading states."""
+        client = LoxClient(**self.parameters)
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(client.connect())
+        self.assertTrue(client.connect())
+        self.assertEqual(self.server.requests, ["/dev/sps/LoxAPPversion",
+                                                "/data/Loxapp3.json"])
+
+        self.assertEqual(client.resolve("kitchen light"), ["0c119829"])
+        self.assertEqual(sorted(client.resolve(room="living room",
+                                               cattype="shading")),
+                         ["0c11982d", "0c11982f"])
+        self.assertEqual(len(client.resolve(room="living room")), 3)
+
+        self.assertTrue(client.change_state_byuuid("0c119829", "on"))
+        self.assertFalse(client.change_state_byuuid("0c119829", "up"))
+        summary = client.change_state_batch(
+            client.resolve(room="living room", cattype="shading"), "down")
+        self.assertTrue(all(result['success'] for result in summary))
+        self.assertEqual(client.read_states(["0c119829"])[0]['value'], 1.0)
+
+    def test_invalid(self):
+        """Test missing or invalid parameters."""
+        self.assertRaises(ValueError, LoxClient(lx_ip="10.0.0.1").connect)
+        self.parameters['lx_servers'] = "10.0.0.2"
+        self.assertRaises(ValueError, LoxClient(**self.parameters).connect)
+
+        # the structure definition can't be loaded
+        self.parameters.update({"lx_password": "wrong", "lx_servers": None})
+        self.assertFalse(LoxClient(**self.parameters).connect())
+
+
+if __name__ == '__main__':
+    unittest.main()
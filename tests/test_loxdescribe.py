@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the description of the structure definition."""
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+import loxdescribe
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STRUCTURE, STATE
+
+
+class TestLoxDescribe(unittest.TestCase):
+
+    """Unittest TestCase for describing a structure."""
+
+    def setUp(self):
+        """Write a structure with an unsupported control and dup names."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.structure = dict(STRUCTURE)
+        self.structure['rooms'] = dict(STRUCTURE['rooms'], **{
+            "0ceefd20": {"name": "Garage", "uuid": "0ceefd20"}})
+        self.structure['controls'] = dict(STRUCTURE['controls'], **{
+            "0c119840": {"name": "Kitchen-Light", "type": "Switch",
+                         "uuidAction": "0c119840", "room": "0ceefd17",
+                         "cat": "0c10052e",
+                         "states": {"active": STATE % 0x40}},
+            "0c119841": {"name": "Door bell", "type": "Intercom",
+                         "uuidAction": "0c119841", "room": "0ceefd20",
+                         "cat": "0c10052e"}})
+        self.path = os.path.join(self.tmpdir, "Loxapp3.json")
+        with open(self.path, 'w') as f:
+            json.dump(self.structure, f)
+
+    def tearDown(self):
+        """Remove the structure."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_main(self):
+        """Test the description of a saved structure definition."""
+        with mock.patch("loxdescribe.print", create=True) as printed:
+            self.assertEqual(loxdescribe.main(
+                ["--structure", self.path, "--json"]), 0)
+        description = json.loads(printed.call_args[0][0])
+        self.assertEqual(description['rooms'], 3)
+        self.assertEqual(description['controls'], 5)
+        self.assertEqual(description['types'],
+                         {"Switch": 3, "Jalousie": 2})
+        self.assertEqual(description['unsupported'], {"Intercom": 1})
+        self.assertEqual(description['orphaned_rooms'], ["Garage"])
+        self.assertEqual(description['duplicates'],
+                         ["Kitchen light", "Kitchen-Light"])
+
+        with mock.patch("loxdescribe.print", create=True) as printed:
+            self.assertEqual(loxdescribe.main(["--structure", self.path]),
+                             0)
+        lines = printed.call_args[0][0].split("\n")
+        self.assertTrue("Unsupported controls: 1" in lines)
+        self.assertTrue("      Intercom: 1" in lines)
+        self.assertEqual(loxdescribe.main(
+            ["--structure", os.path.join(self.tmpdir, "missing.json")]), 1)
+
+    def test_neuron(self):
+        """Test only the action describe walks the structure."""
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        server.structure = self.structure
+        parameters = {"lx_ip": server.host, "lx_user": server.user,
+                      "lx_password": server.password, "lx_cachedir": "",
+                      "action": "change", "control_name": "Living room light",
+                      "newstate": "on"}
+        logger = logging.getLogger("kalliope")
+        level = logger.level
+        self.addCleanup(logger.setLevel, level)
+        logger.setLevel(logging.DEBUG)
+        with mock.patch("loxmodel.LoxModel.describe") as describe:
+            loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertFalse(describe.called)
+
+        parameters.update({"action": "describe", "control_name": None,
+                           "newstate": None})
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Describe")
+        self.assertEqual(loxone_test.summary['unsupported'],
+                         {"Intercom": 1})
+        self.assertEqual(loxone_test.summary['orphaned_rooms'], ["Garage"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""TestCase for several miniservers of a client-gateway setup."""
+import copy
+import unittest
+
+from kalliope.core.NeuronModule import InvalidParameterException
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STRUCTURE, STATE
+
+
+class TestLoxGateway(unittest.TestCase):
+
+    """Unittest TestCase for several miniservers."""
+
+    def setUp(self):
+        """Start two fake miniservers sharing rooms and categories."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver(copy.deepcopy(STRUCTURE), latency=0.2)
+        structure = copy.deepcopy(STRUCTURE)
+        structure["rooms"]["0ceefd20"] = {"name": "Garage",
+                                          "uuid": "0ceefd20"}
+        structure["controls"] = {
+            "0c119840": {"name": "Garage light", "type": "Switch",
+                         "uuidAction": "0c119840", "room": "0ceefd20",
+                         "cat": "0c10052e",
+                         "states": {"active": STATE % 0x40}},
+            "0c119841": {"name": "Living room lamp", "type": "Switch",
+                         "uuidAction": "0c119841", "room": "0ceefd1d",
+                         "cat": "0c10052e",
+                         "states": {"active": STATE % 0x41}}}
+        self.client = FakeMiniserver(structure, latency=0.2,
+                                     user="clientuser")
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_servers": [{"lx_ip": self.client.host,
+                            "lx_user": self.client.user}],
+            "lx_cachedir": "",
+            "action": "change",
+            "control_name": "Garage light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop the fake miniservers."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+        self.client.stop()
+
+    def overlap(self, path):
+        """Return True if both miniservers answered path at one time."""
+        for _, start, end in [i for i in self.server.intervals
+                              if i[0].startswith(path)]:
+            for _, other_start, other_end in [
+                    i for i in self.client.intervals
+                    if i[0].startswith(path)]:
+                if start < other_end and other_start < end:
+                    return True
+        return False
+
+    def test_route(self):
+        """Test commands are sent to the miniserver owning the control."""
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.commands, [])
+        self.assertEqual(self.client.commands, ["dev/sps/io/0c119840/on"])
+        # both structure definitions are loaded in parallel
+        self.assertEqual(self.client.requests[:2],
+                         ["/dev/sps/LoxAPPversion", "/data/Loxapp3.json"])
+        self.assertTrue(self.overlap("/dev/sps/LoxAPPversion"))
+        self.assertTrue(self.overlap("/data/Loxapp3.json"))
+        client = loxone_test.client
+        self.assertEqual(len(client._records), 6)
+        self.assertEqual(client._get_host("0c119829"), self.server.host)
+
+        # the merged model is cached
+        del self.client.commands[:]
+        self.parameters["control_name"] = "Kitchen light"
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.commands, ["dev/sps/io/0c119829/on"])
+        self.assertEqual(self.client.commands, [])
+
+    def test_room(self):
+        """Test rooms spanning miniservers are changed at the same time."""
+        Loxscontrol(**self.parameters)
+        del self.client.commands[:]
+        self.parameters["control_name"] = None
+        self.parameters["control_room"] = "Living room"
+        self.parameters["control_type"] = LoxClient.CAT_LIGTH
+        self.parameters["newstate"] = "off"
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.commands, ["dev/sps/io/0c11982a/off"])
+        self.assertEqual(self.client.commands, ["dev/sps/io/0c119841/off"])
+        self.assertTrue(self.overlap("/dev/sps/io/"))
+
+    def test_unreachable(self):
+        """Test the controls of the other miniservers are used."""
+        self.client.stop()
+        self.parameters["control_name"] = "Kitchen light"
+        self.parameters["lx_backoff"] = 0
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(len(loxone_test.client._records), 4)
+
+        self.parameters["lx_servers"] = "10.0.0.2"
+        with self.assertRaises(InvalidParameterException):
+            Loxscontrol(**self.parameters)
+
+
+if __name__ == '__main__':
+    unittest.main()
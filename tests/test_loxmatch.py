@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the matching of spoken names."""
+import unittest
+
+import loxmatch
+
+
+class TestLoxMatch(unittest.TestCase):
+
+    """Unittest TestCase for the matching of spoken names."""
+
+    def setUp(self):
+        """Index some names."""
+        self.matcher = loxmatch.NameMatcher([
+            (0, u'K\xfcche Arbeitsfl\xe4che'),
+            (1, u'Living room'),
+            (2, u'Living room 2'),
+            (3, u'Licht Wohnzimmer'),
+            (4, u'Deckenlicht Wohnzimmer'),
+            (5, u'Licht Wohnzimmer')])
+
+    def test_tokenize(self):
+        """Test normalization of names."""
+        self.assertEqual(loxmatch.tokenize(u'K\xfcche-Arbeitsfl\xe4che'),
+                         [u'kueche', u'arbeitsflaeche'])
+        self.assertEqual(loxmatch.tokenize(u'Stra\xdfe, Caf\xe9!'),
+                         [u'strasse', u'cafe'])
+        self.assertEqual(loxmatch.tokenize(u'Zimmer zwei, room Two, 3'),
+                         [u'zimmer', u'2', u'room', u'2', u'3'])
+        # articles are no numbers
+        self.assertEqual(loxmatch.tokenize(u'ein Licht'),
+                         [u'ein', u'licht'])
+        self.assertEqual(loxmatch.normalize_name(b'K\xc3\xbcche  Spot'),
+                         u'kueche spot')
+
+    def test_cologne_phonetic(self):
+        """Test the Koelner Phonetik."""
+        self.assertEqual(
+            loxmatch.cologne_phonetic(u'muellerluedenscheidt'), u'65752682')
+        self.assertEqual(loxmatch.cologne_phonetic(u'breschnew'), u'17863')
+        self.assertEqual(loxmatch.cologne_phonetic(u'meier'),
+                         loxmatch.cologne_phonetic(u'mayr'))
+        self.assertEqual(loxmatch.cologne_phonetic(u'12'), u'')
+
+    def test_match(self):
+        """Test matching and ranking."""
+        match = self.matcher.match
+        # umlauts spelled out, other word order, extra words
+        self.assertEqual(match(u'Kueche Arbeitsflaeche'), [0])
+        self.assertEqual(match(u'die Arbeitsfl\xe4che der K\xfcche'), [0])
+        # the name with most words found wins
+        self.assertEqual(match(u'living room'), [1])
+        self.assertEqual(match(u'living room two'), [2])
+        # sounding alike
+        self.assertEqual(match(u'Licht Wonzimmer'), [3, 5])
+        self.assertEqual(self.matcher.rank(u'Licht Wonzimmer')[0],
+                         (0.875, 2, 3))
+        # not enough words found
+        self.assertEqual(match(u'K\xfcche'), [])
+        self.assertEqual(match(u'Light'), [])
+        self.assertEqual(match(u''), [])
+        self.assertEqual(len(self.matcher), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the compact structure model."""
+import json
+import unittest
+
+import loxmodel
+
+
+class TestLoxModel(unittest.TestCase):
+
+    """Unittest TestCase for the compact structure model."""
+
+    def setUp(self):
+        """Build a small model."""
+        self.model = loxmodel.LoxModel(u'DEU', u'Home', u'Raum')
+        self.model.add_room(u'0ceefd17', u'K\xfcche')
+        self.model.add_room(u'0ceefd1d', u'Living room')
+        self.model.add_cat(u'0c10052e', u'Light', u'lights')
+        self.model.add_cat(u'0c10053e', u'Shading', u'shading')
+        self.model.add_control(u'0c119829', u'0c119829',
+                               u'K\xfcche Arbeitsfl\xe4che',
+                               u'0ceefd17', u'Switch', u'0c10052e',
+                               {u'active': u'0c119830'})
+        # room and type strings are given as new objects every time
+        for uuid in (u'0c11982d', u'0c11982f'):
+            self.model.add_control(uuid, uuid, u'Living room ' + uuid,
+                                   u''.join([u'0ceefd', u'1d']),
+                                   u''.join([u'Jal', u'ousie']),
+                                   u'0c10053e')
+        self.model.build_indexes()
+
+    def test_records(self):
+        """Test records and shared strings."""
+        records = self.model.records
+        self.assertEqual(len(records), 3)
+        self.assertFalse(hasattr(records[0], '__dict__'))
+        self.assertEqual(records[0].states, {u'active': u'0c119830'})
+        self.assertEqual(records[1].states, {})
+        self.assertTrue(records[1].room is records[2].room)
+        self.assertTrue(records[1].type is records[2].type)
+        self.assertTrue(records[1].room is
+                        self.model.rooms[u'0ceefd1d']['uid'])
+
+        # categories refer to their controls by index
+        self.assertEqual(self.model.cats[u'0c10053e']['controls'], [1, 2])
+        self.assertEqual(self.model.get_record(u'0c11982f').name,
+                         u'Living room 0c11982f')
+        self.assertTrue(self.model.get_record(u'not a uuid') is None)
+
+        # unknown category
+        self.assertRaises(KeyError, self.model.add_control, u'0c119840',
+                          u'0c119840', u'Name', u'0ceefd17', u'Switch',
+                          u'0c100000')
+
+    def test_indexes(self):
+        """Test the lookup indexes."""
+        indexes = self.model.indexes
+        self.assertEqual(indexes['uuid'][u'0c11982d'], 1)
+        self.assertEqual(indexes['name'].match(u'Kueche Arbeitsflaeche'), [0])
+        self.assertEqual(indexes['room'][u'0ceefd1d'], [1, 2])
+        self.assertEqual(indexes['cattype'][u'shading'], [1, 2])
+        self.assertEqual(indexes['type'][u'Switch'], [0])
+        self.assertEqual(indexes['roomname'].match(u'living room'),
+                         [u'0ceefd1d'])
+
+    def test_dict(self):
+        """Test conversion to plain types and back."""
+        data = json.loads(json.dumps(self.model.to_dict()))
+        model = loxmodel.LoxModel.from_dict(data)
+        self.assertEqual(model.to_dict(), self.model.to_dict())
+        self.assertEqual(model.indexes['uuid'], self.model.indexes['uuid'])
+        self.assertEqual(model.indexes['room'], self.model.indexes['room'])
+        self.assertEqual(model.language, u'DEU')
+
+        del data['cats']
+        self.assertRaises(KeyError, loxmodel.LoxModel.from_dict, data)
+
+    def test_from_controls(self):
+        """Test the format of the lx_structuredef parameter."""
+        controls = {u'0c10052e': {'controls': {u'0c119829':
+                                               {'name': u'Light',
+                                                'room': u'0ceefd17',
+                                                'type': u'Switch',
+                                                'uidAction': u'0c11982a'}},
+                                  'name': u'Light',
+                                  'type': u'lights',
+                                  'uid': u'0c10052e'}}
+        model = loxmodel.LoxModel.from_controls(
+            controls, {u'0ceefd17': {'name': u'K\xfcche'}})
+        self.assertEqual(model.get_record(u'0c119829').uidaction,
+                         u'0c11982a')
+        self.assertEqual(model.cats[u'0c10052e']['controls'], [0])
+        self.assertEqual(model.rooms[u'0ceefd17']['name'], u'K\xfcche')
+        self.assertTrue(u'0c119829' in controls[u'0c10052e']['controls'])
+        self.assertRaises(KeyError, loxmodel.LoxModel.from_controls,
+                          {u'0c10052e': {'name': u'Light'}})
+
+    def test_merge(self):
+        """Test merging the models of several miniservers."""
+        other = loxmodel.LoxModel(u'DEU', u'Garage', u'Raum')
+        other.add_room(u'0ceefd1d', u'Living room')
+        other.add_room(u'0ceefd20', u'Garage')
+        other.add_cat(u'0c10052e', u'Light', u'lights')
+        other.add_control(u'0c119840', u'0c119841', u'Garage light',
+                          u'0ceefd20', u'Switch', u'0c10052e')
+        other.add_control(u'0c119842', u'0c119842', u'Living room lamp',
+                          u'0ceefd1d', u'Switch', u'0c10052e')
+        other.build_indexes()
+
+        model = loxmodel.LoxModel.merge([(u'10.0.0.1', self.model),
+                                         (u'10.0.0.2', other)])
+        self.assertEqual(model.location, u'Home')
+        self.assertEqual(len(model.records), 5)
+        self.assertEqual(sorted(model.rooms),
+                         [u'0ceefd17', u'0ceefd1d', u'0ceefd20'])
+        self.assertEqual(model.get_record(u'0c119829').host, u'10.0.0.1')
+        self.assertEqual(model.get_record(u'0c119841').host, u'10.0.0.2')
+        self.assertEqual(model.cats[u'0c10052e']['controls'], [0, 3, 4])
+        # rooms span the miniservers
+        self.assertEqual(model.indexes['room'][u'0ceefd1d'], [1, 2, 4])
+        # the models merged are not changed
+        self.assertTrue(self.model.records[0].host is None)
+        self.assertEqual(len(self.model.cats[u'0c10052e']['controls']), 1)
+
+    def test_merge_overlapping(self):
+        """Test controls reported by several miniservers are merged once."""
+        other = loxmodel.LoxModel(u'DEU', u'Home', u'Raum')
+        other.add_room(u'0ceefd17', u'K\xfcche')
+        other.add_cat(u'0c10052e', u'Light', u'lights')
+        other.add_control(u'0c119829', u'0c119829',
+                          u'K\xfcche Arbeitsfl\xe4che',
+                          u'0ceefd17', u'Switch', u'0c10052e')
+        other.add_control(u'0c119840', u'0c119841', u'Garage light',
+                          u'0ceefd17', u'Switch', u'0c10052e')
+        other.build_indexes()
+
+        model = loxmodel.LoxModel.merge([(u'10.0.0.1', self.model),
+                                         (u'10.0.0.2', other)])
+        self.assertEqual(len(model.records), 4)
+        # the first miniserver owns the control
+        self.assertEqual(model.get_record(u'0c119829').host, u'10.0.0.1')
+        self.assertEqual(model.get_record(u'0c119841').host, u'10.0.0.2')
+        self.assertEqual(
+            len(model.indexes['name'].match(u'K\xfcche Arbeitsfl\xe4che')),
+            1)
+        self.assertEqual(model.describe()['duplicates'], [])
+
+        # the same miniserver given twice
+        model = loxmodel.LoxModel.merge([(u'10.0.0.1', self.model),
+                                         (u'10.0.0.1', self.model)])
+        self.assertEqual(len(model.records), len(self.model.records))
+        self.assertEqual(model.cats[u'0c10052e']['controls'], [0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the structure definition parser."""
+import io
+import json
+import unittest
+
+import mock
+
+import loxparser
+from fakeminiserver import STRUCTURE
+
+
+class TestLoxParser(unittest.TestCase):
+
+    """Unittest TestCase for the structure definition parser."""
+
+    def setUp(self):
+        """Build a structure with unsupported controls."""
+        self.types = ["Switch", "Jalousie", "LightController"]
+        self.structure = json.loads(json.dumps(STRUCTURE))
+        self.structure["controls"]["0c200000"] = {
+            "name": "Clock", "type": "InfoOnlyAnalog",
+            "uuidAction": "0c200000", "room": "0ceefd17",
+            "cat": "0c10052e", "details": {"format": "%.1f"},
+            "states": {"value": "0c200001"}}
+        self.structure["controls"]["0c300000"] = {
+            "name": "Lights", "type": "LightController",
+            "uuidAction": "0c300000", "room": "0ceefd17",
+            "cat": "0c10052e", "details": {"movementScene": 9},
+            "subControls": {
+                "0c300001": {"name": "Spot", "type": "Switch",
+                             "uuidAction": "0c300001",
+                             "states": {"active": "0c300002"}},
+                "0c300003": {"name": "Dimmer", "type": "Dimmer",
+                             "uuidAction": "0c300003"}}}
+        self.structure["weatherServer"] = {"location": "big"}
+
+    def parse(self, structure):
+        """Parse the structure as it was received."""
+        return loxparser.parse(
+            io.BytesIO(json.dumps(structure).encode('utf-8')), self.types)
+
+    def test_parse(self):
+        """Test only used fields of supported controls are kept."""
+        parsed = self.parse(self.structure)
+
+        self.assertEqual(parsed["lastModified"], "2017-03-12 10:11:12")
+        self.assertEqual(parsed["msInfo"], STRUCTURE["msInfo"])
+        self.assertEqual(parsed["rooms"], STRUCTURE["rooms"])
+        self.assertEqual(parsed["cats"], STRUCTURE["cats"])
+        self.assertEqual(sorted(parsed["controls"]),
+                         ["0c119829", "0c11982a", "0c11982d", "0c11982f",
+                          "0c300000"])
+        self.assertEqual(parsed["controls"]["0c119829"],
+                         STRUCTURE["controls"]["0c119829"])
+        self.assertEqual(parsed["controls"]["0c300000"],
+                         {"name": "Lights", "type": "LightController",
+                          "uuidAction": "0c300000", "room": "0ceefd17",
+                          "cat": "0c10052e",
+                          "subControls": {
+                              "0c300001": {"name": "Spot", "type": "Switch",
+                                           "uuidAction": "0c300001",
+                                           "states": {"active":
+                                                      "0c300002"}}}})
+        # subcontrols of supported controls are not counted
+        self.assertEqual(parsed["unsupported"], {"InfoOnlyAnalog": 1})
+
+    @unittest.skipUnless(loxparser.is_streaming(), "needs ijson")
+    def test_parse_without_ijson(self):
+        """Test the fallback parser gives the same result."""
+        streamed = self.parse(self.structure)
+        with mock.patch("loxparser.ijson", None):
+            self.assertFalse(loxparser.is_streaming())
+            self.assertEqual(self.parse(self.structure), streamed)
+
+    def check_invalid(self):
+        """Check invalid structures are refused."""
+        with self.assertRaises(ValueError):
+            loxparser.parse(io.BytesIO(b'{"msInfo": {'), self.types)
+        with self.assertRaises(ValueError):
+            loxparser.parse(io.BytesIO(b''), self.types)
+        del self.structure["cats"]
+        with self.assertRaises(ValueError):
+            self.parse(self.structure)
+
+    @unittest.skipUnless(loxparser.is_streaming(), "needs ijson")
+    def test_invalid(self):
+        """Test invalid structures are refused while streaming."""
+        self.check_invalid()
+
+    def test_invalid_without_ijson(self):
+        """Test invalid structures are refused by the fallback parser."""
+        with mock.patch("loxparser.ijson", None):
+            self.check_invalid()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""TestCase for prewarming the neuron."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+from kalliope.core.NeuronModule import NeuronModule
+
+import loxprewarm
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxPrewarm(unittest.TestCase):
+
+    """Unittest TestCase for prewarming."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.cachedir = tempfile.mkdtemp()
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": self.cachedir
+        }
+
+    def tearDown(self):
+        """Stop the fake miniserver, remove the cache."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+        shutil.rmtree(self.cachedir)
+
+    def test_prewarm(self):
+        """Test the first order doesn't load the structure definition."""
+        # Kalliope isn't needed to prewarm
+        with mock.patch.object(NeuronModule, "__init__",
+                               side_effect=AssertionError):
+            self.assertEqual(loxprewarm.prewarm(**self.parameters), 4)
+        self.assertEqual(self.server.requests,
+                         ["/dev/sps/LoxAPPversion", "/data/Loxapp3.json"])
+        connections = self.server.connections
+
+        del self.server.requests[:]
+        self.parameters.update({"action": "change",
+                                "control_name": "Kitchen light",
+                                "newstate": "on"})
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.requests,
+                         ["/dev/sps/LoxAPPversion",
+                          "/dev/sps/io/0c119829/on"])
+        # the connection opened while prewarming is used
+        self.assertEqual(self.server.connections, connections)
+
+    def test_main(self):
+        """Test prewarming with a variables file, offline afterwards."""
+        variables = os.path.join(self.cachedir, "variables.yml")
+        with open(variables, 'w') as f:
+            f.write("---\nlx_ip: \"%s\"\nlx_user: \"%s\"\n"
+                    "lx_password: \"wrong\"\nother: 1\n" %
+                    (self.server.host, self.server.user))
+        self.assertEqual(loxprewarm.load_variables(variables), {
+            "lx_ip": self.server.host, "lx_user": self.server.user,
+            "lx_password": "wrong"})
+
+        # the password of the command line wins
+        self.assertEqual(loxprewarm.main(
+            [variables, "--cachedir", self.cachedir]), 1)
+        self.assertEqual(loxprewarm.main(
+            [variables, "--cachedir", self.cachedir,
+             "--password", self.server.password]), 0)
+        # the structure cache on disk is used by the next process
+        LoxClient._structure_cache.clear()
+        del self.server.requests[:]
+        self.assertEqual(loxprewarm.prewarm(**self.parameters), 4)
+        self.assertEqual(self.server.requests, ["/dev/sps/LoxAPPversion"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""TestCase for coalescing and rate limiting of commands."""
+import threading
+import time
+import unittest
+
+import mock
+
+import loxqueue
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class FakeClock(object):
+
+    """Clock of the time module passing only when slept."""
+
+    def __init__(self):
+        """Start at 0, nothing slept."""
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        """Return the current time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Pass the time at once."""
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestLoxQueue(unittest.TestCase):
+
+    """Unittest TestCase for the command queue."""
+
+    def setUp(self):
+        """Record the commands sent."""
+        loxqueue.clear_queues()
+        self.sent = []
+        self.release = threading.Event()
+        self.release.set()
+        self.success = True
+
+    def tearDown(self):
+        """Forget the queues."""
+        loxqueue.clear_queues()
+
+    def send(self, command):
+        """Send a command once released."""
+        self.sent.append(command)
+        self.release.wait(2)
+        return self.success
+
+    def wait_until(self, condition):
+        """Wait until condition() is true, fail after 2 seconds."""
+        for _ in range(200):
+            if condition():
+                return
+            time.sleep(0.01)
+        self.fail("condition not reached")
+
+    def submit_later(self, queue, command, results):
+        """Submit in a thread, the result is appended to results."""
+        thread = threading.Thread(target=lambda: results.append(
+            queue.submit("0c119829", command, self.send)))
+        thread.start()
+        return thread
+
+    def test_repeated(self):
+        """Test a command repeated within the window is not sent again."""
+        queue = loxqueue.CommandQueue(window=0.2)
+        self.assertTrue(queue.submit("0c119829", "on", self.send))
+        self.assertTrue(queue.submit("0c119829", "on", self.send))
+        self.assertTrue(queue.submit("0c11982a", "on", self.send))
+        self.assertEqual(self.sent, ["on", "on"])
+
+        # failed commands and commands after the window are sent
+        time.sleep(0.25)
+        self.success = False
+        self.assertFalse(queue.submit("0c119829", "on", self.send))
+        self.assertFalse(queue.submit("0c119829", "on", self.send))
+        self.assertEqual(self.sent, ["on"] * 4)
+
+    def test_replaced(self):
+        """Test only the latest of the commands waiting is sent."""
+        queue = loxqueue.CommandQueue(window=1)
+        results = []
+        self.release.clear()
+        threads = [self.submit_later(queue, "on", results)]
+        self.wait_until(lambda: self.sent == ["on"])
+        # waiting while on is on its way, pulse replaces off
+        threads.append(self.submit_later(queue, "off", results))
+        self.wait_until(lambda: "0c119829" in queue._waiting)
+        threads.append(self.submit_later(queue, "pulse", results))
+        self.wait_until(
+            lambda: queue._waiting["0c119829"].command == "pulse")
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.sent, ["on", "pulse"])
+        self.assertEqual(results, [True, True, True])
+
+        # the same as the command on its way is not sent again
+        self.release.clear()
+        threads = [self.submit_later(queue, "off", results)]
+        self.wait_until(lambda: self.sent[-1:] == ["off"])
+        threads.append(self.submit_later(queue, "off", results))
+        self.wait_until(lambda: "0c119829" in queue._waiting)
+        self.release.set()
+        for thread in threads:
+            thread.join(2)
+        self.assertEqual(self.sent, ["on", "pulse", "off"])
+
+    def test_rate(self):
+        """Test the rate of commands is limited after a burst."""
+        clock = FakeClock()
+        with mock.patch("loxqueue.time", clock):
+            queue = loxqueue.CommandQueue(rate=10)
+            for index in range(15):
+                queue.submit("0c1198%02x" % index, "on", self.send)
+        self.assertEqual(len(self.sent), 15)
+        # a burst of 10, then one command per 0.1 seconds
+        self.assertEqual(len(clock.sleeps), 5)
+        self.assertAlmostEqual(sum(clock.sleeps), 0.5)
+
+    def test_neuron(self):
+        """Test repeated orders send one command."""
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        self.addCleanup(loxsession.close_sessions)
+        self.addCleanup(LoxClient._structure_cache.clear)
+        parameters = {"lx_ip": server.host, "lx_user": server.user,
+                      "lx_password": server.password, "lx_cachedir": "",
+                      "lx_coalesce": 2, "action": "change",
+                      "control_name": "Kitchen light", "newstate": "on"}
+        for _ in range(2):
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(loxone_test.status_code, "Complete")
+        parameters["newstate"] = "off"
+        Loxscontrol(**parameters)
+        self.assertEqual(server.commands, ["dev/sps/io/0c119829/on",
+                                           "dev/sps/io/0c119829/off"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the background refresh of the structure definition."""
+import copy
+import gc
+import unittest
+import weakref
+
+import loxrefresh
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STRUCTURE
+
+
+class TestLoxRefresh(unittest.TestCase):
+
+    """Unittest TestCase for the background refresh."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver(copy.deepcopy(STRUCTURE))
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": "",
+            "lx_refresh": 60,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop refreshers and the fake miniserver."""
+        loxrefresh.stop_refreshers()
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_refresh(self):
+        """Test new structure versions are swapped in off the request."""
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        refresher = loxrefresh.get_refresher(
+            self.server.host, self.server.user, self.server.password, None,
+            60)
+        # the cold start waited for the first check of the thread, the
+        # structure was loaded once
+        self.assertTrue(refresher.warm)
+        self.assertEqual(self.server.requests.count(
+            "/dev/sps/LoxAPPversion"), 1)
+        self.assertEqual(self.server.requests.count("/data/Loxapp3.json"), 1)
+        # the refresher doesn't keep the first instance
+        first = weakref.ref(loxone_test)
+        del loxone_test
+        gc.collect()
+        self.assertTrue(first() is None)
+
+        # warm: no structure requests on the request path
+        del self.server.requests[:]
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.requests,
+                         ["/dev/sps/io/0c119829/on"])
+        old = loxone_test
+
+        # a new version is loaded by the next check
+        self.server.structure["controls"]["0c119829"]["name"] = "Stove"
+        self.server.version = "2017-04-01 08:00:00"
+        self.assertTrue(refresher.refresh())
+        self.assertEqual(refresher.version, self.server.version)
+        self.parameters["control_name"] = "Stove"
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+
+        # instances keep the model they started with
+        self.assertEqual(old.client.get_name_by_uuid("0c119829"),
+                         "Kitchen light")
+        self.assertEqual(loxone_test.client.get_name_by_uuid("0c119829"),
+                         "Stove")
+
+    def test_unreachable(self):
+        """Test the current model is kept if the miniserver is down."""
+        self.parameters["lx_refresh"] = None
+        self.parameters["lx_backoff"] = 0
+        refresher = loxrefresh.StructureRefresher(
+            self.server.host, self.server.user, self.server.password,
+            Loxscontrol(**self.parameters).client, 60)
+        self.assertTrue(refresher.refresh())
+        model = refresher.model
+        self.assertFalse(refresher.refresh())
+
+        self.server.version = "2017-04-01 08:00:00"
+        self.server.fail_next(503, 3)
+        self.assertFalse(refresher.refresh())
+        self.assertTrue(refresher.model is model)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,9 +3,19 @@
 import unittest
 import mock
 import logging
-
-from kalliope.core.NeuronModule import MissingParameterException
+import io
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+from kalliope.core.NeuronModule import MissingParameterException, \
+    InvalidParameterException
+import loxsession
+from loxclient import LoxClient
 from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
 
 logging.basicConfig()
 logger = logging.getLogger("kalliope.neuron.loxscontrol")
@@ -85,6 +95,49 @@ class TestLoxSControl(unittest.TestCase):
             u'room': u'0ceefd17'}            
             }
 
+        self.lxapp = {u'lastModified': u'2017-03-12 10:11:12',
+                      u'msInfo': {u'languageCode': u'DEU',
+                                  u'location': u'Home',
+                                  u'roomTitle': u'Raum'},
+                      u'rooms': {u'0ceefd17': {u'name': u'K\xfcche',
+                                               u'uuid': u'0ceefd17'},
+                                 u'0c10052e': {u'name': u'Flur',
+                                               u'uuid': u'0c10052e'}},
+                      u'cats': {u'0c10052e': {u'name': u'Light',
+                                              u'uuid': u'0c10052e',
+                                              u'type': u'lights'}},
+                      u'controls': self.lxstructuredef}
+
+        # isolate the structure cache of each test
+        LoxClient._structure_cache.clear()
+        self.cachedir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the structure cache and sessions of the test."""
+        LoxClient._structure_cache.clear()
+        loxsession.close_sessions()
+        shutil.rmtree(self.cachedir)
+
+    def _miniserver_get(self, version):
+        """
+            Return a side effect for requests.get faking a miniserver.
+
+            :param version: structure version reported by the miniserver
+            :return: function returning a mocked response
+
+        """
+        def get(url, **kwargs):
+            response = mock.Mock()
+            if url.endswith(LoxClient.VERSION):
+                response.json.return_value = {
+                    u'LL': {u'control': u'dev/sps/LoxAPPversion',
+                            u'value': version, u'Code': u'200'}}
+            elif url.endswith(LoxClient.STRUCTUREDEF):
+                response.raw = io.BytesIO(
+                    json.dumps(self.lxapp).encode('utf-8'))
+            return response
+        return get
+
     def test_parameters(self):
         """Test for all combinations of missing parameters."""
 
@@ -160,12 +213,13 @@ class TestLoxSControl(unittest.TestCase):
             "lx_password": self.lxms_password,
             "lx_ip": self.lxms_ip,
             "lx_structuredef": self.controls,
+            "action": "change",
             "control_name":  u'K\xfcche Arbeitsfl\xe4che',
             "newstate": self.change_newstate        
         }
        
-        with mock.patch("requests.get"):
-                loxone_test = Loxscontrol(**parameters)
+        with mock.patch("requests.Session.get"):
+                loxone_test = Loxscontrol(**parameters).client
                 loxone_test._rooms = self.rooms
  
                 ###############
@@ -176,8 +230,10 @@ class TestLoxSControl(unittest.TestCase):
                 self.assertEqual(loxone_test.get_type_by_uuid('0c100510'), loxone_test.CAT_UNDEF)
                 
                 # Test Types
-                self.assertTrue(loxone_test.get_type_by_uuid('0c119829') in loxone_test.TYPE_SWITCH)
-                self.assertTrue(loxone_test.get_type_by_uuid('0c11982d') in loxone_test.TYPE_JALOUSIE)
+                self.assertEqual(
+                    loxone_test.get_type_by_uuid('0c119829'), "Switch")
+                self.assertEqual(
+                    loxone_test.get_type_by_uuid('0c11982d'), "Jalousie")
 
                 # Test Rooms
                 self.assertEqual(loxone_test.get_type_by_uuid('0ceefd17'), loxone_test.CAT_ROOM)
@@ -210,6 +266,81 @@ class TestLoxSControl(unittest.TestCase):
                 self.assertEqual(loxone_test.get_controluuid_by_name(u'Light'), None)  
                 # Rooms are not working               
                 self.assertEqual(loxone_test.get_controluuid_by_name( u'K\xfcche'), None)
+
+                # Names are case insensitive and may be part of a sentence
+                self.assertEqual(loxone_test.get_controluuid_by_name(u'living ROOM 2'),u'0c11982d')
+                self.assertEqual(loxone_test.get_controluuid_by_name(u'das Licht K\xfcche Arbeitsfl\xe4che'),'0c119829')
+
+                # Spoken names, other word order, number words
+                self.assertEqual(loxone_test.get_controluuid_by_name(u'Kueche Arbeitsflaeche'),'0c119829')
+                self.assertEqual(loxone_test.get_controluuid_by_name(u'Arbeitsfl\xe4che in der K\xfcche'),'0c119829')
+                self.assertEqual(loxone_test.get_controluuid_by_name(u'living room two'),u'0c11982d')
+
+    def test_indexes(self):
+        """Test the lookup indexes and ambiguous names."""
+
+        controls = dict(self.controls)
+        controls[u'0c10054e'] = {'controls': {u'0c119830':
+                                              {'name': u'living room',
+                                               'room': u'0ceefd17',
+                                               'type': u'Switch',
+                                               'uidAction': u'0c119831'}},
+                                 'name': u'Light 2',
+                                 'type': u'lights',
+                                 'uid': u'0c10054e'}
+        parameters = {
+            "lx_user": self.lxms_user,
+            "lx_password": self.lxms_password,
+            "lx_ip": self.lxms_ip,
+            "lx_structuredef": controls,
+            "action": "change",
+            "control_name":  u'Living room',
+            "newstate": self.change_newstate
+        }
+
+        with mock.patch("requests.Session.get") as mock_requests_get:
+                loxone_test = Loxscontrol(**parameters)
+                # ambiguous name is reported, nothing is changed
+                self.assertEqual(loxone_test.message["status_code"],
+                                 "AmbiguousName")
+                self.assertEqual(loxone_test.message["summary"],
+                                 u'Living room, living room')
+                self.assertFalse(mock_requests_get.called)
+
+                # indexes refer to the controls by their index
+                client = loxone_test.client
+                indexes = client._indexes
+
+                def uuids(index):
+                    return sorted(client._records[i].uidaction
+                                  for i in index)
+
+                self.assertEqual(uuids(indexes['name'].match(u'living room')),
+                                 [u'0c11982f', u'0c119831'])
+                self.assertEqual(uuids(indexes['room'][u'0ceefd1d']),
+                                 [u'0c11982d', u'0c11982f'])
+                self.assertEqual(uuids(indexes['cattype'][u'lights']),
+                                 [u'0c119829', u'0c119831'])
+                self.assertEqual(uuids(indexes['type'][u'Jalousie']),
+                                 [u'0c11982d', u'0c11982f'])
+                self.assertEqual(uuids(client._controls[u'0c10054e'][
+                    'controls']), [u'0c119831'])
+                # the given structure definition is not changed
+                self.assertTrue(u'0c119830' in
+                                controls[u'0c10054e']['controls'])
+
+                # lookups by control uuid and by action uuid
+                self.assertEqual(client.get_name_by_uuid(u'0c119830'),
+                                 u'living room')
+                self.assertEqual(client.get_type_by_uuid(u'0c119831'),
+                                 u'Switch')
+                self.assertEqual(
+                    client.get_controluuid_by_name(u'living room'),
+                    None)
+                self.assertEqual(
+                    sorted(client.get_controluuids_by_name(
+                        u'living room')),
+                    [u'0c11982f', u'0c119831'])
                 
                 
                 
@@ -223,7 +354,7 @@ class TestLoxSControl(unittest.TestCase):
                 :return:
 
             """
-            with mock.patch("requests.get") as mock_requests_get:
+            with mock.patch("requests.Session.get") as mock_requests_get:
                 loxone_test = Loxscontrol(**parameters)
                 self.assertEqual(loxone_test.message["status_code"],
                                  expected_state)
@@ -231,11 +362,10 @@ class TestLoxSControl(unittest.TestCase):
                     mock_requests_get.\
                         assert_called_once_with("http://" +
                                                 self.lxms_ip +
-                                                Loxscontrol.SPSIO +
+                                                LoxClient.SPSIO +
                                                 "0c119829" + "/" +
                                                 self.change_newstate,
-                                                auth=(self.lxms_user,
-                                                      self.lxms_password))
+                                                timeout=loxsession.TIMEOUT)
                 mock_requests_get.reset_mock()
 
         # change by name, missing state
@@ -244,6 +374,7 @@ class TestLoxSControl(unittest.TestCase):
             "lx_password": self.lxms_password,
             "lx_ip": self.lxms_ip,
             "lx_structuredef": self.controls,
+            "action": "change",
             "control_name":  u'K\xfcche Arbeitsfl\xe4che',
         }
         expected_uuid = None
@@ -262,6 +393,285 @@ class TestLoxSControl(unittest.TestCase):
         expected_state = "StateChangeError"
         run_test(parameters,  expected_uuid,  expected_state)
 
+        # state not valid for a jalousie, nothing is sent
+        parameters["control_name"] = u'Living room 2'
+        with mock.patch("requests.Session.get") as mock_requests_get:
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(loxone_test.status_code, "InvalidState")
+            self.assertTrue(u'fullup' in loxone_test.summary)
+            self.assertTrue(u'0-100' in loxone_test.summary)
+            self.assertFalse(mock_requests_get.called)
+
+    def test_change_batch(self):
+        """Test changing all controls of a room and/or category."""
+
+        server = FakeMiniserver(latency=0.2)
+        self.addCleanup(server.stop)
+        parameters = {
+            "lx_user": server.user,
+            "lx_password": server.password,
+            "lx_ip": server.host,
+            "lx_cachedir": self.cachedir,
+            "action": "change",
+            "control_room": "im Living room",
+            "control_type": LoxClient.CAT_LIGTH,
+            "newstate": "off"
+        }
+
+        # lights of a room
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(loxone_test.summary,
+                         [{"name": "Living room light", "uuid": "0c11982a",
+                           "room": "Living room", "success": True}])
+        self.assertEqual(server.commands, ["dev/sps/io/0c11982a/off"])
+
+        # all jalousies of the house are changed in parallel
+        del server.commands[:]
+        parameters["control_room"] = None
+        parameters["control_type"] = LoxClient.CAT_JALOUSIE
+        parameters["newstate"] = "FullDown"
+        del server.intervals[:]
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(sorted(server.commands),
+                         ["dev/sps/io/0c11982d/FullDown",
+                          "dev/sps/io/0c11982f/FullDown"])
+        self.assertEqual(server.max_in_flight("/dev/sps/io/"), 2)
+
+        # all controls of a room, only the light accepts the state
+        del server.commands[:]
+        parameters["control_room"] = "Living room"
+        parameters["control_type"] = None
+        parameters["newstate"] = "on"
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(server.commands, ["dev/sps/io/0c11982a/on"])
+
+        # positions are sent as command of the jalousie
+        del server.commands[:]
+        parameters["newstate"] = "50 %"
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(sorted(server.commands),
+                         ["dev/sps/io/0c11982d/manualPosition/50",
+                          "dev/sps/io/0c11982f/manualPosition/50"])
+
+        # no control accepts the state, nothing is sent
+        del server.commands[:]
+        parameters["newstate"] = "purple"
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "InvalidState")
+        self.assertEqual(server.commands, [])
+
+        # one of them fails, invalid states fail without a request
+        server.fail_next(404)
+        client = loxone_test.client
+        summary = client.change_state_batch(
+            client.get_controluuids_by_room_and_type("Living room", None),
+            "up")
+        self.assertEqual(len(summary), 3)
+        self.assertEqual(len([c for c in summary if c['success']]), 1)
+        self.assertEqual(len(server.commands), 1)
+        self.assertTrue(server.commands[0].endswith("/FullUp"))
+
+        # unknown room
+        parameters["control_room"] = "Garage"
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "StateChangeError")
+
+    def test_scene(self):
+        """Test changing several controls in one order."""
+
+        server = FakeMiniserver(latency=0.2)
+        self.addCleanup(server.stop)
+        parameters = {
+            "lx_user": server.user,
+            "lx_password": server.password,
+            "lx_ip": server.host,
+            "lx_cachedir": self.cachedir,
+            "action": "scene",
+            "scene_steps": [
+                {"control_room": "Living room", "control_type": "lights",
+                 "newstate": "off"},
+                {"control_type": "shading", "newstate": "down"},
+                {"control_name": "Kitchen light", "newstate": "on",
+                 "delay": 0}]
+        }
+
+        # the first steps are sent in parallel, then the last one
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(sorted(server.commands[:3]),
+                         ["dev/sps/io/0c11982a/off",
+                          "dev/sps/io/0c11982d/FullDown",
+                          "dev/sps/io/0c11982f/FullDown"])
+        self.assertEqual(server.commands[3:], ["dev/sps/io/0c119829/on"])
+        self.assertEqual([c['name'] for c in loxone_test.summary],
+                         ["Living room light", "Living room window",
+                          "Living room door", "Kitchen light"])
+        self.assertEqual(server.max_in_flight("/dev/sps/io/"), 3)
+
+        # unknown names fail, the other steps are sent
+        del server.commands[:]
+        parameters["scene_steps"] = [
+            {"control_name": "Garage", "newstate": "on"},
+            {"control_name": "Kitchen light", "newstate": "purple"},
+            {"control_name": "Kitchen light", "newstate": "off"}]
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "StateChangeError")
+        self.assertEqual(server.commands, ["dev/sps/io/0c119829/off"])
+        self.assertEqual([c['success'] for c in loxone_test.summary],
+                         [True, False, False])
+
+        # changes of the same control are sent one after the other
+        del server.commands[:]
+        parameters["scene_steps"] = [
+            {"control_name": "Kitchen light", "newstate": "off"},
+            {"control_type": "lights", "newstate": "on"}]
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(server.commands[0], "dev/sps/io/0c119829/off")
+        self.assertEqual(sorted(server.commands[1:]),
+                         ["dev/sps/io/0c119829/on",
+                          "dev/sps/io/0c11982a/on"])
+
+        # delayed steps are sent after the answer
+        del server.commands[:]
+        release = threading.Event()
+        parameters["scene_steps"] = [
+            {"control_name": "Kitchen light", "newstate": "on"},
+            {"control_name": "Living room light", "newstate": "off",
+             "delay": "30"}]
+        with mock.patch("loxclient.time", wraps=time) as fake_time:
+            fake_time.sleep.side_effect = lambda delay: release.wait()
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(loxone_test.status_code, "Complete")
+            self.assertEqual(server.commands, ["dev/sps/io/0c119829/on"])
+            self.assertEqual([c['name'] for c in loxone_test.summary],
+                             ["Kitchen light"])
+            release.set()
+            for _ in range(100):
+                if len(server.commands) == 2:
+                    break
+                time.sleep(0.02)
+        fake_time.sleep.assert_called_once_with(30.0)
+        self.assertEqual(server.commands[1], "dev/sps/io/0c11982a/off")
+
+        # steps must be a list of dicts with a name, a state and a delay
+        # of seconds
+        for steps in ("Kitchen light",
+                      [{"newstate": "on"}],
+                      [{"control_name": "Kitchen light"}],
+                      [{"control_name": "Kitchen light", "newstate": "on",
+                        "delay": "soon"}],
+                      [{"control_name": "Kitchen light", "newstate": "on",
+                        "delay": -5}]):
+            parameters["scene_steps"] = steps
+            with self.assertRaises(InvalidParameterException):
+                Loxscontrol(**parameters)
+
+    def test_optimistic(self):
+        """Test changes are answered first and confirmed afterwards."""
+
+        server = FakeMiniserver(latency=0.2)
+        self.addCleanup(server.stop)
+        parameters = {
+            "lx_user": server.user,
+            "lx_password": server.password,
+            "lx_ip": server.host,
+            "lx_cachedir": self.cachedir,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+        loxone_test = Loxscontrol(**parameters)
+
+        # the answer of the miniserver is checked
+        server.reject_next(500)
+        self.assertFalse(
+            loxone_test.client.change_state_byuuid("0c119829", "on"))
+
+        def wait_for(condition):
+            for _ in range(250):
+                if condition():
+                    return
+                time.sleep(0.02)
+
+        parameters["lx_optimistic"] = True
+        with mock.patch.object(Loxscontrol, "say") as mock_say:
+            del server.commands[:]
+            # answered before the miniserver executes the command
+            server.hold_commands()
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(loxone_test.status_code, "Complete")
+            self.assertEqual(mock_say.call_count, 1)
+            self.assertEqual(server.commands, [])
+            server.release_commands()
+            wait_for(lambda: loxone_test.client.stats.get_counter(
+                "confirmations", result="confirmed"))
+            self.assertEqual(server.commands, ["dev/sps/io/0c119829/on"])
+
+            # a refused change is logged afterwards, nothing is said
+            server.reject_next(500)
+            parameters["control_name"] = None
+            parameters["control_room"] = "Living room"
+            parameters["control_type"] = LoxClient.CAT_LIGTH
+            with mock.patch("loxclient.logger") as mock_logger:
+                loxone_test = Loxscontrol(**parameters)
+                self.assertEqual(loxone_test.status_code, "Complete")
+                wait_for(lambda: mock_logger.error.called)
+            self.assertEqual(loxone_test.client.stats.get_counter(
+                "late_failures", result="StateChangeError"), 1)
+            self.assertTrue("Living room light" in
+                            mock_logger.error.call_args[0])
+            self.assertEqual(mock_say.call_count, 2)
+
+    def test_list(self):
+        """Test lists of rooms, categories and controls."""
+
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        parameters = {
+            "lx_user": server.user,
+            "lx_password": server.password,
+            "lx_ip": server.host,
+            "lx_cachedir": self.cachedir,
+            "action": "list",
+            "control_type": LoxClient.CAT_ROOM
+        }
+
+        def run_list(room, cattype):
+            parameters["control_room"] = room
+            parameters["control_type"] = cattype
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(loxone_test.status_code, "List")
+            return loxone_test.summary
+
+        self.assertEqual(run_list(None, LoxClient.CAT_ROOM),
+                         "Kitchen and Living room")
+        self.assertEqual(run_list(None, LoxClient.CAT_CATEGORY),
+                         "Light and Shading")
+        self.assertEqual(run_list("Living room", None),
+                         "Living room door, Living room light and "
+                         "Living room window")
+        self.assertEqual(run_list("living room", "shading"),
+                         "Living room door and Living room window")
+        self.assertEqual(run_list(None, "lights"),
+                         "Kitchen light and Living room light")
+        self.assertEqual(run_list("Garage", None), None)
+
+        # lists are rendered once per structure
+        parameters["control_type"] = LoxClient.CAT_ROOM
+        parameters["control_room"] = None
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.client.stats.get_counter(
+            "list_cache", result="hit"), 1)
+        self.assertEqual(loxone_test.client.render_list(
+            [u"Zimmer", u"K\xfcche", u"Kueche 2", u"Bad", u"Zimmer"]),
+            u"Bad, K\xfcche, Kueche 2 and Zimmer")
+        self.assertEqual(loxone_test.client.render_list([]), None)
+
     def test_load_config(self):
         """Test loading the structure definition of the miniserver."""
 
@@ -271,18 +681,80 @@ class TestLoxSControl(unittest.TestCase):
             "lx_user": self.lxms_user,
             "lx_password": self.lxms_password,
             "lx_ip": self.lxms_ip,
+            "lx_cachedir": self.cachedir,
+            "action": "change",
             "control_name": "name"
         }
-        with mock.patch("requests.get") as mock_requests_get:
-                self.loxone_test = Loxscontrol(**parameters)
+        with mock.patch("requests.Session.get") as mock_requests_get:
+                # the mocked miniserver sends no structure
+                mock_requests_get.return_value.raw = io.BytesIO(b"")
+                with self.assertRaises(MissingParameterException):
+                    self.loxone_test = Loxscontrol(**parameters)
+                mock_requests_get.\
+                    assert_any_call("http://" +
+                                    self.lxms_ip +
+                                    LoxClient.VERSION,
+                                    timeout=loxsession.TIMEOUT)
                 mock_requests_get.\
-                    assert_called_once_with("http://" +
-                                            self.lxms_ip +
-                                            Loxscontrol.STRUCTUREDEF,
-                                            auth=(self.lxms_user,
-                                                  self.lxms_password))
+                    assert_called_with("http://" +
+                                       self.lxms_ip +
+                                       LoxClient.STRUCTUREDEF,
+                                       timeout=loxsession.TIMEOUT,
+                                       stream=True)
                 mock_requests_get.reset_mock()
 
+    def test_structure_cache(self):
+        """Test caching of the structure definition by its version."""
+
+        parameters = {
+            "lx_user": self.lxms_user,
+            "lx_password": self.lxms_password,
+            "lx_ip": self.lxms_ip,
+            "lx_cachedir": self.cachedir,
+            "action": "change",
+            "control_name": "name"
+        }
+        structure_url = "http://" + self.lxms_ip + LoxClient.STRUCTUREDEF
+
+        def count_structure_requests(mock_requests_get):
+            return len([c for c in mock_requests_get.call_args_list
+                        if c[0][0] == structure_url])
+
+        # first instance loads the structure
+        with mock.patch("requests.Session.get") as mock_requests_get:
+            mock_requests_get.side_effect = self._miniserver_get(
+                u'2017-03-12 10:11:12')
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(count_structure_requests(mock_requests_get), 1)
+            self.assertEqual(loxone_test.client._rooms[u'0ceefd17']['name'],
+                             u'K\xfcche')
+
+        # second instance uses the process-wide cache
+        with mock.patch("requests.Session.get") as mock_requests_get:
+            mock_requests_get.side_effect = self._miniserver_get(
+                u'2017-03-12 10:11:12')
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(count_structure_requests(mock_requests_get), 0)
+            self.assertEqual(loxone_test.client._language, u'DEU')
+            self.assertTrue(u'0c10052e' in loxone_test.client._controls)
+
+        # the on-disk cache survives a restart of the process
+        LoxClient._structure_cache.clear()
+        with mock.patch("requests.Session.get") as mock_requests_get:
+            mock_requests_get.side_effect = self._miniserver_get(
+                u'2017-03-12 10:11:12')
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(count_structure_requests(mock_requests_get), 0)
+            self.assertEqual(loxone_test.client._rooms[u'0ceefd17']['name'],
+                             u'K\xfcche')
+
+        # a new version invalidates the cache
+        with mock.patch("requests.Session.get") as mock_requests_get:
+            mock_requests_get.side_effect = self._miniserver_get(
+                u'2017-04-01 08:00:00')
+            loxone_test = Loxscontrol(**parameters)
+            self.assertEqual(count_structure_requests(mock_requests_get), 1)
+
     def test_extract_controls(self):
         """Test json import of structuredef."""
         pass
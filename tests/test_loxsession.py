@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the shared miniserver sessions."""
+import unittest
+
+from kalliope.core.NeuronModule import MissingParameterException
+import loxsession
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxSession(unittest.TestCase):
+
+    """Unittest TestCase for the shared miniserver sessions."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": "",
+            "lx_backoff": 0,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop the fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_get_session(self):
+        """Test sessions are shared per miniserver and user."""
+        session = loxsession.get_session("127.0.0.1", "user", "pw")
+        self.assertTrue(
+            loxsession.get_session("127.0.0.1", "user", "pw") is session)
+        self.assertFalse(
+            loxsession.get_session("127.0.0.1", "other", "pw") is session)
+        self.assertFalse(
+            loxsession.get_session("127.0.0.2", "user", "pw") is session)
+
+        # changed password is used by the shared session
+        loxsession.get_session("127.0.0.1", "user", "new")
+        self.assertEqual(session.auth, ("user", "new"))
+
+    def test_connection_reuse(self):
+        """Test neuron instances reuse one keep-alive connection."""
+        for newstate in ["on", "off", "on", "off"]:
+            self.parameters["newstate"] = newstate
+            loxone_test = Loxscontrol(**self.parameters)
+            self.assertEqual(loxone_test.status_code, "Complete")
+
+        self.assertEqual(self.server.commands,
+                         ["dev/sps/io/0c119829/on",
+                          "dev/sps/io/0c119829/off",
+                          "dev/sps/io/0c119829/on",
+                          "dev/sps/io/0c119829/off"])
+        self.assertEqual(self.server.connections, 1)
+
+    def test_retry(self):
+        """Test requests are retried if the miniserver is busy."""
+        Loxscontrol(**self.parameters)
+        self.server.fail_next(503, 2)
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(len(self.server.commands), 2)
+
+        # no more retries left
+        self.parameters["lx_retries"] = 1
+        loxsession.close_sessions()
+        client = Loxscontrol(**self.parameters).client
+        self.server.fail_next(503, 2)
+        self.assertFalse(client.change_state_byuuid("0c119829", "off"))
+        self.assertEqual(len(self.server.commands), 3)
+
+    def test_wrong_password(self):
+        """Test a wrong password fails the request."""
+        self.parameters["lx_password"] = "wrong"
+        with self.assertRaises(MissingParameterException):
+            Loxscontrol(**self.parameters)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""TestCase for snapshots of the structure definition."""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import loxsession
+import loxsnapshot
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STRUCTURE
+
+
+class TestLoxSnapshot(unittest.TestCase):
+
+    """Unittest TestCase for snapshots."""
+
+    def setUp(self):
+        """Parse the structure of the fake miniserver."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.snapshot = os.path.join(self.tmpdir, "structure.json")
+        self.structure = os.path.join(self.tmpdir, "Loxapp3.json")
+        with open(self.structure, 'w') as f:
+            json.dump(STRUCTURE, f)
+
+    def tearDown(self):
+        """Remove the snapshots."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_snapshot(self):
+        """Test a snapshot is loaded as it was written."""
+        with open(self.structure, 'rb') as f:
+            version, model = loxsnapshot.from_structure(f)
+        self.assertEqual(version, "2017-03-12 10:11:12")
+        loxsnapshot.dump(self.snapshot, model, version, "10.0.0.1")
+        header, loaded = loxsnapshot.load(self.snapshot)
+        self.assertEqual(header['version'], version)
+        self.assertEqual(header['host'], "10.0.0.1")
+        self.assertEqual([record.to_list() for record in loaded.records],
+                         [record.to_list() for record in model.records])
+        self.assertEqual(loaded.to_dict(), model.to_dict())
+        for name in ("uuid", "room", "cattype", "type"):
+            self.assertEqual(loaded.indexes[name], model.indexes[name])
+        self.assertEqual(loaded.indexes['name'].rank(u"living room light"),
+                         model.indexes['name'].rank(u"living room light"))
+        self.assertEqual(loaded.indexes['roomname'].match(u"kitchen"),
+                         ["0ceefd17"])
+        # strings are shared by the records
+        self.assertTrue(loaded.records[0].type is loaded.records[1].type)
+
+        # on-disk caches of older formats and broken files are rejected
+        with open(self.snapshot, 'w') as f:
+            json.dump({"format": 2, "version": version,
+                       "structure": model.to_dict()}, f)
+        self.assertRaises(loxsnapshot.SnapshotError, loxsnapshot.load,
+                          self.snapshot)
+        snapshot = {"format": loxsnapshot.FORMAT, "version": version,
+                    "model": model.to_snapshot()}
+        snapshot['model']['names']['keys'].pop()
+        with open(self.snapshot, 'w') as f:
+            json.dump(snapshot, f)
+        self.assertRaises(loxsnapshot.SnapshotError, loxsnapshot.load,
+                          self.snapshot)
+        with open(self.snapshot, 'w') as f:
+            f.write("{")
+        self.assertRaises(loxsnapshot.SnapshotError, loxsnapshot.load,
+                          self.snapshot)
+
+    def test_neuron(self):
+        """Test the neuron loads the snapshot instead of the structure."""
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        self.assertEqual(loxsnapshot.main(
+            [self.snapshot, "--structure", self.structure]), 0)
+        parameters = {"lx_ip": server.host, "lx_user": server.user,
+                      "lx_password": server.password, "lx_cachedir": "",
+                      "lx_snapshot": self.snapshot, "lx_retries": 0,
+                      "action": "change", "control_name": "Kitchen light",
+                      "newstate": "on"}
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(server.requests, ["/dev/sps/LoxAPPversion",
+                                           "/dev/sps/io/0c119829/on"])
+        self.assertEqual(
+            loxone_test.client.stats.get_counter("structure_cache",
+                                                 result="snapshot"), 1)
+
+        # the snapshot is used while the miniserver doesn't tell its
+        # version
+        LoxClient._structure_cache.clear()
+        server.fail_next(503)
+        parameters.update({"action": "list", "control_name": None,
+                           "control_type": LoxClient.CAT_ROOM})
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "List")
+        self.assertEqual(len(loxone_test.client._records), 4)
+
+        # a snapshot of another version is not used
+        LoxClient._structure_cache.clear()
+        server.version = "2018-01-01 00:00:00"
+        del server.requests[:]
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(server.requests, ["/dev/sps/LoxAPPversion",
+                                           "/data/Loxapp3.json"])
+
+    def test_main(self):
+        """Test a snapshot is written of a miniserver."""
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        self.assertEqual(loxsnapshot.main(
+            [self.snapshot, "--ip", server.host, "--user", server.user,
+             "--password", "wrong"]), 1)
+        self.assertFalse(os.path.exists(self.snapshot))
+        self.assertEqual(loxsnapshot.main(
+            [self.snapshot, "--ip", server.host, "--user", server.user,
+             "--password", server.password]), 0)
+        header, model = loxsnapshot.load(self.snapshot)
+        self.assertEqual(header['version'], server.version)
+        self.assertEqual(header['host'], server.host)
+        self.assertEqual(len(model.records), 4)
+
+        # a structure definition without version
+        structure = dict(STRUCTURE, lastModified=None)
+        version, model = loxsnapshot.from_structure(
+            io.BytesIO(json.dumps(structure).encode('utf-8')))
+        self.assertEqual(version, None)
+        self.assertEqual(len(model.records), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the state table fed by status updates."""
+import threading
+import time
+import unittest
+
+import loxsession
+import loxstate
+import loxwebsocket
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STATE, encode_value_events, \
+    encode_text_events
+
+
+class TestLoxState(unittest.TestCase):
+
+    """Unittest TestCase for the state table."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": "",
+            "lx_statusupdates": True,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop the fake miniserver."""
+        loxwebsocket.close_connections()
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_parse_events(self):
+        """Test parsing binary event tables."""
+        uuid = "0c10052e-0094-3a8f-ffff403fb0c34b9e"
+        self.assertEqual(loxstate.uuid_to_bytes(uuid),
+                         encode_value_events([(uuid, 0)])[:16])
+
+        events = [(uuid, 1.5), (STATE % 1, -20.0)]
+        self.assertEqual(
+            loxstate.parse_value_events(encode_value_events(events)),
+            events)
+
+        events = [(uuid, u"K\xfcche"), (STATE % 1, u"text"),
+                  (STATE % 2, u"")]
+        self.assertEqual(
+            loxstate.parse_text_events(encode_text_events(events)),
+            events)
+
+    def test_wait_for(self):
+        """Test waiting for a state value."""
+        table = loxstate.LoxStateTable()
+        self.assertFalse(table.warm)
+        table.set_live(True)
+        table.update([(STATE % 1, 0.0)])
+        self.assertTrue(table.warm)
+        self.assertFalse(table.wait_for(STATE % 1, 1.0, 0.05))
+
+        timer = threading.Timer(0.05, table.update, [[(STATE % 1, 1.0)]])
+        timer.start()
+        self.assertTrue(table.wait_for(STATE % 1, 1.0, 5))
+        self.assertEqual(table.get(STATE % 1), 1.0)
+
+        # a table without updates is not waited for
+        table.set_live(False)
+        start = time.time()
+        self.assertFalse(table.wait_for(STATE % 1, 0.0, 5))
+        self.assertTrue(time.time() - start < 1)
+
+    def test_status_updates(self):
+        """Test states are known without requests."""
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        client = loxone_test.client
+        self.assertEqual(client.get_state("0c119829", "active"), 1.0)
+
+        # pushed changes are in the table without a request
+        requests = len(self.server.requests)
+        self.server.set_state(STATE % 0x34, 0.5)
+        connection = loxwebsocket.get_connection(
+            self.server.host, self.server.user, self.server.password, 5)
+        self.assertTrue(connection.states.wait_for(STATE % 0x34, 0.5, 5))
+        self.assertEqual(client.get_state("0c11982f", "position"), 0.5)
+        self.assertEqual(len(self.server.requests), requests)
+
+        # unknown controls and states
+        self.assertTrue(client.get_state("0c119829", "nothing") is None)
+        self.assertTrue(client.get_state("nothing", "active") is None)
+
+    def test_verify_state(self):
+        """Test a state change not reported by the miniserver fails."""
+        self.server.auto_states = False
+        self.parameters["lx_verifytimeout"] = 0.2
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "StateChangeError")
+        self.assertEqual(self.server.commands, ["dev/sps/io/0c119829/on"])
+
+        # states without a known value are not verified
+        self.assertTrue(loxone_test.client.change_state_byuuid("0c11982f",
+                                                               "FullUp"))
+
+    def test_action_status(self):
+        """Test the status action with and without state table."""
+        self.server.set_state(STATE % 0x30, 1.0)
+        self.server.set_state(STATE % 0x34, 0.25)
+        self.parameters["action"] = Loxscontrol.ACT_STATUS
+        self.parameters["control_name"] = None
+        self.parameters["control_room"] = "Living room"
+
+        # without state table, states are requested in parallel
+        self.parameters["lx_statusupdates"] = False
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Status")
+        summary = dict((c['uuid'], c) for c in loxone_test.summary)
+        self.assertEqual(len(summary), 3)
+        self.assertEqual(summary["0c11982f"]["value"], 0.25)
+        self.assertEqual(summary["0c11982f"]["type"], "Jalousie")
+        self.assertEqual(summary["0c11982f"]["room"], "Living room")
+        self.assertEqual(summary["0c11982a"]["value"], 0.0)
+        self.assertTrue("/dev/sps/io/0c11982f" in self.server.requests)
+
+        # with a warm state table, nothing is requested
+        self.parameters["lx_statusupdates"] = True
+        self.parameters["control_room"] = None
+        self.parameters["control_name"] = "Kitchen light"
+        Loxscontrol(**self.parameters)
+        del self.server.requests[:]
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.summary[0]["value"], 1.0)
+        self.assertFalse([r for r in self.server.requests
+                          if r.startswith("/dev/sps/io/")])
+
+        # unknown name
+        self.parameters["control_name"] = "Garage"
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Status")
+        self.assertEqual(loxone_test.summary, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the timings and counters."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import loxsession
+import loxstats
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxStats(unittest.TestCase):
+
+    """Unittest TestCase for the timings and counters."""
+
+    def setUp(self):
+        """Start with empty stats."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        loxstats.STATS.clear()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove sessions and the stats file."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        loxstats.STATS.clear()
+        shutil.rmtree(self.tmpdir)
+
+    def test_stats(self):
+        """Test recording, summary and the Prometheus text format."""
+        stats = loxstats.Stats(parent=loxstats.STATS)
+        stats.observe("lookup_name", 0.002)
+        stats.observe("lookup_name", 0.004)
+        with stats.timer("say"):
+            pass
+        stats.count("structure_cache", result="miss")
+        stats.count("retries")
+
+        self.assertEqual(stats.get_timer("lookup_name"), (2, 0.006, 0.004))
+        self.assertEqual(stats.get_timer("other"), (0, 0.0, 0.0))
+        self.assertEqual(stats.get_counter("structure_cache",
+                                           result="miss"), 1)
+        summary = stats.summary()
+        self.assertEqual(summary["ms"]["lookup_name"], 6.0)
+        self.assertTrue("say" in summary["ms"])
+        self.assertEqual(summary["counts"], {
+            'structure_cache{result="miss"}': 1, "retries": 1})
+
+        # everything is recorded by the parent too
+        self.assertEqual(loxstats.STATS.get_timer("lookup_name")[0], 2)
+        text = loxstats.STATS.render()
+        self.assertTrue('loxscontrol_phase_seconds_count{phase='
+                        '"lookup_name"} 2\n' in text)
+        self.assertTrue('loxscontrol_phase_seconds_max{phase='
+                        '"lookup_name"} 0.004000\n' in text)
+        self.assertTrue('loxscontrol_structure_cache_total{result='
+                        '"miss"} 1\n' in text)
+        self.assertTrue('# TYPE loxscontrol_retries_total counter\n'
+                        in text)
+
+    def test_order(self):
+        """Test the phases of an order and the stats file."""
+        server = FakeMiniserver()
+        self.addCleanup(server.stop)
+        statsfile = os.path.join(self.tmpdir, "loxscontrol.prom")
+        loxone_test = Loxscontrol(lx_ip=server.host, lx_user=server.user,
+                                  lx_password=server.password,
+                                  lx_cachedir="", lx_statsfile=statsfile,
+                                  action="change",
+                                  control_name="Kitchen light",
+                                  newstate="on")
+        self.assertEqual(loxone_test.status_code, "Complete")
+        summary = loxone_test.client.stats.summary()
+        for phase in ["order", "say", "load_config", "load_model",
+                      "extract_controls", "lookup_name", "change_state"]:
+            self.assertTrue(phase in summary["ms"], phase)
+        self.assertEqual(summary["counts"], {
+            'structure_cache{result="miss"}': 1})
+        self.assertEqual(loxstats.STATS.get_counter("http_responses",
+                                                    code=200), 3)
+
+        with open(statsfile) as f:
+            text = f.read()
+        self.assertTrue('loxscontrol_http_responses_total{code="200"} 3\n'
+                        in text)
+
+        # a miniserver failing once is retried, the structure is cached
+        server.fail_next(503)
+        loxone_test = Loxscontrol(lx_ip=server.host, lx_user=server.user,
+                                  lx_password=server.password,
+                                  lx_cachedir="", lx_backoff=0,
+                                  action="change",
+                                  control_name="Kitchen light",
+                                  newstate="on")
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(loxstats.STATS.get_counter("retries"), 1)
+        self.assertEqual(loxone_test.client.stats.get_counter(
+            "structure_cache", result="memory"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""TestCase for token-based authentication."""
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+
+import loxsession
+import loxstats
+import loxtoken
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxToken(unittest.TestCase):
+
+    """Unittest TestCase for tokens."""
+
+    def setUp(self):
+        """Start a fake miniserver refusing basic auth."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        loxstats.STATS.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.server = FakeMiniserver()
+        self.server.basic_auth = False
+        self.parameters = {"lx_ip": self.server.host,
+                           "lx_user": self.server.user,
+                           "lx_password": self.server.password,
+                           "lx_cachedir": self.tmpdir,
+                           "lx_auth": "token",
+                           "action": "change",
+                           "control_name": "Kitchen light",
+                           "newstate": "on"}
+
+    def tearDown(self):
+        """Stop the fake miniserver, remove the token file."""
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def token_requests(self, name):
+        """Return the number of requests of the token flow."""
+        return len([path for path in self.server.requests
+                    if path.startswith("/jdev/sys/" + name + "/")])
+
+    def test_token(self):
+        """Test the token is acquired once and shared by the processes."""
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.token_requests("getjwt"), 1)
+        self.assertEqual(set(self.server.authorizations), set(["token"]))
+        self.assertTrue(len(self.server.authorizations) >= 2)
+
+        # the token file is readable by the owner only
+        path = loxtoken.get_manager(
+            self.server.host, self.server.user, self.server.password,
+            loxone_test.client._session, self.tmpdir).path
+        self.assertEqual(os.path.dirname(path), self.tmpdir)
+        self.assertEqual(stat.S_IMODE(os.stat(path).st_mode) & 0o077, 0)
+
+        # another process takes the token from the file
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.token_requests("getjwt"), 1)
+        self.assertEqual(
+            loxstats.STATS.get_counter("tokens", result="file"), 1)
+
+        # a revoked token is replaced
+        self.server.revoke_tokens()
+        self.assertTrue(
+            loxone_test.client.change_state_byuuid("0c119829", "off"))
+        self.assertEqual(self.token_requests("getjwt"), 2)
+
+        # basic auth still works if it is chosen
+        self.server.basic_auth = True
+        self.parameters['lx_auth'] = "basic"
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.authorizations[-1], "basic")
+
+    def test_refresh(self):
+        """Test the token is refreshed before it expires."""
+        self.server.token_lifetime = 3
+        session = loxsession.get_session(self.server.host, self.server.user,
+                                         self.server.password, tokens=True,
+                                         timeout=0.5)
+        manager = session.auth.manager
+        token = manager.get_token()
+        expires = manager.expires
+        time.sleep(2)
+        self.assertEqual(self.token_requests("refreshjwt"), 1)
+        self.assertNotEqual(manager.get_token(), token)
+        self.assertTrue(manager.expires > expires)
+        self.assertTrue(self.server.is_token_valid(manager.get_token()))
+        self.assertEqual(self.token_requests("getjwt"), 1)
+
+    def test_wrong_password(self):
+        """Test no token is given for a wrong password."""
+        self.parameters['lx_password'] = "wrong"
+        client = LoxClient(**self.parameters)
+        self.assertFalse(client.connect())
+        self.assertEqual(self.server.tokens, {})
+        self.assertEqual(self.server.authorizations, [])
+
+        self.parameters['lx_auth'] = "digest"
+        self.assertRaises(ValueError, LoxClient(**self.parameters).connect)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the registry of control types."""
+import unittest
+
+import copy
+
+import loxsession
+import loxtypes
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver, STRUCTURE
+
+
+class TestLoxTypes(unittest.TestCase):
+
+    """Unittest TestCase for the registry of control types."""
+
+    def test_commands(self):
+        """Test building commands from requested states."""
+        types = loxtypes.TYPES
+        self.assertEqual(types["Switch"].command("On"), "on")
+        self.assertEqual(types["Switch"].command(u"aus"), "off")
+        self.assertEqual(types["Switch"].command("50"), None)
+        self.assertEqual(types["Dimmer"].command("50 %"), "50")
+        self.assertEqual(types["Dimmer"].command("12,5"), "12.5")
+        self.assertEqual(types["Dimmer"].command("150"), None)
+        self.assertEqual(types["Dimmer"].command("bright"), None)
+        self.assertEqual(types["Jalousie"].command("runter"), "FullDown")
+        self.assertEqual(types["Jalousie"].command("FullUp"), "FullUp")
+        self.assertEqual(types["Jalousie"].command("30"),
+                         "manualPosition/30")
+        self.assertEqual(types["LightControllerV2"].command("off"),
+                         "changeTo/778")
+        self.assertEqual(types["LightControllerV2"].command("3"),
+                         "changeTo/3")
+        self.assertEqual(types["LightControllerV2"].command("1.5"), None)
+        self.assertEqual(types["LightControllerV2"].command("12,7"), None)
+        self.assertEqual(types["IRoomController"].command("21.5"),
+                         "settemp/1/21.5")
+        self.assertEqual(types["IRoomController"].command("nan"), None)
+        # manual heating, mode 3 is automatic heating
+        self.assertEqual(types["IRoomController"].command("manual"),
+                         "mode/5")
+        self.assertEqual(types["IRoomController"].command("auto"),
+                         "mode/0")
+        self.assertEqual(types["LightController"].command("on"), None)
+        self.assertEqual(types["Switch"].command(None), None)
+        self.assertEqual(types["Dimmer"].describe(),
+                         ["an", "aus", "ein", "off", "on", "0-100"])
+
+    def test_status_value(self):
+        """Test values meaning off are told as 0."""
+        moods = loxtypes.TYPES["LightControllerV2"]
+        for value in (u"[778]", u"778", 778.0, u"", u"[]"):
+            self.assertEqual(moods.status_value(value), 0)
+        self.assertEqual(moods.status_value(u"[1,778]"), u"[1,778]")
+        self.assertEqual(moods.status_value(None), None)
+        self.assertEqual(loxtypes.TYPES["Switch"].status_value(0.0), 0.0)
+
+    def test_extract_controls(self):
+        """Test that the registry decides which controls are used."""
+        structure = copy.deepcopy(STRUCTURE)
+        structure["controls"] = {
+            "0c300000": {"name": "Lights", "type": "LightControllerV2",
+                         "uuidAction": "0c300000", "room": "0ceefd17",
+                         "cat": "0c10052e",
+                         "subControls": {
+                             "0c300001": {"name": "Spot", "type": "Dimmer",
+                                          "uuidAction": "0c300001"},
+                             "0c300002": {"name": "Color",
+                                          "type": "ColorPickerV2",
+                                          "uuidAction": "0c300002"}}},
+            "0c400000": {"name": "Old lights", "type": "LightController",
+                         "uuidAction": "0c400000", "room": "0ceefd1d",
+                         "cat": "0c10052e",
+                         "subControls": {
+                             "0c400001": {"name": "Ceiling",
+                                          "type": "Switch",
+                                          "uuidAction": "0c400001"}}},
+            "0c500000": {"name": "Clock", "type": "InfoOnlyAnalog",
+                         "uuidAction": "0c500000", "room": "0ceefd17",
+                         "cat": "0c10052e"}}
+        server = FakeMiniserver(structure)
+        self.addCleanup(server.stop)
+        self.addCleanup(loxsession.close_sessions)
+        self.addCleanup(LoxClient._structure_cache.clear)
+        parameters = {"lx_ip": server.host, "lx_user": server.user,
+                      "lx_password": server.password, "lx_cachedir": "",
+                      "action": "change", "control_name": "Spot",
+                      "newstate": "50"}
+        loxone_test = Loxscontrol(**parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(server.commands, ["dev/sps/io/0c300001/50"])
+
+        # subcontrols are in the room of their control
+        client = loxone_test.client
+        self.assertEqual(client.get_type_by_uuid("0c300000"),
+                         "LightControllerV2")
+        self.assertEqual(client.get_type_by_uuid("0c400001"), "Switch")
+        self.assertEqual(
+            client.get_controluuids_by_room_and_type("Living room", None),
+            ["0c400001"])
+        for uuid in ("0c300002", "0c400000", "0c500000"):
+            self.assertTrue(client.get_type_by_uuid(uuid) is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""TestCase for the websocket transport."""
+import collections
+import json
+import threading
+import unittest
+from concurrent.futures import Future
+
+import loxsession
+import loxwebsocket
+from loxclient import LoxClient
+from loxscontrol import Loxscontrol
+from fakeminiserver import FakeMiniserver
+
+
+class TestLoxWebSocket(unittest.TestCase):
+
+    """Unittest TestCase for the websocket transport."""
+
+    def setUp(self):
+        """Start a fake miniserver."""
+        LoxClient._structure_cache.clear()
+        self.server = FakeMiniserver()
+        self.parameters = {
+            "lx_ip": self.server.host,
+            "lx_user": self.server.user,
+            "lx_password": self.server.password,
+            "lx_cachedir": "",
+            "lx_transport": LoxClient.TRANSPORT_WEBSOCKET,
+            "action": "change",
+            "control_name": "Kitchen light",
+            "newstate": "on"
+        }
+
+    def tearDown(self):
+        """Stop the fake miniserver."""
+        loxwebsocket.close_connections()
+        loxsession.close_sessions()
+        LoxClient._structure_cache.clear()
+        self.server.stop()
+
+    def test_change(self):
+        """Test commands are sent over one websocket connection."""
+        for newstate in ["on", "off", "on"]:
+            self.parameters["newstate"] = newstate
+            loxone_test = Loxscontrol(**self.parameters)
+            self.assertEqual(loxone_test.status_code, "Complete")
+
+        self.assertEqual(self.server.commands,
+                         ["dev/sps/io/0c119829/on",
+                          "dev/sps/io/0c119829/off",
+                          "dev/sps/io/0c119829/on"])
+        self.assertEqual(self.server.ws_connections, 1)
+        # only the structure was requested by http
+        self.assertFalse([r for r in self.server.requests
+                          if r.startswith("/dev/sps/io/")])
+
+    def test_multiplexing(self):
+        """Test concurrent commands get their own responses."""
+        connection = loxwebsocket.get_connection(
+            self.server.host, self.server.user, self.server.password, 5)
+        results = {}
+
+        def send(value):
+            results[value] = connection.command(
+                "jdev/sps/io/0c119829/%d" % value)['value']
+
+        threads = [threading.Thread(target=send, args=(value,))
+                   for value in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, dict((value, str(value))
+                                       for value in range(20)))
+        self.assertEqual(self.server.ws_connections, 1)
+
+    def test_late_response(self):
+        """Test a response nobody waits for is not handed to another."""
+        connection = loxwebsocket.LoxWebSocket(
+            self.server.host, self.server.user, self.server.password, 5)
+        future = Future()
+        connection._pending["dev/sps/io/0c119829/on"] = \
+            collections.deque([future])
+        connection._dispatch(json.dumps(
+            {"LL": {"control": "dev/sps/io/0c11982a/off", "value": "off",
+                    "Code": "200"}}))
+        self.assertFalse(future.done())
+        connection._dispatch(json.dumps(
+            {"LL": {"control": "dev/sps/io/0c119829/on", "value": "on",
+                    "Code": "200"}}))
+        self.assertEqual(future.result(0)['value'], "on")
+        self.assertFalse(connection._pending)
+
+    def test_reconnect(self):
+        """Test a lost connection is opened again."""
+        Loxscontrol(**self.parameters)
+        self.server.close_websockets()
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(len(self.server.commands), 2)
+
+    def test_fallback(self):
+        """Test commands are sent by http if the websocket fails."""
+        self.server.websocket = False
+        loxone_test = Loxscontrol(**self.parameters)
+        self.assertEqual(loxone_test.status_code, "Complete")
+        self.assertEqual(self.server.commands, ["dev/sps/io/0c119829/on"])
+        self.assertTrue("/dev/sps/io/0c119829/on" in self.server.requests)
+
+    def test_authentication_failed(self):
+        """Test a wrong password fails the websocket connection."""
+        with self.assertRaises(loxwebsocket.LoxWebSocketError):
+            loxwebsocket.get_connection(self.server.host, self.server.user,
+                                        "wrong", 5)
+        # don't retry immediately
+        with self.assertRaises(loxwebsocket.LoxWebSocketError):
+            loxwebsocket.get_connection(self.server.host, self.server.user,
+                                        "wrong", 5)
+        self.assertEqual(self.server.ws_connections, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()